@@ -0,0 +1,124 @@
+"""
+benchmarks/bench_allocations.py
+Memory allocated per frame on the laptop's receive -> analyze path, measured
+with tracemalloc, with and without the frame buffer pool (shared/buffers.py).
+Binary payloads go through the same calls as in laptop.main, per stage:
+    receive   receiver.handle_message (decode, dedupe, queue) and the queue get
+    process   process_lidar_data + process_gpr_data (in place on pooled traces)
+    detect    obstacle and anomaly region detection (its output lists are new objects)
+After a warm-up each stage's figure is the median number of bytes allocated
+above the pre-stage level (the tracemalloc peak); "retained" is the growth of
+traced memory over the run per frame. Exits with status 1 when the pooled
+receive + process + detect medians exceed the budget.
+Run from the software/ directory:
+    python -m benchmarks.bench_allocations --frames 500 --budget 16384
+"""
+import sys
+import time
+import logging
+import argparse
+import tracemalloc
+from statistics import median
+import numpy as np
+from laptop import config
+from shared.buffers import FramePool
+from shared.message_protocol import create_payload
+from rpi import config as rpi_config
+
+# Median bytes the pooled receive, process and detect stages may allocate per
+# frame together (four 512-sample float64 GPR traces; one trace is 4096 bytes).
+# scipy.signal.sosfilt returns a new padded trace per filter pass, which is
+# most of the process stage.
+ALLOCATION_BUDGET = 16384
+
+STAGES = ("receive", "process", "detect")
+
+
+def make_payloads(count, lidar_length=360, gpr_length=512, seed=0):
+    rng = np.random.default_rng(seed)
+    now = time.time()
+    return [create_payload({"lidar": rng.uniform(2, 40, lidar_length), "gpr": rng.standard_normal(gpr_length)},
+                           timestamp=now + i * 0.05, seq=i, fmt="binary", delta=rpi_config.DELTA_ENCODING)
+            for i in range(count)]
+
+
+def _allocated(fn, *args, **kwargs):
+    """(result, bytes allocated above the starting level while fn ran)."""
+    before, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    result = fn(*args, **kwargs)
+    return result, tracemalloc.get_traced_memory()[1] - before
+
+
+def measure(payloads, pooled, warmup=50):
+    """Median bytes allocated per frame and stage, and bytes retained per frame."""
+    from laptop import receiver
+    from laptop.fleet import Fleet
+    from laptop.receiver import DuplicateFilter
+    from laptop.lidar_processing import process_lidar_data, detect_obstacles
+    from laptop.gpr_processing import process_gpr_data, detect_anomalies
+
+    pool = FramePool(config.FRAME_POOL_BUFFERS, config.FRAME_POOL_SAMPLES) if pooled else None
+    fleet = Fleet()
+    shared_data = {"latest_data": None, "fleet": fleet, "pool": pool, "queue": fleet.queue}
+    drone = fleet.drone()
+    drone.duplicates = DuplicateFilter(window=16)  # reaches its steady size during the warm-up
+
+    def receive(raw):
+        receiver.handle_message(raw, shared_data, drone)
+        return fleet.queue.get(timeout=1)
+
+    def process(frame):
+        gpr_raw = frame["gpr"]
+        out = gpr_raw if pool is not None and pool.owns(gpr_raw) else None
+        return process_lidar_data(frame["lidar"]), process_gpr_data(gpr_raw, out=out)
+
+    def detect(lidar_points, gpr_data):
+        return (detect_obstacles(lidar_points, threshold=0.5, regions=True, max_regions=config.MAX_DETECTION_REGIONS),
+                detect_anomalies(gpr_data, threshold=0.8, regions=True, max_regions=config.MAX_DETECTION_REGIONS))
+
+    for raw in payloads[:warmup]:
+        detect(*process(receive(raw)))
+    allocated = {stage: [] for stage in STAGES}
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    for raw in payloads[warmup:]:
+        frame, size = _allocated(receive, raw)
+        allocated["receive"].append(size)
+        processed, size = _allocated(process, frame)
+        allocated["process"].append(size)
+        _, size = _allocated(detect, *processed)
+        allocated["detect"].append(size)
+        del frame, processed
+    end, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    row = {stage: median(sizes) for stage, sizes in allocated.items()}
+    row["retained"] = (end - start) / (len(payloads) - warmup)
+    row["pool"] = pool.stats() if pool is not None else None
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description="tracemalloc allocations per received frame")
+    parser.add_argument("--frames", type=int, default=500, help="Frames measured after the warm-up")
+    parser.add_argument("--budget", type=int, default=ALLOCATION_BUDGET,
+                        help="Median bytes the pooled receive + process + detect stages may allocate")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    from laptop.gpr_processing import preload
+    preload(background=False)
+    payloads = make_payloads(args.frames + 50)
+    results = {"fresh": measure(payloads, pooled=False), "pooled": measure(payloads, pooled=True)}
+    print(f"{'decode':>7} {'receive B':>10} {'process B':>10} {'detect B':>9} {'retained B':>11}")
+    for name, row in results.items():
+        print(f"{name:>7} {row['receive']:>10.0f} {row['process']:>10.0f} {row['detect']:>9.0f} "
+              f"{row['retained']:>11.1f}")
+    print(f"pool: {results['pooled']['pool']}")
+    if sum(results["pooled"][stage] for stage in STAGES) > args.budget:
+        print("Allocation budget exceeded")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
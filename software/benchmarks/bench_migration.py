@@ -0,0 +1,109 @@
+"""
+benchmarks/bench_migration.py
+Throughput of GPR imaging (laptop.gpr_imaging) versus image window size on a
+synthetic survey line: point diffractors (hyperbolas) under noise.
+    push        incremental migration only (RollingMigration.push)
+    +detect     push plus detection on the window every GPR_IMAGE_DETECT_EVERY traces
+    recompute   re-migrating the whole window from the raw traces before each
+                detection, as a non-incremental implementation would
+Push cost should not depend on the window; the detection pass does. Also
+reports how many frames a per-trace threshold (detect_anomalies on the
+filtered trace, as in laptop.main) and the image detector flag, against the
+number of buried targets.
+Run from the software/ directory:
+    python -m benchmarks.bench_migration --traces 2048 --samples 512
+"""
+import time
+import argparse
+import numpy as np
+from laptop import config
+from laptop.gpr_processing import process_gpr_data, detect_anomalies, detect_anomalies_2d
+from laptop.gpr_imaging import RollingMigration, migrate, trace_step
+
+WINDOWS = (32, 64, 128, 256, 512)
+
+
+def make_survey(n_traces, n_samples, targets=8, amplitude=3.0, noise=0.2, seed=0):
+    """B-scan (traces x samples) with `targets` point diffractors; returns (bscan, [(trace, sample)])."""
+    rng = np.random.default_rng(seed)
+    step = trace_step()
+    bscan = rng.normal(scale=noise, size=(n_traces, n_samples))
+    samples = np.arange(n_samples)
+    columns = np.arange(n_traces)[:, None]
+    period = config.GPR_FS / 300.0  # 300 Hz wavelet, inside the GPR band
+    positions = np.linspace(0, n_traces, targets + 2)[1:-1].astype(int)
+    depths = rng.integers(n_samples // 8, n_samples // 2, size=targets)
+    for trace, depth in zip(positions, depths):
+        arrival = np.sqrt(depth ** 2 + ((columns - trace) * step) ** 2)
+        offset = samples - arrival
+        bscan += amplitude * np.sin(2 * np.pi * offset / period) * np.exp(-0.5 * (offset / 4) ** 2)
+    return bscan, list(zip(positions.tolist(), depths.tolist()))
+
+
+def run_incremental(traces, window, detect_every):
+    """Traces/s for push only and push + detect."""
+    imager = RollingMigration(window=window)
+    started = time.perf_counter()
+    for trace in traces:
+        imager.push(trace)
+    push = len(traces) / (time.perf_counter() - started)
+    imager = RollingMigration(window=window)
+    started = time.perf_counter()
+    for trace in traces:
+        imager.push(trace)
+        if imager.traces % detect_every == 0:
+            imager.detect()
+    return push, len(traces) / (time.perf_counter() - started)
+
+
+def run_recompute(traces, window, detect_every):
+    """Traces/s re-migrating the last `window` traces before each detection."""
+    background = traces - np.mean(traces, axis=0)
+    started = time.perf_counter()
+    for end in range(detect_every, len(traces) + 1, detect_every):
+        image = migrate(background[max(0, end - window):end], config.GPR_MIGRATION_APERTURE)
+        noise = np.median(np.abs(image).mean(axis=1)) / np.sqrt(2 / np.pi)
+        detect_anomalies_2d(np.abs(image) / noise, threshold=config.GPR_IMAGE_THRESHOLD,
+                            max_regions=config.MAX_DETECTION_REGIONS)
+    return len(traces) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GPR migration throughput versus window size")
+    parser.add_argument("--traces", type=int, default=2048, help="Traces in the synthetic survey")
+    parser.add_argument("--samples", type=int, default=512, help="Samples per trace")
+    parser.add_argument("--targets", type=int, default=8, help="Buried point targets")
+    args = parser.parse_args()
+
+    bscan, targets = make_survey(args.traces, args.samples, args.targets)
+    filtered = np.array([process_gpr_data(trace) for trace in bscan])
+    check = RollingMigration(window=args.traces, background=0)
+    for trace in filtered:
+        check.push(trace)
+    assert np.allclose(check.image(), migrate(filtered)[:args.traces - config.GPR_MIGRATION_APERTURE])
+
+    detect_every = config.GPR_IMAGE_DETECT_EVERY
+    print(f"aperture {config.GPR_MIGRATION_APERTURE} traces each side, {args.samples} samples/trace, "
+          f"detection every {detect_every} traces")
+    print(f"{'window':>7} {'push tr/s':>10} {'+detect tr/s':>13} {'recompute tr/s':>15} {'speedup':>8}")
+    for window in WINDOWS:
+        push, detect = run_incremental(filtered, window, detect_every)
+        recompute = run_recompute(filtered, window, detect_every)
+        print(f"{window:>7} {push:>10.0f} {detect:>13.0f} {recompute:>15.0f} {detect / recompute:>7.1f}x")
+
+    trace_flags = sum(bool(detect_anomalies(trace, threshold=0.8, regions=True)) for trace in filtered)
+    imager = RollingMigration()
+    found = []
+    for i, trace in enumerate(filtered):
+        imager.push(trace, tag=i)
+        if imager.traces % detect_every == 0:
+            found += [(anomaly["tag"], anomaly["peak"][1]) for anomaly in imager.detect()]
+    merge = int(config.ANOMALY_MERGE_RADIUS / config.GPR_TRACE_SPACING)
+    hits = sum(any(abs(trace - t) <= merge and abs(sample - s) <= config.ANOMALY_MERGE_DEPTH
+                   for trace, sample in found) for t, s in targets)
+    print(f"targets {len(targets)}: per-trace threshold flags {trace_flags}/{len(filtered)} traces; "
+          f"image detections {len(found)}, targets found {hits}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+benchmarks/bench_parsing.py
+Micro-benchmark: legacy per-value list-comprehension parsing versus
+shared.utils.parse_sensor_values at 1k/10k/100k samples, with binary frame
+decoding (shared.message_protocol) shown for reference.
+Run from the software/ directory:
+    python -m benchmarks.bench_parsing
+"""
+import timeit
+import numpy as np
+from shared.utils import parse_sensor_values
+from shared.message_protocol import encode_frame, decode_frames
+
+SIZES = (1_000, 10_000, 100_000)
+
+
+def legacy_parse(raw):
+    """The parser previously used in lidar_processing/gpr_processing."""
+    str_values = raw.split(',')
+    return np.array([float(val.strip()) for val in str_values if val.strip() != ""])
+
+
+def make_trace(n, malformed=0, seed=0):
+    rng = np.random.default_rng(seed)
+    tokens = [f"{val:.6f}" for val in rng.standard_normal(n)]
+    for i in rng.choice(n, size=malformed, replace=False):
+        tokens[i] = "ERR"
+    return ",".join(tokens)
+
+
+def best_of(fn, arg, repeat=5):
+    timer = timeit.Timer(lambda: fn(arg))
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def main():
+    print(f"{'samples':>8} {'legacy ms':>10} {'fast ms':>9} {'speedup':>8} {'1% bad ms':>10} {'frame ms':>9}")
+    for n in SIZES:
+        raw = make_trace(n)
+        assert np.array_equal(legacy_parse(raw), parse_sensor_values(raw)[0])
+        legacy = best_of(legacy_parse, raw)
+        fast = best_of(lambda r: parse_sensor_values(r)[0], raw)
+        dirty = best_of(lambda r: parse_sensor_values(r)[0], make_trace(n, malformed=n // 100))
+        frame = best_of(decode_frames, encode_frame("gpr", parse_sensor_values(raw)[0]))
+        print(f"{n:>8} {legacy * 1e3:>10.3f} {fast * 1e3:>9.3f} {legacy / fast:>7.1f}x "
+              f"{dirty * 1e3:>10.3f} {frame * 1e3:>9.4f}")
+
+
+if __name__ == "__main__":
+    main()
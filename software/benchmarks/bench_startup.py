@@ -0,0 +1,165 @@
+"""
+benchmarks/bench_startup.py
+Cold-start benchmark of the two entry points.
+Each measurement runs in a fresh interpreter, timed from just before the
+process is spawned:
+    pi      import rpi.main -> first frame from the (already streaming) fake
+            sensors delivered to a subscriber by the BatchingPublisher
+    laptop  import laptop.main -> first decision for a received frame
+The drone session is started during the Pi run, as in rpi.main, so pymavlink
+is loaded concurrently with the first frame. The report also lists which
+heavy modules were already imported when the entry point finished loading
+(they should be loaded lazily). Exits with status 1 when the median time to
+first publish or first decision exceeds its budget; budgets are wall-clock
+seconds on the machine running the benchmark.
+
+Run from the software/ directory:
+    python -m benchmarks.bench_startup --runs 5 --budget-pi 1.5 --budget-laptop 2.5
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from statistics import median
+
+# Seconds from spawn to the first publish (pi) / first decision (laptop)
+STARTUP_BUDGETS = {"pi": 1.5, "laptop": 2.5}
+
+# Modules that must not be imported just by loading an entry point
+LAZY_MODULES = ("scipy.signal", "scipy.ndimage", "pymavlink.mavutil")
+
+
+def _eager(modules=LAZY_MODULES):
+    return [name for name in modules if name in sys.modules]
+
+
+def _pi_child(spawned, lidar_port, gpr_port):
+    import rpi.main as pi_main
+    imported = time.time()
+    eager = _eager()
+    from rpi.gpr import GprReader
+    from rpi.lidar import LidarReader
+    from rpi.sensor_stream import SensorStream
+    from rpi.sync import SampleSynchronizer
+    from rpi.publisher import BatchingPublisher
+    from benchmarks.fake_broker import FakeBroker
+    from benchmarks.mavlink_sink import free_udp_port
+    import threading
+
+    pi_main.drone_session.connection_str = f"udpin:127.0.0.1:{free_udp_port()}"
+    pi_main.drone_session.start()
+    broker = FakeBroker()
+    received = threading.Event()
+    laptop = broker.client("laptop")
+    laptop.connect()
+    laptop.subscribe(pi_main.config.MQTT_DATA_TOPIC)
+    laptop.on_message = lambda client, userdata, message: received.set()
+    laptop.loop_start()
+    pi_client = broker.client("pi")
+    pi_client.connect()
+    pi_client.loop_start()
+    publisher = BatchingPublisher(pi_client).start()
+    streams = (SensorStream("LiDAR", lambda: LidarReader(port=lidar_port)),
+               SensorStream("GPR", lambda: GprReader(port=gpr_port)))
+    synchronizer = SampleSynchronizer().attach(*streams)
+    for stream in streams:
+        stream.start()
+    pair = None
+    while pair is None:
+        pair = synchronizer.get(timeout=1)
+    timestamps = {sensor: sample.timestamp for sensor, sample in zip(("lidar", "gpr"), pair) if sample}
+    readings = {sensor: sample.data if sample else "" for sensor, sample in zip(("lidar", "gpr"), pair)}
+    payload = pi_main.create_payload(readings, timestamp=min(timestamps.values()), seq=0, timestamps=timestamps,
+                                     fmt=pi_main.config.MESSAGE_FORMAT, delta=pi_main.config.DELTA_ENCODING,
+                                     pose=pi_main.telemetry.pose())
+    publisher.publish(payload)
+    received.wait(10)
+    done = time.time()
+    return {"import": imported - spawned, "first": done - spawned, "eager": eager}
+
+
+def _laptop_child(spawned):
+    import laptop.main as laptop_main
+    imported = time.time()
+    eager = _eager()
+    from laptop import receiver
+    from laptop.gpr_processing import preload
+    from shared.message_protocol import create_payload
+    import numpy as np
+
+    preload()  # as laptop.main.main() does
+    laptop_main.shared_data["queue"] = laptop_main.fleet.queue
+    rng = np.random.default_rng(0)
+    raw = create_payload({"lidar": rng.uniform(2, 40, 360), "gpr": rng.standard_normal(512)},
+                         timestamp=time.time(), seq=0, fmt="binary")
+    receiver.handle_message(raw, laptop_main.shared_data)
+    frame = laptop_main.fleet.queue.get(timeout=5)
+    laptop_main.decide(frame)
+    done = time.time()
+    return {"import": imported - spawned, "first": done - spawned, "eager": eager}
+
+
+def run_child(kind, *args):
+    """Spawn one cold interpreter and return its measurements."""
+    spawned = time.time()
+    result = subprocess.run([sys.executable, "-m", "benchmarks.bench_startup", "--child", kind, str(spawned),
+                             *args], capture_output=True, text=True, timeout=60,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not lines:
+        raise RuntimeError(f"{kind} startup run failed:\n{result.stderr}")
+    return json.loads(lines[-1])
+
+
+def measure(runs=5):
+    """Median import and first-frame times per entry point."""
+    from benchmarks.fake_serial import FakeSerialDevice
+    devices = [FakeSerialDevice("lidar", 20.0, 360, seed=1).start(),
+               FakeSerialDevice("gpr", 20.0, 512, seed=2).start()]
+    try:
+        results = {"pi": [run_child("pi", devices[0].port, devices[1].port) for _ in range(runs)],
+                   "laptop": [run_child("laptop") for _ in range(runs)]}
+    finally:
+        for device in devices:
+            device.stop()
+            device.close()
+    return {kind: {"import": median(r["import"] for r in rows), "first": median(r["first"] for r in rows),
+                   "eager": sorted({name for r in rows for name in r["eager"]})}
+            for kind, rows in results.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start import and first-frame latency")
+    parser.add_argument("--runs", type=int, default=5, help="Cold starts per entry point")
+    parser.add_argument("--budget-pi", type=float, default=STARTUP_BUDGETS["pi"],
+                        help="Seconds allowed from spawn to the first publish")
+    parser.add_argument("--budget-laptop", type=float, default=STARTUP_BUDGETS["laptop"],
+                        help="Seconds allowed from spawn to the first decision")
+    parser.add_argument("--child", nargs="+", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        import logging
+        logging.disable(logging.INFO)
+        kind, spawned, *rest = args.child
+        child = _pi_child if kind == "pi" else _laptop_child
+        print(json.dumps(child(float(spawned), *rest)))
+        os._exit(0)  # skip joining the daemon threads
+
+    budgets = {"pi": args.budget_pi, "laptop": args.budget_laptop}
+    report = measure(args.runs)
+    print(f"{'entry':>7} {'import s':>9} {'first s':>8} {'budget s':>9}  eagerly imported")
+    over = False
+    for kind, row in report.items():
+        over |= row["first"] > budgets[kind]
+        print(f"{kind:>7} {row['import']:>9.3f} {row['first']:>8.3f} {budgets[kind]:>9.2f}  "
+              f"{', '.join(row['eager']) or '-'}")
+    if over:
+        print("Startup budget exceeded")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
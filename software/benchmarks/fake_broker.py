@@ -0,0 +1,149 @@
+"""
+benchmarks/fake_broker.py
+In-process stand-in for the MQTT broker.
+FakeClient implements the subset of the paho-mqtt Client API the Pi and the
+laptop use (connect/connect_async, loop_start/loop_forever, subscribe,
+publish, is_connected and the on_connect/on_message/on_publish callbacks), so
+BatchingPublisher, CommandPublisher and receiver.on_message run unchanged.
+Each client delivers its messages from its own thread, like paho's network loop.
+"""
+import queue
+import logging
+import threading
+import paho.mqtt.client as mqtt
+
+logger = logging.getLogger("FakeBroker")
+logger.setLevel(logging.INFO)
+
+
+class FakeMessage:
+    def __init__(self, topic, payload, qos=0, retain=False):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+
+
+class FakeMessageInfo:
+    def __init__(self, mid, rc=mqtt.MQTT_ERR_SUCCESS):
+        self.mid = mid
+        self.rc = rc
+
+    def wait_for_publish(self, timeout=None):
+        pass
+
+    def is_published(self):
+        return self.rc == mqtt.MQTT_ERR_SUCCESS
+
+
+class FakeBroker:
+    """Routes published messages to the inboxes of subscribed FakeClients."""
+
+    def __init__(self):
+        self._clients = []
+        self._lock = threading.Lock()
+        self.routed = 0
+
+    def client(self, client_id="", userdata=None):
+        client = FakeClient(self, client_id, userdata)
+        with self._lock:
+            self._clients.append(client)
+        return client
+
+    def route(self, topic, payload, qos):
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            if client.matches(topic):
+                client.deliver(FakeMessage(topic, payload, qos))
+        self.routed += 1
+
+
+class FakeClient:
+    """paho-mqtt Client look-alike bound to a FakeBroker."""
+
+    def __init__(self, broker, client_id="", userdata=None):
+        self.broker = broker
+        self.client_id = client_id
+        self._userdata = userdata
+        self._subscriptions = []
+        self._inbox = queue.Queue()
+        self._thread = None
+        self._connected = False
+        self._mid = 0
+        self._lock = threading.Lock()
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_message = None
+        self.on_publish = None
+
+    def user_data_set(self, userdata):
+        self._userdata = userdata
+
+    def reconnect_delay_set(self, min_delay=1, max_delay=120):
+        pass
+
+    def connect(self, host="localhost", port=1883, keepalive=60):
+        self._connected = True
+        if self.on_connect:
+            self.on_connect(self, self._userdata, {}, 0)
+        return mqtt.MQTT_ERR_SUCCESS
+
+    connect_async = connect
+
+    def disconnect(self):
+        if self._connected:
+            self._connected = False
+            self._inbox.put(None)
+            if self.on_disconnect:
+                self.on_disconnect(self, self._userdata, 0)
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def is_connected(self):
+        return self._connected
+
+    def subscribe(self, topic, qos=0):
+        self._subscriptions.append(topic)
+        return mqtt.MQTT_ERR_SUCCESS, 0
+
+    def matches(self, topic):
+        return any(mqtt.topic_matches_sub(sub, topic) for sub in self._subscriptions)
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        with self._lock:
+            self._mid += 1
+            mid = self._mid
+        if not self._connected:
+            return FakeMessageInfo(mid, mqtt.MQTT_ERR_NO_CONN)
+        if isinstance(payload, str):
+            payload = payload.encode()
+        self.broker.route(topic, bytes(payload or b""), qos)
+        if self.on_publish:
+            self.on_publish(self, self._userdata, mid)
+        return FakeMessageInfo(mid)
+
+    def deliver(self, message):
+        self._inbox.put(message)
+
+    def loop_start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.loop_forever, name=f"fake-mqtt-{self.client_id}",
+                                            daemon=True)
+            self._thread.start()
+
+    def loop_stop(self):
+        self._inbox.put(None)
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def loop_forever(self):
+        while True:
+            message = self._inbox.get()
+            if message is None:
+                return
+            if self.on_message:
+                try:
+                    self.on_message(self, self._userdata, message)
+                except Exception as e:
+                    logger.error(f"Error in on_message of {self.client_id}: {e}")
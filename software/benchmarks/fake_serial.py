@@ -0,0 +1,117 @@
+"""
+benchmarks/fake_serial.py
+Pseudo-terminal stand-ins for the LiDAR and GPR serial sensors.
+Each device owns a pty pair and writes comma-separated traces to the master
+side at a fixed line rate; LidarReader/GprReader open the slave side by name
+exactly as they would open /dev/ttyUSB0.
+"""
+import os
+import tty
+import time
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger("FakeSerial")
+logger.setLevel(logging.INFO)
+
+
+def lidar_trace(rng, length):
+    """Ranges in metres with a few close returns."""
+    ranges = rng.uniform(2.0, 40.0, length)
+    ranges[rng.integers(0, length, size=max(1, length // 50))] = rng.uniform(0.1, 1.0)
+    return ranges
+
+
+def gpr_trace(rng, length):
+    """Noisy GPR trace with an occasional buried reflector."""
+    t = np.arange(length)
+    trace = 0.05 * rng.standard_normal(length) + 0.2 * np.sin(2 * np.pi * t / 16)
+    if rng.random() < 0.1:
+        centre = rng.integers(length // 4, length)
+        trace += np.exp(-0.5 * ((t - centre) / 3.0) ** 2) * np.sin(2 * np.pi * t / 8)
+    return trace
+
+
+GENERATORS = {"lidar": lidar_trace, "gpr": gpr_trace}
+
+
+class FakeSerialDevice:
+    """
+    Writes `rate` lines per second of `trace_length` values to a pty.
+    kind: "lidar" or "gpr" (selects the synthetic trace generator).
+    port: path of the slave side, to pass as LidarReader(port=...).
+    The write time of every line is kept until pop_write_time() claims it, so
+    a benchmark can measure serial-read latency per line.
+    """
+
+    def __init__(self, kind="lidar", rate=20.0, trace_length=360, seed=0):
+        self.kind = kind
+        self.rate = rate
+        self.trace_length = trace_length
+        self._generate = GENERATORS[kind]
+        self._rng = np.random.default_rng(seed)
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)  # no echo, no canonical line-length limit
+        os.set_blocking(self._master, False)  # a stalled reader must not block stop()
+        self.port = os.ttyname(self._slave)
+        self._write_times = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.lines_written = 0
+
+    def start(self):
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name=f"fake-{self.kind}", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        self.stop()
+        os.close(self._master)
+        os.close(self._slave)
+
+    def pop_write_time(self, line):
+        """Return (and forget) the time.time() at which `line` was written, or None."""
+        with self._lock:
+            return self._write_times.pop(line, None)
+
+    def _run(self):
+        interval = 1.0 / self.rate
+        next_line = time.monotonic()
+        while not self._stop_event.is_set():
+            line = ",".join(f"{value:.4f}" for value in self._generate(self._rng, self.trace_length))
+            with self._lock:
+                self._write_times[line] = time.time()
+                # Lines nobody read (e.g. flushed when the port was opened) must not pile up
+                if len(self._write_times) > 10 * self.rate:
+                    self._write_times.pop(next(iter(self._write_times)))
+            data = (line + "\n").encode()
+            while data and not self._stop_event.is_set():
+                try:
+                    data = data[os.write(self._master, data):]
+                except BlockingIOError:
+                    self._stop_event.wait(0.001)  # pty buffer full: reader is behind
+                except OSError as e:
+                    logger.error(f"Fake {self.kind} write failed: {e}")
+                    return
+            self.lines_written += 1
+            next_line += interval
+            self._stop_event.wait(max(0.0, next_line - time.monotonic()))
+
+
+if __name__ == "__main__":
+    import serial
+    device = FakeSerialDevice("gpr", rate=5, trace_length=8).start()
+    with serial.Serial(device.port, timeout=1) as port:
+        for _ in range(3):
+            print(port.readline().decode().strip())
+    device.close()
@@ -0,0 +1,292 @@
+"""
+benchmarks/harness.py
+End-to-end benchmark of the Pi -> laptop -> Pi loop without hardware or network.
+Fake pty sensors feed the real LidarReader/GprReader, SensorStream,
+SampleSynchronizer and BatchingPublisher, and each pair is encoded by
+rpi.main.frame_payload (rate control, decimation, pose) as on the Pi. An
+in-process broker carries the frames to laptop.receiver.handle_message
+(pooled decode, per-drone dedupe, fleet queue) and analysis workers running
+laptop.main.decide (fleet state, filtering, detection, imaging, terrain map
+and anomaly index), and the commands back to a DroneSession talking to a
+scripted MAVLink sink on localhost. Laptop stage timers (laptop.main) are
+reported as well.
+
+Stages (latency = time between the two points, duration = time spent in the call):
+    serial   line written to the pty -> line read by the sensor stream
+    publish  sensor capture -> frame handed to the publisher (sync + encode)
+    receive  frame handed to the publisher -> laptop on_message (batching + broker)
+    parse    laptop.receiver.handle_message (parse, dedupe, queue)
+    decide   laptop.main.decide (breakdown in the "laptop stages" line)
+    command  command published on the laptop -> MAVLink message at the autopilot
+
+Run from the software/ directory:
+    python -m benchmarks.harness --duration 10 --rate 20 --gpr-length 1024
+"""
+import json
+import time
+import argparse
+import logging
+import threading
+from collections import deque
+from laptop import config as laptop_config
+from laptop import main as laptop_main
+from laptop import receiver
+from laptop.pipeline import AnalysisPipeline
+from laptop.drone_commands import CommandPublisher
+from laptop.gpr_processing import preload
+from rpi import config as rpi_config
+from rpi.main import frame_payload
+from rpi.lidar import LidarReader
+from rpi.gpr import GprReader
+from rpi.sensor_stream import SensorStream
+from rpi.sync import SampleSynchronizer
+from rpi.publisher import BatchingPublisher
+from rpi.drone_control import DroneSession
+from rpi.telemetry import TelemetryCache
+from rpi.rate_control import RateController
+from shared.message_protocol import unpack_messages
+from shared import metrics
+from benchmarks.fake_serial import FakeSerialDevice
+from benchmarks.fake_broker import FakeBroker
+from benchmarks.mavlink_sink import MavlinkSink, free_udp_port
+
+STAGES = ("serial", "publish", "receive", "parse", "decide", "command")
+
+
+class StageStats:
+    """Thread-safe per-stage sample collector."""
+
+    def __init__(self, window=100_000):
+        self._samples = {stage: deque(maxlen=window) for stage in STAGES}
+        self._counts = dict.fromkeys(STAGES, 0)
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self._samples[stage].append(seconds)
+            self._counts[stage] += 1
+
+    def report(self, elapsed):
+        rows = []
+        with self._lock:
+            for stage in STAGES:
+                ordered = sorted(self._samples[stage])
+                count = self._counts[stage]
+                if ordered:
+                    p50 = ordered[len(ordered) // 2]
+                    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+                else:
+                    p50 = p99 = float("nan")
+                rows.append({"stage": stage, "count": count, "per_sec": count / elapsed,
+                             "p50_ms": p50 * 1e3, "p99_ms": p99 * 1e3})
+        return rows
+
+
+class Harness:
+    """Wires the fake devices, broker and sink to the real Pi and laptop code."""
+
+    def __init__(self, rate=20.0, lidar_length=360, gpr_length=512, fmt=rpi_config.MESSAGE_FORMAT,
+                 codec=rpi_config.BATCH_CODEC, workers=1):
+        self.stats = StageStats()
+        self.fmt = fmt
+        self.devices = {
+            "lidar": FakeSerialDevice("lidar", rate, lidar_length, seed=1),
+            "gpr": FakeSerialDevice("gpr", rate, gpr_length, seed=2),
+        }
+        self.streams = {
+            "lidar": SensorStream("LiDAR", lambda: LidarReader(port=self.devices["lidar"].port)),
+            "gpr": SensorStream("GPR", lambda: GprReader(port=self.devices["gpr"].port)),
+        }
+        for sensor, stream in self.streams.items():
+            stream.subscribe(lambda sample, sensor=sensor: self._on_sample(sensor, sample))
+        self.synchronizer = SampleSynchronizer().attach(self.streams["lidar"], self.streams["gpr"])
+
+        self.broker = FakeBroker()
+        self.pi_client = self.broker.client("pi")
+        self.pi_client.connect()
+        self.pi_client.subscribe(rpi_config.MQTT_COMMAND_TOPIC)
+        self.pi_client.on_message = self._on_command
+        self.laptop_client = self.broker.client("laptop")
+        self.laptop_client.connect()
+        self.laptop_client.subscribe(laptop_config.MQTT_DATA_TOPIC)
+        self.laptop_client.on_message = self._on_data
+        self.publisher = BatchingPublisher(self.pi_client, codec=codec)
+        self.rate_controller = RateController(self.publisher)
+        # Coalescing would hide most commands from the command stage
+        self.commands = CommandPublisher(client=self.broker.client("laptop-commands"), coalesce_window=0)
+        # Receiver state as laptop.main wires it: frames are decoded into its
+        # pool (decide() filters them in place) and queued per drone on the fleet
+        self.pipeline = AnalysisPipeline(self._analyze, workers=workers, queue=laptop_main.fleet.queue)
+        self.userdata = {"latest_data": None, "fleet": laptop_main.fleet, "pool": laptop_main.frame_pool,
+                         "queue": self.pipeline.queue}
+
+        self.mavlink_port = free_udp_port()
+        self.sink = MavlinkSink(self.mavlink_port, on_message=self._on_mavlink,
+                                telemetry_rate=rpi_config.TELEMETRY_RATE_HZ)
+        self.session = DroneSession(f"udpin:127.0.0.1:{self.mavlink_port}")
+        self.telemetry = TelemetryCache().attach(self.session)
+        self._published = {}  # frame seq -> publish time
+        self._command_sent_at = {}  # command id -> publish time on the laptop
+        self._commands_sent = deque()  # send times of commands that reach the autopilot, in order
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._command_id = 0
+
+    def _on_sample(self, sensor, sample):
+        written = self.devices[sensor].pop_write_time(sample.data)
+        if written is not None:
+            self.stats.add("serial", sample.timestamp - written)
+
+    def _pi_loop(self):
+        """rpi.main.sensor_data_loop without metrics and spool, instrumented."""
+        seq = 0
+        while not self._stop_event.is_set():
+            pair = self.synchronizer.get(timeout=0.5)
+            if pair is None:
+                continue
+            payload, _, timestamps = frame_payload(pair, seq, self.rate_controller, self.telemetry, self.fmt)
+            if payload is None:
+                continue
+            self.stats.add("publish", time.time() - min(timestamps.values()))
+            with self._lock:
+                self._published[seq] = time.perf_counter()
+            self.publisher.publish(payload)
+            seq += 1
+
+    def _on_data(self, client, userdata, message):
+        """laptop.receiver.on_message, instrumented per frame."""
+        received = time.perf_counter()
+        drone = laptop_main.fleet.from_topic(message.topic)
+        for raw in unpack_messages(message.payload):
+            latest = self.userdata["latest_data"]
+            t0 = time.perf_counter()
+            receiver.handle_message(raw, self.userdata, drone)
+            self.stats.add("parse", time.perf_counter() - t0)
+            payload = self.userdata["latest_data"]
+            if payload is latest:
+                continue  # dropped as a duplicate or failed to parse
+            with self._lock:
+                published = self._published.pop(payload.get("seq"), None)
+            if published is not None:
+                self.stats.add("receive", received - published)
+
+    def _analyze(self, data):
+        t0 = time.perf_counter()
+        decision = dict(laptop_main.decide(data))
+        self.stats.add("decide", time.perf_counter() - t0)
+        with self._lock:
+            self._command_id += 1
+            decision["bench_id"] = self._command_id
+            self._command_sent_at[self._command_id] = time.perf_counter()
+        self.commands.publish(decision)
+        return decision
+
+    def _on_command(self, client, userdata, message):
+        command = json.loads(message.payload.decode())
+        with self._lock:
+            sent = self._command_sent_at.pop(command.pop("bench_id", None), None)
+            # Only "move" produces a MAVLink message without an ack round trip;
+            # the DroneSession executes commands in order, so a FIFO pairs them
+            tracked = command.get("action") == "move"
+            if tracked:
+                self._commands_sent.append(sent)
+        if not self.session.submit(command) and tracked:
+            with self._lock:
+                self._commands_sent.pop()
+
+    def _on_mavlink(self, msg, received_at):
+        if msg.get_type() != "STATUSTEXT":
+            return
+        with self._lock:
+            sent = self._commands_sent.popleft() if self._commands_sent else None
+        if sent is not None:
+            self.stats.add("command", received_at - sent)
+
+    def run(self, duration):
+        """Run the loop for `duration` seconds and return the per-stage report rows."""
+        preload(background=False)  # laptop.main loads SciPy while connecting
+        self.sink.start()
+        if laptop_main.gpr_engine is not None:
+            laptop_main.gpr_engine.start()
+        self.session.start()
+        if not self.session.wait_connected(5):
+            raise RuntimeError("MAVLink sink did not connect")
+        self.pi_client.loop_start()
+        self.laptop_client.loop_start()
+        self.commands.start()
+        self.pipeline.start()
+        self.publisher.start()
+        for stream in self.streams.values():
+            stream.start()
+        for device in self.devices.values():
+            device.start()
+        self._thread = threading.Thread(target=self._pi_loop, name="bench-pi-loop", daemon=True)
+        self._thread.start()
+        started = time.perf_counter()
+        try:
+            time.sleep(duration)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stop()
+        return self.stats.report(elapsed)
+
+    def stop(self):
+        for device in self.devices.values():
+            device.stop()
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+        for stream in self.streams.values():
+            stream.stop(timeout=2)
+        self.publisher.stop()
+        self.pipeline.stop(timeout=2)
+        self.commands.stop()
+        self.session.stop(timeout=2)
+        if laptop_main.gpr_engine is not None:
+            laptop_main.gpr_engine.stop()
+        self.sink.stop()
+        self.pi_client.loop_stop()
+        self.laptop_client.loop_stop()
+        for device in self.devices.values():
+            device.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark with simulated sensors")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to run")
+    parser.add_argument("--rate", type=float, default=20.0, help="Lines per second per sensor")
+    parser.add_argument("--lidar-length", type=int, default=360, help="Values per LiDAR line")
+    parser.add_argument("--gpr-length", type=int, default=512, help="Samples per GPR trace")
+    parser.add_argument("--format", default=rpi_config.MESSAGE_FORMAT, choices=("binary", "json"))
+    parser.add_argument("--codec", default=rpi_config.BATCH_CODEC, choices=("none", "zlib", "lz4"))
+    parser.add_argument("--workers", type=int, default=1, help="Laptop analysis workers")
+    args = parser.parse_args()
+
+    # Per-frame INFO logging would dominate every stage
+    logging.disable(logging.INFO)
+    metrics.enable()
+    harness = Harness(rate=args.rate, lidar_length=args.lidar_length, gpr_length=args.gpr_length,
+                      fmt=args.format, codec=args.codec, workers=args.workers)
+    rows = harness.run(args.duration)
+    print(f"{'stage':>8} {'count':>7} {'per sec':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for row in rows:
+        print(f"{row['stage']:>8} {row['count']:>7} {row['per_sec']:>8.1f} "
+              f"{row['p50_ms']:>8.3f} {row['p99_ms']:>8.3f}")
+    print(f"publisher: {harness.publisher.stats()}")
+    print(f"pipeline:  {harness.pipeline.stats()}")
+    print(f"drone:     {harness.session.stats()}")
+    print(f"rate:      {harness.rate_controller.stats()}")
+    # laptop.main's stage timers (bucketed, so p50/p99 are estimates)
+    summary = metrics.REGISTRY.summary()
+    laptop_stages = []
+    for stage in ("lidar", "gpr", "detect", "imaging", "terrain"):
+        timer = summary.get(f'stage_seconds{{stage="{stage}"}}')
+        if timer is not None:
+            laptop_stages.append(f"{stage} n={timer['count']} p50 {timer['p50'] * 1e3:.3f} ms "
+                                 f"p99 {timer['p99'] * 1e3:.3f} ms")
+    print(f"laptop stages: {'; '.join(laptop_stages)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+benchmarks/mavlink_sink.py
+Scripted MAVLink autopilot stand-in over local UDP.
+It sends heartbeats to a DroneSession listening on udpin:127.0.0.1:<port>,
+optionally streams position/attitude/battery telemetry for a drone flying a
+slow circle, answers COMMAND_LONG with COMMAND_ACK (result and delay
+configurable per command) and records when every message arrived.
+"""
+import math
+import time
+import socket
+import logging
+import threading
+from pymavlink import mavutil
+
+logger = logging.getLogger("MavlinkSink")
+logger.setLevel(logging.INFO)
+
+
+def free_udp_port():
+    """Return a currently unused local UDP port."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class MavlinkSink:
+    """
+    port: UDP port the DroneSession listens on (connection "udpin:127.0.0.1:<port>").
+    ack_results: {MAV_CMD id: MAV_RESULT or None}; None means never acknowledge
+                 (to exercise ack timeouts). Unlisted commands are accepted.
+    ack_delay: seconds before a COMMAND_ACK is sent.
+    on_message: optional callback(msg, received_at) for every received message.
+    telemetry_rate: GLOBAL_POSITION_INT/ATTITUDE/SYS_STATUS messages per second (0 = none).
+    """
+
+    def __init__(self, port, heartbeat_rate=1.0, ack_results=None, ack_delay=0.0, on_message=None,
+                 telemetry_rate=0.0, origin=(47.0, 8.0), altitude=10.0):
+        self.port = port
+        self.heartbeat_rate = heartbeat_rate
+        self.telemetry_rate = telemetry_rate
+        self.origin = origin
+        self.altitude = altitude
+        self.ack_results = ack_results or {}
+        self.ack_delay = ack_delay
+        self.on_message = on_message
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._conn = None
+        self.received = {}  # message type -> count
+
+    def start(self):
+        if self._thread is None:
+            self._conn = mavutil.mavlink_connection(f"udpout:127.0.0.1:{self.port}", source_system=1,
+                                                    source_component=1)
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="mavlink-sink", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _heartbeat(self):
+        self._conn.mav.heartbeat_send(mavutil.mavlink.MAV_TYPE_QUADROTOR,
+                                      mavutil.mavlink.MAV_AUTOPILOT_ARDUPILOTMEGA, 0, 0,
+                                      mavutil.mavlink.MAV_STATE_ACTIVE)
+
+    def _telemetry(self, elapsed):
+        """Position on a 50 m circle flown at 5 m/s, heading along the track."""
+        angle = elapsed * 0.1
+        north, east = 50 * math.sin(angle), 50 * (1 - math.cos(angle))
+        lat = self.origin[0] + math.degrees(north / 6371000.0)
+        lon = self.origin[1] + math.degrees(east / (6371000.0 * math.cos(math.radians(self.origin[0]))))
+        boot_ms = int(elapsed * 1000) & 0xFFFFFFFF
+        self._conn.mav.global_position_int_send(boot_ms, int(lat * 1e7), int(lon * 1e7),
+                                                int((self.altitude + 400) * 1000), int(self.altitude * 1000),
+                                                0, 0, 0, 65535)
+        self._conn.mav.attitude_send(boot_ms, 0.0, 0.0, (angle + math.pi) % (2 * math.pi) - math.pi,
+                                     0.0, 0.0, 0.1)
+        self._conn.mav.sys_status_send(0, 0, 0, 500, 15800, 1200, 80, 0, 0, 0, 0, 0, 0)
+
+    def _ack(self, command, result):
+        self._conn.mav.command_ack_send(command, result)
+
+    def _run(self):
+        interval = 1.0 / self.heartbeat_rate
+        telemetry_interval = 1.0 / self.telemetry_rate if self.telemetry_rate else None
+        started = time.monotonic()
+        next_heartbeat = next_telemetry = 0.0
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            if now >= next_heartbeat:
+                self._heartbeat()
+                next_heartbeat = now + interval
+            if telemetry_interval and now >= next_telemetry:
+                self._telemetry(now - started)
+                next_telemetry = now + telemetry_interval
+            wait = min(interval, telemetry_interval or 0.05, 0.05)
+            msg = self._conn.recv_match(blocking=True, timeout=wait)
+            if msg is None:
+                continue
+            received_at = time.perf_counter()
+            msg_type = msg.get_type()
+            self.received[msg_type] = self.received.get(msg_type, 0) + 1
+            if self.on_message:
+                self.on_message(msg, received_at)
+            if msg_type == "COMMAND_LONG":
+                result = self.ack_results.get(msg.command, mavutil.mavlink.MAV_RESULT_ACCEPTED)
+                if result is None:
+                    continue
+                if self.ack_delay:
+                    threading.Timer(self.ack_delay, self._ack, (msg.command, result)).start()
+                else:
+                    self._ack(msg.command, result)
+
+
+if __name__ == "__main__":
+    from rpi.drone_control import DroneSession
+    from rpi.telemetry import TelemetryCache
+    port = free_udp_port()
+    sink = MavlinkSink(port, heartbeat_rate=5, telemetry_rate=10).start()
+    session = DroneSession(f"udpin:127.0.0.1:{port}")
+    telemetry = TelemetryCache().attach(session)
+    session.start()
+    print("connected:", session.wait_connected(5))
+    session.submit({"action": "takeoff", "altitude": 5})
+    session.submit({"action": "move", "direction": "forward", "speed": 3})
+    time.sleep(1)
+    print(session.stats(), sink.received)
+    print(telemetry.snapshot)
+    session.stop()
+    sink.stop()
@@ -0,0 +1,199 @@
+"""
+laptop/anomaly_index.py
+Georeferenced index of GPR anomalies accumulated over a survey.
+Each detection is tagged with the drone pose and frame time and stored in a
+grid hash keyed by its local east/north cell. Inserts, radius and nearest
+queries touch only the cells around the query point, so their cost depends on
+local density rather than on how many anomalies the survey has collected.
+Repeat detections of the same target (e.g. on a later pass) are merged.
+"""
+import math
+import logging
+import threading
+from laptop import config
+from laptop.terrain_map import LocalFrame
+
+logger = logging.getLogger("AnomalyIndex")
+logger.setLevel(logging.INFO)
+
+
+class Anomaly:
+    """One (possibly merged) GPR anomaly."""
+
+    __slots__ = ("id", "east", "north", "lat", "lon", "sample", "value", "first_seen", "last_seen", "hits")
+
+    def __init__(self, anomaly_id, east, north, lat, lon, sample, value, timestamp):
+        self.id = anomaly_id
+        self.east, self.north = east, north
+        self.lat, self.lon = lat, lon
+        self.sample = sample  # trace sample index of the peak (a proxy for depth)
+        self.value = value
+        self.first_seen = self.last_seen = timestamp
+        self.hits = 1
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return (f"Anomaly(id={self.id}, lat={self.lat:.7f}, lon={self.lon:.7f}, sample={self.sample}, "
+                f"value={self.value:.3f}, hits={self.hits})")
+
+
+class AnomalyIndex:
+    """
+    Grid-hash spatial index of anomalies.
+    cell_size: grid cell side in metres (about the typical query radius works best).
+    merge_radius / merge_depth: a detection within this many metres and trace
+                                samples of an existing anomaly is merged into it.
+    frame: LocalFrame shared with other maps so they agree on the origin.
+    All methods are thread-safe.
+    """
+
+    def __init__(self, cell_size=config.ANOMALY_CELL_SIZE, merge_radius=config.ANOMALY_MERGE_RADIUS,
+                 merge_depth=config.ANOMALY_MERGE_DEPTH, frame=None):
+        self.cell_size = cell_size
+        self.merge_radius = merge_radius
+        self.merge_depth = merge_depth
+        self.frame = frame if frame is not None else LocalFrame()
+        self._cells = {}  # (cx, cy) -> {id: Anomaly}
+        self._anomalies = {}
+        self._bounds = None  # min/max occupied cell (x0, y0, x1, y1)
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self.merged = 0
+
+    def __len__(self):
+        return len(self._anomalies)
+
+    def _cell(self, east, north):
+        return math.floor(east / self.cell_size), math.floor(north / self.cell_size)
+
+    def _near(self, east, north, radius):
+        """Yield (distance, anomaly) for anomalies within `radius` metres."""
+        cx0, cy0 = self._cell(east - radius, north - radius)
+        cx1, cy1 = self._cell(east + radius, north + radius)
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                for anomaly in self._cells.get((cx, cy), {}).values():
+                    distance = math.hypot(anomaly.east - east, anomaly.north - north)
+                    if distance <= radius:
+                        yield distance, anomaly
+
+    def _extend_bounds(self, cell):
+        if self._bounds is None:
+            self._bounds = (cell[0], cell[1], cell[0], cell[1])
+        else:
+            x0, y0, x1, y1 = self._bounds
+            self._bounds = (min(x0, cell[0]), min(y0, cell[1]), max(x1, cell[0]), max(y1, cell[1]))
+
+    def _move(self, anomaly, east, north):
+        old, new = self._cell(anomaly.east, anomaly.north), self._cell(east, north)
+        anomaly.east, anomaly.north = east, north
+        if old != new:
+            cell = self._cells[old]
+            del cell[anomaly.id]
+            if not cell:
+                del self._cells[old]
+            self._cells.setdefault(new, {})[anomaly.id] = anomaly
+            self._extend_bounds(new)
+
+    def insert(self, pose, timestamp, sample, value):
+        """
+        Add a detection at `pose` (frame pose dict) with its trace sample index
+        and amplitude. Returns the new or merged Anomaly.
+        """
+        east, north = self.frame.to_local(pose["lat"], pose["lon"])
+        with self._lock:
+            candidates = [(distance, anomaly) for distance, anomaly in self._near(east, north, self.merge_radius)
+                          if abs(anomaly.sample - sample) <= self.merge_depth]
+            if candidates:
+                _, anomaly = min(candidates, key=lambda candidate: candidate[0])
+                # Running mean of the position weighted by the number of detections
+                weight = anomaly.hits / (anomaly.hits + 1)
+                self._move(anomaly, anomaly.east * weight + east * (1 - weight),
+                           anomaly.north * weight + north * (1 - weight))
+                anomaly.lat = anomaly.lat * weight + pose["lat"] * (1 - weight)
+                anomaly.lon = anomaly.lon * weight + pose["lon"] * (1 - weight)
+                anomaly.sample = round(anomaly.sample * weight + sample * (1 - weight))
+                anomaly.value = max(anomaly.value, value)
+                anomaly.last_seen = max(anomaly.last_seen, timestamp)
+                anomaly.hits += 1
+                self.merged += 1
+                return anomaly
+            anomaly = Anomaly(self._next_id, east, north, pose["lat"], pose["lon"], sample, value, timestamp)
+            self._next_id += 1
+            self._anomalies[anomaly.id] = anomaly
+            cell = self._cell(east, north)
+            self._cells.setdefault(cell, {})[anomaly.id] = anomaly
+            self._extend_bounds(cell)
+            return anomaly
+
+    def within(self, lat, lon, radius):
+        """Anomalies within `radius` metres of (lat, lon), nearest first."""
+        east, north = self.frame.to_local(lat, lon)
+        with self._lock:
+            found = sorted(self._near(east, north, radius), key=lambda item: item[0])
+        return [anomaly for _, anomaly in found]
+
+    def _ring(self, cx, cy, ring):
+        """Cells on the square ring `ring` cells away from (cx, cy)."""
+        if ring == 0:
+            yield cx, cy
+            return
+        for x in range(cx - ring, cx + ring + 1):
+            yield x, cy - ring
+            yield x, cy + ring
+        for y in range(cy - ring + 1, cy + ring):
+            yield cx - ring, y
+            yield cx + ring, y
+
+    def nearest(self, lat, lon, max_distance=None):
+        """
+        Nearest anomaly to (lat, lon) (optionally within max_distance metres),
+        searching rings of cells outwards. Returns (distance, Anomaly) or None.
+        """
+        east, north = self.frame.to_local(lat, lon)
+        cx, cy = self._cell(east, north)
+        with self._lock:
+            if not self._anomalies:
+                return None
+            x0, y0, x1, y1 = self._bounds
+            max_ring = max(cx - x0, x1 - cx, cy - y0, y1 - cy, 0)
+            if max_distance is not None:
+                max_ring = min(max_ring, int(max_distance / self.cell_size) + 1)
+            best = None
+            visited = 0
+            for ring in range(max_ring + 1):
+                if visited > len(self._cells):
+                    # Far from the data: scanning the occupied cells is cheaper than more rings
+                    cells = self._cells.values()
+                else:
+                    cells = (self._cells.get(cell, {}) for cell in self._ring(cx, cy, ring))
+                    visited += 8 * ring or 1
+                for cell in cells:
+                    for anomaly in cell.values():
+                        distance = math.hypot(anomaly.east - east, anomaly.north - north)
+                        if best is None or distance < best[0]:
+                            best = (distance, anomaly)
+                # Anything in a later ring is at least `ring` cells away
+                if best is not None and (best[0] <= ring * self.cell_size or visited > len(self._cells)):
+                    break
+        if best is None or (max_distance is not None and best[0] > max_distance):
+            return None
+        return best
+
+    def anomalies(self):
+        with self._lock:
+            return list(self._anomalies.values())
+
+    def stats(self):
+        with self._lock:
+            return {"anomalies": len(self._anomalies), "merged": self.merged, "cells": len(self._cells)}
+
+
+if __name__ == "__main__":
+    index = AnomalyIndex()
+    for i in range(3):  # three passes over the same target
+        index.insert({"lat": 47.0 + i * 1e-6, "lon": 8.0}, timestamp=i, sample=120, value=0.9)
+    index.insert({"lat": 47.001, "lon": 8.0}, timestamp=4, sample=80, value=0.85)
+    print(index.stats(), index.within(47.0, 8.0, 5.0), index.nearest(47.0009, 8.0))
@@ -7,5 +7,86 @@ BROKER_IP = "192.168.1.100"    # Update with the RPI's IP or the MQTT broker IP
 MQTT_PORT = 1883
 
 # MQTT Topics (should match rpi/config.py)
-MQTT_DATA_TOPIC = "drone/data"
+MQTT_DATA_TOPIC = "drone/data"  # Legacy single-drone topics, used by the drone "default"
 MQTT_COMMAND_TOPIC = "drone/commands"
+
+# Fleet: every other drone publishes on drone/<id>/data and listens on drone/<id>/commands
+MQTT_FLEET_DATA_TOPIC = "drone/+/data"
+MQTT_FLEET_COMMAND_TOPIC = "drone/{drone_id}/commands"
+MQTT_STATUS_TOPIC = "drone/status"  # Processing lag reports to the default drone
+MQTT_FLEET_STATUS_TOPIC = "drone/{drone_id}/status"
+DEFAULT_DRONE_ID = "default"
+STATUS_INTERVAL = 1.0            # Seconds between lag reports to each drone (0 = disabled)
+
+# Drone command publishing
+COMMAND_QOS = 1                  # MQTT QoS for drone commands
+COMMAND_COALESCE_WINDOW = 1.0    # Seconds an identical consecutive command is suppressed
+COMMAND_RECONNECT_MAX_DELAY = 30 # Max seconds between broker reconnect attempts
+
+# GPR processing
+GPR_LOWCUT = 100                 # Bandpass low cutoff (Hz)
+GPR_HIGHCUT = 1000               # Bandpass high cutoff (Hz)
+GPR_FS = 4000                    # GPR sampling rate (Hz)
+GPR_FILTER_ORDER = 3
+GPR_STREAMING_FILTER = False     # Filter consecutive GPR frames as one continuous stream
+FILTER_CACHE_SIZE = 32           # Cached bandpass designs
+GPR_DEWOW_WINDOW = 31            # Samples in the dewow running-mean window
+GPR_GAIN_POWER = 1.0             # Time-power gain exponent (t**p)
+GPR_BSCAN_CHUNK = 512            # Traces per block in batched B-scan processing
+
+# GPR imaging (Kirchhoff migration of the rolling B-scan, see laptop/gpr_imaging.py)
+GPR_IMAGING = False              # Detect GPR anomalies on the migrated image instead of single traces
+GPR_VELOCITY = 1000.0            # Migration velocity (m/s at the GPR_FS time scale)
+GPR_TRACE_SPACING = 0.5          # Metres between consecutive traces (frames) along the track
+GPR_MIGRATION_APERTURE = 16      # Traces on each side summed into an image column
+GPR_IMAGE_WINDOW = 128           # Focused columns kept for detection
+GPR_BACKGROUND_TRACES = 64       # Traces in the running-mean background removal (0 = off)
+GPR_IMAGE_THRESHOLD = 12.0       # Detection threshold in multiples of the image noise level
+GPR_IMAGE_DETECT_EVERY = 8       # Traces between detections on the image
+
+# Detection
+MAX_DETECTION_REGIONS = 16       # Strongest obstacle/anomaly regions kept per frame
+
+# Receiver
+DEDUPE_WINDOW = 4096             # Recent frame keys remembered (per drone) to drop replayed duplicates
+
+# Analysis pipeline
+FRAME_QUEUE_SIZE = 64            # Frames buffered per drone between receiver and analysis workers
+FRAME_DROP_POLICY = "drop_oldest"  # "drop_oldest", "drop_newest" or "block"
+ANALYSIS_WORKERS = 2             # Analysis worker threads
+GPR_WORKERS = 0                  # GPR filter/detect worker processes (0 = in the analysis threads)
+GPR_ENGINE_SLOTS = 16            # Traces in flight in the GPR engine's shared memory
+GPR_ENGINE_SLOT_SAMPLES = 8192   # Longest trace a slot holds (longer ones are processed in-thread)
+FRAME_POOL_BUFFERS = 256         # Reusable trace buffers frames are decoded into (0 = off; off while recording)
+FRAME_POOL_SAMPLES = 4096        # Longest trace a pooled buffer holds (longer ones get a fresh array)
+LATENCY_WINDOW = 1000            # Frames kept for latency percentiles
+STATS_INTERVAL = 10              # Seconds between pipeline stats log lines
+
+# Survey recording
+RECORD_SURVEYS = False           # Persist every received frame for later replay
+RECORD_DIR = "surveys"           # Parent directory of recorded surveys (one subdirectory per run)
+RECORD_SEGMENT_FRAMES = 1024     # Frames per sensor in one on-disk segment
+RECORD_QUEUE_SIZE = 4096         # Frames buffered between receiver and recorder
+
+# Metrics and logging
+METRICS_ENABLED = True           # Collect counters/histograms (near-zero cost when False)
+METRICS_PORT = 9100              # Local Prometheus-text endpoint (0 = disabled)
+METRICS_SUMMARY_INTERVAL = 60    # Seconds between metrics summary log lines (0 = disabled)
+PAYLOAD_LOG_EVERY = 100          # Log one received payload in this many (0 = never)
+
+# Terrain map (LiDAR)
+LIDAR_FOV_DEG = 360              # Angle covered by one LiDAR scan, centred on the heading
+LIDAR_MOUNT_PITCH_DEG = 30       # Downward tilt of the scan plane
+LIDAR_MAX_RANGE = 40             # Returns beyond this (m) are ignored
+TERRAIN_CELL_SIZE = 0.5          # Metres per terrain map cell
+TERRAIN_TILE_CELLS = 64          # Cells per tile side
+TERRAIN_MAX_TILES = 1024         # Tiles kept in memory (~32 MB at 64x64 cells)
+TERRAIN_MIN_HITS = 2             # Returns needed before a cell counts as an obstacle
+OBSTACLE_LOOKAHEAD = 10          # Metres checked ahead of the drone
+OBSTACLE_CORRIDOR_WIDTH = 2      # Width (m) of the corridor checked ahead
+OBSTACLE_CLEARANCE = 2           # Terrain within this many metres below the drone is an obstacle
+
+# GPR anomaly index
+ANOMALY_CELL_SIZE = 2.0          # Grid-hash cell side (m)
+ANOMALY_MERGE_RADIUS = 1.5       # Detections closer than this (m) are merged...
+ANOMALY_MERGE_DEPTH = 20         # ...if their peaks are within this many trace samples
@@ -1,18 +1,180 @@
 """
 laptop/drone_commands.py
 Sends control commands to the Raspberry Pi for drone operation.
+A single long-lived MQTT connection is shared by all callers (and all
+drones of a fleet: each publish can name its drone's command topic).
 """
 import json
+import time
 import logging
+import threading
+from collections import deque
 import paho.mqtt.client as mqtt
 from laptop import config
 
 logger = logging.getLogger("DroneCommands")
 logger.setLevel(logging.INFO)
 
-def send_drone_command(command_dict):
+
+class CommandPublisher:
+    """
+    Thread-safe, persistent MQTT publisher for drone commands.
+    - connects once and lets paho reconnect automatically (with backoff)
+    - publishes with a configurable QoS
+    - coalesces identical consecutive commands to the same topic within
+      `coalesce_window` seconds
+    - drops commands while disconnected: paho would queue them and deliver a
+      burst of stale commands on reconnect
+    - tracks publish -> ack latency (PUBACK for QoS 1, PUBCOMP for QoS 2,
+      socket write for QoS 0)
+    """
+
+    def __init__(self, broker_ip=config.BROKER_IP, port=config.MQTT_PORT, topic=config.MQTT_COMMAND_TOPIC,
+                 qos=config.COMMAND_QOS, coalesce_window=config.COMMAND_COALESCE_WINDOW, client=None):
+        self.broker_ip = broker_ip
+        self.port = port
+        self.topic = topic
+        self.qos = qos
+        self.coalesce_window = coalesce_window
+        self.client = client if client is not None else mqtt.Client()
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_publish = self._on_publish
+        self.client.reconnect_delay_set(min_delay=1, max_delay=config.COMMAND_RECONNECT_MAX_DELAY)
+        # Re-entrant: without a network thread paho may call on_publish from publish()
+        self._lock = threading.RLock()
+        self._pending = {}  # mid -> publish time
+        self._early_acks = set()  # mids acknowledged before publish() returned
+        self._publishing = False  # inside client.publish() (on_publish may run from it)
+        self._latencies = deque(maxlen=config.LATENCY_WINDOW)
+        self._last_sent = {}  # topic -> (payload, monotonic time) of the last command
+        self._started = False
+        self.connected = False
+        self.published = 0
+        self.acked = 0
+        self.coalesced = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def start(self):
+        """Connect (asynchronously) and start the network thread."""
+        with self._lock:
+            if self._started:
+                return self
+            self._started = True
+        self.client.connect_async(self.broker_ip, self.port, keepalive=60)
+        self.client.loop_start()
+        logger.info(f"Command publisher connecting to {self.broker_ip}:{self.port}")
+        return self
+
+    def stop(self):
+        with self._lock:
+            if not self._started:
+                return
+            self._started = False
+        self.client.disconnect()
+        self.client.loop_stop()
+
+    def _on_connect(self, client, userdata, flags, rc):
+        self.connected = rc == 0
+        if self.connected:
+            logger.info("Command publisher connected")
+        else:
+            logger.error(f"Command publisher connection refused: rc={rc}")
+
+    def _on_disconnect(self, client, userdata, rc):
+        self.connected = False
+        if rc != 0:
+            logger.warning(f"Command publisher disconnected (rc={rc}); reconnecting")
+
+    def _on_publish(self, client, userdata, mid):
+        with self._lock:
+            sent_at = self._pending.pop(mid, None)
+            if sent_at is None:
+                # Acks for mids that were never pending (e.g. failed publishes) are discarded
+                if self._publishing:
+                    self._early_acks.add(mid)
+                return
+            self.acked += 1
+            self._latencies.append(time.perf_counter() - sent_at)
+
+    def publish(self, command_dict, topic=None, qos=None):
+        """
+        Publish a command. Returns True if it was handed to the client (or
+        coalesced with an identical command just sent), False on failure or
+        while the client is not connected.
+        """
+        payload = json.dumps(command_dict, sort_keys=True)
+        topic = topic or self.topic
+        with self._lock:
+            now = time.monotonic()
+            last_payload, last_sent = self._last_sent.get(topic, (None, 0.0))
+            if payload == last_payload and now - last_sent < self.coalesce_window:
+                self.coalesced += 1
+                return True
+            if not self.client.is_connected():
+                self.dropped += 1
+                logger.debug(f"Broker not connected; dropping drone command: {payload}")
+                return False
+            sent_at = time.perf_counter()
+            self._publishing = True
+            try:
+                info = self.client.publish(topic, payload, qos=self.qos if qos is None else qos)
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Error sending drone command: {e}")
+                return False
+            finally:
+                self._publishing = False
+                early_acks, self._early_acks = self._early_acks, set()
+            if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                self.failed += 1
+                logger.error(f"Error sending drone command: {mqtt.error_string(info.rc)}")
+                return False
+            if info.mid in early_acks:
+                self.acked += 1
+                self._latencies.append(time.perf_counter() - sent_at)
+            else:
+                self._pending[info.mid] = sent_at
+            self._last_sent[topic] = (payload, now)
+            self.published += 1
+        logger.debug(f"Sent drone command to {topic}: {payload}")
+        return True
+
+    def stats(self):
+        """Return publish counters and ack latency percentiles (seconds)."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = {
+                "connected": self.connected,
+                "published": self.published,
+                "acked": self.acked,
+                "coalesced": self.coalesced,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "in_flight": len(self._pending),
+            }
+        if latencies:
+            stats["ack_latency_p50"] = latencies[len(latencies) // 2]
+            stats["ack_latency_p99"] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        return stats
+
+
+_publisher = None
+_publisher_lock = threading.Lock()
+
+def get_publisher():
+    """Return the shared, started CommandPublisher."""
+    global _publisher
+    with _publisher_lock:
+        if _publisher is None:
+            _publisher = CommandPublisher().start()
+        return _publisher
+
+def send_drone_command(command_dict, topic=None):
     """
-    Publishes a command dictionary to the MQTT command topic.
+    Publishes a command dictionary to the MQTT command topic (default: the
+    legacy single-drone topic; see laptop/fleet.command_topic).
     Expected command_dict format:
     {
         "action": "takeoff"/"land"/"move"/"hover",
@@ -22,16 +184,14 @@ def send_drone_command(command_dict):
     }
     """
     try:
-        client = mqtt.Client()
-        client.connect(config.BROKER_IP, config.MQTT_PORT, keepalive=60)
-        payload = json.dumps(command_dict)
-        client.publish(config.MQTT_COMMAND_TOPIC, payload)
-        client.disconnect()
-        logger.info(f"Sent drone command: {payload}")
+        return get_publisher().publish(command_dict, topic=topic)
     except Exception as e:
         logger.error(f"Error sending drone command: {e}")
+        return False
 
 # For testing purposes, you can call this function with a test command.
 if __name__ == "__main__":
     test_command = {"action": "hover"}
     send_drone_command(test_command)
+    time.sleep(1)
+    print(get_publisher().stats())
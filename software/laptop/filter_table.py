@@ -0,0 +1,30 @@
+"""
+laptop/filter_table.py
+Precomputed Butterworth bandpass designs in second-order-sections form, so
+the configured GPR filter needs no scipy.signal.butter call at runtime.
+Keyed by (lowcut, highcut, fs, order); designs not in the table are computed
+with butter on first use. After changing the GPR filter settings in
+laptop/config.py, print the entry to add with:
+    python -m laptop.filter_table
+"""
+BANDPASS_SOS = {
+    (100.0, 1000.0, 4000.0, 3): (
+        (0.13006301175731103, 0.26012602351462205, 0.13006301175731103, 1.0, -0.04371559680310561, 0.3904434654991031),
+        (1.0, 0.0, -1.0, 1.0, -0.9212982931753818, 0.07870170682461844),
+        (1.0, -2.0, 1.0, 1.0, -1.8433234077997107, 0.8678022819670386),
+    ),
+}
+
+
+def table_entry(lowcut, highcut, fs, order):
+    """Source text of a BANDPASS_SOS entry for the given design."""
+    from scipy.signal import butter
+    nyq = 0.5 * fs
+    sos = butter(order, [lowcut / nyq, highcut / nyq], btype='band', output='sos')
+    rows = "".join(f"        ({', '.join(repr(float(c)) for c in row)}),\n" for row in sos)
+    return f"    ({float(lowcut)!r}, {float(highcut)!r}, {float(fs)!r}, {int(order)}): (\n{rows}    ),"
+
+
+if __name__ == "__main__":
+    from laptop import config
+    print(table_entry(config.GPR_LOWCUT, config.GPR_HIGHCUT, config.GPR_FS, config.GPR_FILTER_ORDER))
@@ -0,0 +1,253 @@
+"""
+laptop/fleet.py
+Per-drone state for running several Raspberry Pi nodes against one laptop.
+Each drone publishes on drone/<id>/data and listens on drone/<id>/commands;
+the legacy single-drone topics (drone/data, drone/commands) belong to the
+drone "default". Every drone gets its own frame queue, duplicate filter and
+decision ordering, and FleetQueue hands frames to the analysis workers
+round-robin across drones so a chatty drone cannot starve the others.
+StatusReporter tells each drone how far behind the laptop is (drone/<id>/status)
+so the Pi's rate controller can shed load.
+Topic -> drone lookups are dict hits, so per-message cost does not grow
+with the fleet size.
+"""
+import time
+import logging
+import threading
+from collections import deque
+from laptop import config
+from laptop.pipeline import FrameQueue
+from laptop.receiver import DuplicateFilter
+from laptop.gpr_processing import BandpassFilter
+from laptop.gpr_imaging import RollingMigration
+
+logger = logging.getLogger("Fleet")
+logger.setLevel(logging.INFO)
+
+DEFAULT_DRONE = config.DEFAULT_DRONE_ID
+
+
+def drone_id_from_topic(topic):
+    """drone/<id>/data -> <id>; the legacy data topic (or anything else) -> the default drone."""
+    parts = topic.split("/")
+    if len(parts) == 3 and parts[0] == "drone" and parts[2] == "data" and parts[1]:
+        return parts[1]
+    return DEFAULT_DRONE
+
+
+def command_topic(drone_id):
+    """Command topic of a drone (the legacy topic for the default drone)."""
+    if drone_id == DEFAULT_DRONE:
+        return config.MQTT_COMMAND_TOPIC
+    return config.MQTT_FLEET_COMMAND_TOPIC.format(drone_id=drone_id)
+
+
+def status_topic(drone_id):
+    """Status (lag report) topic of a drone (the legacy topic for the default drone)."""
+    if drone_id == DEFAULT_DRONE:
+        return config.MQTT_STATUS_TOPIC
+    return config.MQTT_FLEET_STATUS_TOPIC.format(drone_id=drone_id)
+
+
+class DroneState:
+    """Everything the laptop keeps per drone."""
+
+    def __init__(self, drone_id, queue_size=config.FRAME_QUEUE_SIZE, drop_policy=config.FRAME_DROP_POLICY):
+        self.drone_id = drone_id
+        self.command_topic = command_topic(drone_id)
+        self.status_topic = status_topic(drone_id)
+        self.queue = FrameQueue(queue_size, drop_policy)
+        self.duplicates = DuplicateFilter()
+        # Stateful GPR filter: consecutive frames of one drone form one stream
+        self.gpr_filter = BandpassFilter() if config.GPR_STREAMING_FILTER else None
+        # Rolling migrated B-scan of the drone's track
+        self.gpr_imager = RollingMigration() if config.GPR_IMAGING else None
+        self.latest_data = None
+        self.last_seen = None
+        self.frames = 0
+        self.decisions = 0
+        # Timestamp of the newest frame a command was sent for; with several
+        # workers a slower worker must not override a fresher decision.
+        self.last_decision = float("-inf")
+        self.lag = None  # smoothed capture -> decision delay (s)
+        self.lock = threading.Lock()
+
+    def record_lag(self, lag, smoothing=0.2):
+        """Fold the capture -> decision delay of one frame into the smoothed lag."""
+        self.lag = lag if self.lag is None else self.lag + smoothing * (lag - self.lag)
+
+    def status(self):
+        """Status report for the drone's rate controller."""
+        return {"lag": self.lag, "queued": len(self.queue), "time": time.time()}
+
+    def stats(self):
+        return {"frames": self.frames, "decisions": self.decisions, "queued": len(self.queue),
+                "dropped": self.queue.dropped, "duplicates": self.duplicates.duplicates,
+                "lag": self.lag, "last_seen": self.last_seen,
+                **({"imaging": self.gpr_imager.stats()} if self.gpr_imager is not None else {})}
+
+
+class Fleet:
+    """Registry of DroneState, created on the first frame from a drone."""
+
+    def __init__(self, queue_size=config.FRAME_QUEUE_SIZE, drop_policy=config.FRAME_DROP_POLICY):
+        self.queue_size = queue_size
+        self.drop_policy = drop_policy
+        self._drones = {}  # drone id -> DroneState
+        self._topics = {}  # data topic -> DroneState
+        self._lock = threading.Lock()
+        self.queue = FleetQueue(self)
+
+    def __len__(self):
+        return len(self._drones)
+
+    def drone(self, drone_id=DEFAULT_DRONE):
+        """Return the state of a drone, creating it on first use."""
+        state = self._drones.get(drone_id)
+        if state is None:
+            with self._lock:
+                state = self._drones.get(drone_id)
+                if state is None:
+                    state = DroneState(drone_id, self.queue_size, self.drop_policy)
+                    self._drones[drone_id] = state
+                    logger.info(f"New drone in fleet: {drone_id}")
+        return state
+
+    def from_topic(self, topic):
+        """Return the state of the drone publishing on a data topic."""
+        state = self._topics.get(topic)
+        if state is None:
+            state = self.drone(drone_id_from_topic(topic))
+            self._topics[topic] = state
+        return state
+
+    def drones(self):
+        with self._lock:
+            return list(self._drones.values())
+
+    def stats(self):
+        return {state.drone_id: state.stats() for state in self.drones()}
+
+
+class FleetQueue:
+    """
+    Fair frame queue over all drones with the FrameQueue interface, for use
+    as AnalysisPipeline(queue=...). Frames are routed to their drone's queue
+    by frame["drone_id"]; get() serves drones with pending frames in
+    round-robin order, one frame per turn. put() and get() are O(1).
+    """
+
+    def __init__(self, fleet):
+        self.fleet = fleet
+        self._ready = deque()  # drones with queued frames, in service order
+        self._ready_ids = set()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def __len__(self):
+        return sum(len(state.queue) for state in self.fleet.drones())
+
+    @property
+    def dropped(self):
+        return sum(state.queue.dropped for state in self.fleet.drones())
+
+    def put(self, frame, timeout=None):
+        """Queue a frame on its drone's queue (drop policy applies per drone)."""
+        state = self.fleet.drone(frame.get("drone_id", DEFAULT_DRONE))
+        accepted = state.queue.put(frame, timeout)
+        with self._cond:
+            if state.drone_id not in self._ready_ids and len(state.queue):
+                self._ready_ids.add(state.drone_id)
+                self._ready.append(state)
+                self._cond.notify()
+        return accepted
+
+    def get(self, timeout=None):
+        """Next frame in round-robin drone order, or None on timeout/close."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if not self._cond.wait_for(lambda: self._ready or self._closed,
+                                           None if deadline is None else max(0.0, deadline - time.monotonic())):
+                    return None
+                if not self._ready:
+                    return None
+                state = self._ready.popleft()
+                frame = state.queue.get(timeout=0)
+                if len(state.queue):
+                    self._ready.append(state)  # back of the line
+                else:
+                    self._ready_ids.discard(state.drone_id)
+                if frame is not None:
+                    return frame
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for state in self.fleet.drones():
+            state.queue.close()
+
+
+class StatusReporter:
+    """
+    Publishes every active drone's status() to its status topic every
+    `interval` seconds through `publish(message, topic=..., qos=0)` (e.g.
+    CommandPublisher.publish, so it shares the command connection).
+    Drones silent for more than `idle_after` seconds are skipped.
+    """
+
+    def __init__(self, fleet, publish, interval=config.STATUS_INTERVAL, idle_after=30.0):
+        self.fleet = fleet
+        self.publish = publish
+        self.interval = interval
+        self.idle_after = idle_after
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.sent = 0
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="status-reporter", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def report(self):
+        """Publish one round of status reports."""
+        now = time.time()
+        for state in self.fleet.drones():
+            if state.last_seen is None or now - state.last_seen > self.idle_after:
+                continue
+            try:
+                if self.publish(state.status(), topic=state.status_topic, qos=0):
+                    self.sent += 1
+            except Exception as e:
+                logger.error(f"Error publishing status to {state.drone_id}: {e}")
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.report()
+
+
+if __name__ == "__main__":
+    fleet = Fleet()
+    for i in range(6):
+        fleet.queue.put({"drone_id": "a", "seq": i})
+    for i in range(2):
+        fleet.queue.put({"drone_id": "b", "seq": i})
+    fleet.queue.put({"seq": 0})
+    order = []
+    while True:
+        frame = fleet.queue.get(timeout=0)
+        if frame is None:
+            break
+        order.append((frame.get("drone_id", DEFAULT_DRONE), frame["seq"]))
+    print(order)
+    print(drone_id_from_topic("drone/a/data"), drone_id_from_topic("drone/data"), command_topic("a"))
@@ -0,0 +1,215 @@
+"""
+laptop/gpr_engine.py
+Multi-core GPR processing.
+Traces are filtered and searched for anomalies in a pool of worker processes,
+so several frames are processed at once instead of queueing behind the GIL.
+Trace data does not go through pickling: the engine owns one shared-memory
+block split into fixed-size slots, copies each trace into a free slot, and
+the worker filters it in place. Only the slot number and the (small) list of
+anomaly regions cross the process boundary.
+Results are available per frame (a Future) and, optionally, delivered to a
+callback in submission order whatever order the workers finish in.
+"""
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from laptop import config
+from laptop.gpr_processing import process_gpr_data, detect_anomalies, preload
+from shared.utils import parse_sensor_values
+
+logger = logging.getLogger("GprEngine")
+logger.setLevel(logging.INFO)
+
+# Worker process state, set once by _init_worker
+_worker = {}
+
+
+def _init_worker(name, slots, slot_samples):
+    """Attach the worker to the engine's shared-memory slots."""
+    shm = shared_memory.SharedMemory(name=name)
+    _worker["shm"] = shm  # keep the mapping alive for the life of the worker
+    _worker["slots"] = np.ndarray((slots, slot_samples), dtype=np.float64, buffer=shm.buf)
+    preload(background=False)  # the first trace should not pay for importing SciPy
+
+
+def _process_slot(slot, length, fs, threshold, max_regions):
+    """
+    Filter the trace in a slot (result written back in place) and detect
+    anomaly regions. Returns (filtered length, anomalies).
+    """
+    row = _worker["slots"][slot]
+    filtered = process_gpr_data(row[:length], fs=fs)
+    anomalies = detect_anomalies(filtered, threshold=threshold, regions=True, max_regions=max_regions)
+    row[:len(filtered)] = filtered
+    return len(filtered), anomalies
+
+
+class GprEngine:
+    """
+    Process pool for process_gpr_data + detect_anomalies.
+    workers: worker processes.
+    slots: traces in flight at once (submit() waits for a free slot).
+    slot_samples: longest trace that fits a slot; longer traces are
+                  processed in the calling thread.
+    on_result: optional callback(seq, tag, filtered, anomalies), called in
+               submission order from the pool's result thread; keep it short.
+    """
+
+    def __init__(self, workers=config.GPR_WORKERS, slots=config.GPR_ENGINE_SLOTS,
+                 slot_samples=config.GPR_ENGINE_SLOT_SAMPLES, threshold=0.8,
+                 max_regions=config.MAX_DETECTION_REGIONS, on_result=None):
+        self.workers = max(1, workers)
+        self.slots = max(slots, self.workers)
+        self.slot_samples = slot_samples
+        self.threshold = threshold
+        self.max_regions = max_regions
+        self.on_result = on_result
+        self._shm = None
+        self._buffer = None
+        self._executor = None
+        self._free = deque()
+        self._slot_cond = threading.Condition()
+        self._order_lock = threading.Lock()
+        self._pending = {}  # seq -> (tag, filtered, anomalies) finished ahead of an earlier frame
+        self._seq = 0
+        self._next_seq = 0
+        self.processed = 0
+        self.inline = 0
+        self.errors = 0
+
+    def start(self):
+        if self._executor is None:
+            self._shm = shared_memory.SharedMemory(create=True, size=self.slots * self.slot_samples * 8)
+            self._buffer = np.ndarray((self.slots, self.slot_samples), dtype=np.float64, buffer=self._shm.buf)
+            self._free = deque(range(self.slots))
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                                 initargs=(self._shm.name, self.slots, self.slot_samples))
+            logger.info(f"GPR engine started with {self.workers} worker process(es), {self.slots} slots "
+                        f"of {self.slot_samples} samples")
+        return self
+
+    def stop(self):
+        """Wait for in-flight traces, stop the workers and free the shared memory."""
+        if self._executor is None:
+            return
+        self._executor.shutdown(wait=True)
+        self._executor = None
+        self._buffer = None
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
+        logger.info("GPR engine stopped")
+
+    def _acquire_slot(self, timeout):
+        with self._slot_cond:
+            if not self._slot_cond.wait_for(lambda: self._free, timeout):
+                return None
+            return self._free.popleft()
+
+    def _release_slot(self, slot):
+        with self._slot_cond:
+            self._free.append(slot)
+            self._slot_cond.notify()
+
+    def submit(self, gpr_raw, tag=None, timeout=None, fs=config.GPR_FS):
+        """
+        Queue one trace (comma-separated string or array) sampled at `fs` for processing.
+        Returns a Future resolving to (filtered, anomalies); anomalies are
+        (start, end, peak) tuples as from detect_anomalies(regions=True).
+        Waits up to `timeout` seconds for a free slot, then processes the
+        trace in the calling thread.
+        """
+        with self._order_lock:
+            seq = self._seq
+            self._seq += 1
+        result = Future()
+        data, malformed = parse_sensor_values(gpr_raw)
+        if malformed:
+            logger.warning(f"Skipped {len(malformed)} malformed GPR values, first: {malformed[0]}")
+        slot = None
+        if self._executor is not None and len(data) <= self.slot_samples:
+            slot = self._acquire_slot(timeout)
+        if slot is None:
+            self._finish(seq, tag, result, *self._process_inline(data, fs))
+            return result
+        self._buffer[slot, :len(data)] = data
+        try:
+            job = self._executor.submit(_process_slot, slot, len(data), fs, self.threshold, self.max_regions)
+        except Exception as e:
+            logger.error(f"Failed to submit GPR trace to the engine: {e}")
+            self._release_slot(slot)
+            self._finish(seq, tag, result, *self._process_inline(data, fs))
+            return result
+        job.add_done_callback(lambda job: self._collect(job, seq, tag, slot, result))
+        return result
+
+    def process(self, gpr_raw, timeout=None, fs=config.GPR_FS):
+        """Process one trace and wait for (filtered, anomalies)."""
+        return self.submit(gpr_raw, fs=fs).result(timeout)
+
+    def map(self, traces):
+        """Process many traces in parallel, yielding (filtered, anomalies) in input order."""
+        futures = [self.submit(trace) for trace in traces]
+        for future in futures:
+            yield future.result()
+
+    def _process_inline(self, data, fs):
+        self.inline += 1
+        filtered = process_gpr_data(data, fs=fs)
+        return filtered, detect_anomalies(filtered, threshold=self.threshold, regions=True,
+                                          max_regions=self.max_regions)
+
+    def _collect(self, job, seq, tag, slot, result):
+        try:
+            length, anomalies = job.result()
+            filtered = self._buffer[slot, :length].copy()
+        except Exception as e:
+            logger.error(f"GPR worker failed: {e}")
+            self.errors += 1
+            filtered, anomalies = np.array([]), []
+        finally:
+            self._release_slot(slot)
+        self._finish(seq, tag, result, filtered, anomalies)
+
+    def _finish(self, seq, tag, result, filtered, anomalies):
+        result.set_result((filtered, anomalies))
+        with self._order_lock:
+            self.processed += 1
+            self._pending[seq] = (tag, filtered, anomalies)
+            # Release every result that is now contiguous with the last delivered one
+            while self._next_seq in self._pending:
+                ready = self._pending.pop(self._next_seq)
+                if self.on_result is not None:
+                    try:
+                        self.on_result(self._next_seq, *ready)
+                    except Exception as e:
+                        logger.error(f"Error in GPR result callback: {e}")
+                self._next_seq += 1
+
+    def stats(self):
+        with self._order_lock:
+            return {"submitted": self._seq, "processed": self.processed, "inline": self.inline,
+                    "errors": self.errors, "reordering": len(self._pending),
+                    "free_slots": len(self._free)}
+
+
+if __name__ == "__main__":
+    import time
+    rng = np.random.default_rng(0)
+    traces = [rng.normal(size=4096) for _ in range(64)]
+    started = time.perf_counter()
+    serial = [process_gpr_data(trace) for trace in traces]
+    serial_time = time.perf_counter() - started
+    order = []
+    engine = GprEngine(workers=4, on_result=lambda seq, tag, filtered, anomalies: order.append(seq)).start()
+    engine.process(traces[0])  # warm up the workers
+    started = time.perf_counter()
+    parallel = list(engine.map(traces))
+    parallel_time = time.perf_counter() - started
+    engine.stop()
+    print(f"serial {serial_time:.3f}s, engine {parallel_time:.3f}s, "
+          f"identical: {all(np.allclose(a, b) for a, (b, _) in zip(serial, parallel))}, "
+          f"in order: {order == sorted(order)}, {engine.stats()}")
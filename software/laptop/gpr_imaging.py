@@ -0,0 +1,227 @@
+"""
+laptop/gpr_imaging.py
+GPR imaging: Kirchhoff migration of a rolling B-scan.
+A buried point target shows up in a B-scan as a diffraction hyperbola
+spanning many traces, and thresholding the raw traces fires on every trace
+its limbs cross. Migration sums each hyperbola back to its apex, so
+detection runs on a focused image instead.
+Traces are migrated incrementally as they arrive. A diffraction from image
+column c at two-way time t0 appears on the trace k columns away at
+t = sqrt(t0**2 + (k * trace_step)**2) samples, so a new trace contributes
+one gather of the precomputed (offset x sample) hyperbola table to each of
+the 2 * aperture + 1 columns around it. Partial sums for those columns live
+in a ring of accumulators and a column is final once the trace `aperture`
+columns after it has arrived. The work done for one window is never redone
+for the next, and the per-trace cost depends only on the aperture and the
+trace length, not on how many columns of image are kept.
+trace_step is the two-way time (in samples) across one trace spacing at the
+migration velocity, 2 * spacing * fs / velocity.
+"""
+import logging
+import threading
+from functools import lru_cache
+import numpy as np
+from laptop import config
+from laptop.gpr_processing import detect_anomalies_2d
+
+logger = logging.getLogger("GprImaging")
+logger.setLevel(logging.INFO)
+
+
+def trace_step(fs=config.GPR_FS, spacing=config.GPR_TRACE_SPACING, velocity=config.GPR_VELOCITY):
+    """Two-way time in samples across one trace spacing."""
+    return 2.0 * spacing * fs / velocity
+
+
+@lru_cache(maxsize=config.FILTER_CACHE_SIZE)
+def hyperbola_table(n_samples, aperture, step):
+    """
+    Diffraction hyperbola lookup for every offset within the aperture.
+    Returns (index, weight), both (2 * aperture + 1) x n_samples: row r is the
+    offset r - aperture; index[r, t0] is the sample where a diffractor at t0
+    appears on that trace and weight[r, t0] its obliquity (t0 / t) times a
+    cosine taper over the aperture, 0 where the hyperbola leaves the trace.
+    The arrays are shared between callers and must not be modified.
+    """
+    offsets = np.arange(-aperture, aperture + 1, dtype=np.float64)[:, None]
+    t0 = np.arange(n_samples, dtype=np.float64)[None, :]
+    t = np.sqrt(t0 ** 2 + (offsets * step) ** 2)
+    index = np.rint(t).astype(np.intp)
+    taper = 0.5 + 0.5 * np.cos(np.pi * offsets / (aperture + 1))
+    weight = np.where(t > 0, t0 / np.where(t > 0, t, 1.0), 1.0) * taper
+    outside = index >= n_samples
+    index[outside] = 0
+    weight[outside] = 0.0
+    index.flags.writeable = False
+    weight.flags.writeable = False
+    return index, weight
+
+
+def migrate(bscan, aperture=config.GPR_MIGRATION_APERTURE, step=None):
+    """
+    Kirchhoff-migrate a whole B-scan (traces x samples) at once.
+    step: trace_step(); defaults to the configured velocity and spacing at GPR_FS.
+    Returns the focused image, same shape (columns within `aperture` of the
+    ends have partial apertures).
+    """
+    bscan = np.asarray(bscan, dtype=np.float64)
+    step = trace_step() if step is None else step
+    n_traces, n_samples = bscan.shape
+    index, weight = hyperbola_table(n_samples, aperture, float(step))
+    image = np.zeros_like(bscan)
+    for row, offset in enumerate(range(-aperture, aperture + 1)):
+        # Column c collects trace c + offset
+        first, last = max(0, -offset), min(n_traces, n_traces - offset)
+        if first < last:
+            image[first:last] += bscan[first + offset:last + offset][:, index[row]] * weight[row]
+    return image
+
+
+class RollingMigration:
+    """
+    Incremental Kirchhoff migration of a stream of traces.
+    aperture: traces on each side summed into an image column; columns are
+              output `aperture` traces after their own trace.
+    window: focused columns kept for detection.
+    background: traces in the running-mean background removed before
+                migration (flat layers and ringing); 0 disables it.
+    push() accepts traces of any length and sampling rate; a change of
+    either starts a new image. Thread-safe.
+    """
+
+    def __init__(self, aperture=config.GPR_MIGRATION_APERTURE, window=config.GPR_IMAGE_WINDOW,
+                 background=config.GPR_BACKGROUND_TRACES, spacing=config.GPR_TRACE_SPACING,
+                 velocity=config.GPR_VELOCITY):
+        self.aperture = aperture
+        self.window = window
+        self.background = background
+        self.spacing = spacing
+        self.velocity = velocity
+        self._lock = threading.Lock()
+        self.traces = 0  # traces pushed since the last reset
+        self.resets = 0
+        self._reset(0, config.GPR_FS)
+
+    def _reset(self, n_samples, fs):
+        span = 2 * self.aperture + 1
+        self.n_samples = n_samples
+        self.fs = fs
+        self._index, self._weight = hyperbola_table(n_samples, self.aperture,
+                                                    trace_step(fs, self.spacing, self.velocity))
+        self._acc = np.zeros((span, n_samples))
+        self._acc_tags = [None] * span
+        self._rows = np.arange(span)
+        self._background = None
+        self._image = np.zeros((self.window, n_samples))
+        self._noise = np.zeros(self.window)  # mean magnitude of each image column
+        self._tags = [None] * self.window
+        self._columns = 0  # focused columns output since the last reset
+        self._reported = 0  # columns already searched by detect()
+        self.traces = 0
+
+    def push(self, trace, fs=config.GPR_FS, tag=None):
+        """
+        Add the next (filtered) trace. tag: anything identifying the trace
+        (e.g. the frame's pose and time), returned with detections at its column.
+        Returns the number of focused columns available.
+        """
+        trace = np.asarray(trace, dtype=np.float64)
+        with self._lock:
+            if len(trace) != self.n_samples or fs != self.fs:
+                if self.traces:
+                    logger.info(f"GPR trace format changed ({self.n_samples} -> {len(trace)} samples, "
+                                f"{self.fs} -> {fs} Hz); starting a new image")
+                    self.resets += 1
+                self._reset(len(trace), fs)
+            if self.background:
+                # Running mean: cumulative over the first `background` traces, then exponential
+                if self._background is None:
+                    self._background = np.zeros_like(trace)
+                self._background += (trace - self._background) / min(self.traces + 1, self.background)
+                trace = trace - self._background
+            j = self.traces
+            span = len(self._rows)
+            # Row r of the table is offset r - aperture, i.e. image column j + aperture - r
+            self._acc[(j + self.aperture - self._rows) % span] += trace[self._index] * self._weight
+            self._acc_tags[j % span] = tag
+            self.traces += 1
+            done = j - self.aperture  # column whose aperture this trace completed
+            slot = done % span
+            if done >= 0:
+                row = self._columns % self.window
+                self._image[row] = self._acc[slot]
+                self._noise[row] = np.abs(self._acc[slot]).mean()
+                self._tags[row] = self._acc_tags[slot]
+                self._columns += 1
+            self._acc[slot] = 0.0
+            return min(self._columns, self.window)
+
+    def image(self):
+        """Copy of the focused window (columns x samples), oldest column first."""
+        with self._lock:
+            kept = min(self._columns, self.window)
+            return self._image[np.arange(self._columns - kept, self._columns) % self.window]
+
+    def detect(self, threshold=config.GPR_IMAGE_THRESHOLD, max_regions=config.MAX_DETECTION_REGIONS):
+        """
+        Find focused targets whose peak is in a column output since the last call.
+        The image magnitude is scaled by a noise estimate (the median over the
+        window of each column's mean magnitude, as a standard deviation), so
+        `threshold` is a signal-to-noise ratio.
+        Only the new columns and one aperture of context are searched, so the
+        cost does not grow with the window either. Columns migrated while the
+        background estimate was still warming up (the first `background`
+        traces) are skipped.
+        Returns detect_anomalies_2d() dicts with "traces" and "peak" in image
+        columns (numbered like the traces pushed since the last reset), plus
+        the peak column's "tag" and the peak "score".
+        """
+        with self._lock:
+            end = self._columns
+            kept = min(end, self.window)
+            new = min(end - self._reported, kept)
+            self._reported = end
+            if new == 0:
+                return []
+            # A focused target spans about one aperture, which bounds the context needed
+            first = end - min(kept, new + self.aperture)
+            rows = np.arange(first, end) % self.window
+            image = np.abs(self._image[rows])
+            noise = np.median(self._noise[:kept]) / np.sqrt(2 / np.pi)  # mean |x| of Gaussian noise
+            tags = [self._tags[row] for row in rows]
+        if noise == 0:
+            return []
+        first_new = max(end - new, self.background)
+        found = []
+        for anomaly in detect_anomalies_2d(image / noise, threshold=threshold, max_regions=max_regions):
+            column, sample = anomaly["peak"]
+            if first + column < first_new:
+                continue
+            anomaly["traces"] = (first + anomaly["traces"][0], first + anomaly["traces"][1])
+            anomaly["peak"] = (first + column, sample)
+            anomaly["tag"] = tags[column]
+            anomaly["score"] = anomaly["value"]
+            found.append(anomaly)
+        return found
+
+    def stats(self):
+        with self._lock:
+            return {"traces": self.traces, "columns": self._columns, "samples": self.n_samples,
+                    "aperture": self.aperture, "resets": self.resets}
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    n_traces, n_samples, aperture = 200, 256, 24
+    step = trace_step()
+    bscan = rng.normal(scale=0.2, size=(n_traces, n_samples))
+    columns = np.arange(n_traces)[:, None]
+    for target, depth in ((60, 80), (140, 150)):
+        arrival = np.sqrt(depth ** 2 + ((columns - target) * step) ** 2)
+        bscan += np.exp(-0.5 * (np.arange(n_samples) - arrival) ** 2)
+    imager = RollingMigration(aperture=aperture, window=n_traces, background=0)
+    for i, trace in enumerate(bscan):
+        imager.push(trace, tag=i)
+    print("batch == incremental:",
+          np.allclose(migrate(bscan, aperture, step)[:n_traces - aperture], imager.image()))
+    print([(a["tag"], a["peak"][1], round(a["score"], 1)) for a in imager.detect(max_regions=4)])
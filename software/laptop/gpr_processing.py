@@ -1,52 +1,329 @@
 """
 laptop/gpr_processing.py
 Processes raw GPR sensor data and extracts potential anomalies.
+SciPy is imported on first use (or ahead of time with preload()): it is most
+of the laptop's startup time and is not needed until the first GPR frame.
+Filters take an optional `out=` array and then work in place with per-thread
+work arrays, so filtering a pooled frame (see shared/buffers.py) allocates no
+trace-sized memory.
 """
 import numpy as np
 import logging
-from scipy.signal import butter, filtfilt
+import threading
+from functools import lru_cache
+from itertools import islice
+from laptop import config
+from laptop.filter_table import BANDPASS_SOS
+from shared.utils import parse_sensor_values, parse_sensor_matrix, normalize_data, threshold_regions
 
 logger = logging.getLogger("GprProcessing")
 logger.setLevel(logging.INFO)
 
-def process_gpr_data(gpr_raw):
+def _signal():
+    """scipy.signal, imported on the first call."""
+    import scipy.signal
+    return scipy.signal
+
+def _ndimage():
+    """scipy.ndimage, imported on the first call."""
+    import scipy.ndimage
+    return scipy.ndimage
+
+_work = threading.local()
+
+def _workspace(name, n):
+    """Reusable per-thread float64 work array of n samples."""
+    arrays = getattr(_work, "arrays", None)
+    if arrays is None:
+        arrays = _work.arrays = {}
+    array = arrays.get(name)
+    if array is None or len(array) < n:
+        array = arrays[name] = np.empty(n)
+    return array[:n]
+
+@lru_cache(maxsize=config.FILTER_CACHE_SIZE)
+def _filtfilt_plan(lowcut, highcut, fs, order):
+    """(sos, steady-state zi, edge padding) of a design for zero-phase filtering into a buffer."""
+    sos = np.ascontiguousarray(design_bandpass(lowcut, highcut, fs, order), dtype=np.float64)
+    ntaps = 2 * len(sos) + 1 - min(int((sos[:, 2] == 0).sum()), int((sos[:, 5] == 0).sum()))
+    return sos, _signal().sosfilt_zi(sos), 3 * ntaps
+
+def _sosfiltfilt_into(plan, data, out):
     """
-    Convert raw GPR data (comma-separated values) to NumPy array and apply filtering.
+    Zero-phase filter of the 1-D trace `data` into the float64 array `out`
+    (which may be `data`); the same result as scipy.signal.sosfiltfilt with
+    its default odd-extension padding. The padded trace and the filter state
+    live in reusable buffers; sosfilt itself returns new arrays.
+    """
+    sos, zi_steady, edge = plan
+    n = len(data)
+    if n <= edge:
+        raise ValueError(f"The length of the input vector x must be greater than padlen, which is {edge}.")
+    ext = _workspace("ext", n + 2 * edge)
+    zi = _workspace("zi", zi_steady.size).reshape(zi_steady.shape)
+    ext[edge:edge + n] = data
+    np.subtract(2 * data[0], data[edge:0:-1], out=ext[:edge])
+    np.subtract(2 * data[-1], data[-2:-edge - 2:-1], out=ext[edge + n:])
+    np.multiply(zi_steady, ext[0], out=zi)
+    forward, _ = _signal().sosfilt(sos, ext, zi=zi)
+    # Back into the workspace, reversed, so only one sosfilt result is alive at a time
+    ext[:] = forward[::-1]
+    del forward
+    np.multiply(zi_steady, ext[0], out=zi)
+    filtered, _ = _signal().sosfilt(sos, ext, zi=zi)
+    out[:] = filtered[n + edge - 1:edge - 1:-1]  # back in time order, padding removed
+    return out
+
+def preload(background=True):
+    """Import SciPy now (in a daemon thread by default) so the first frame does not wait for it."""
+    def load():
+        _signal()
+        _ndimage()
+    if not background:
+        load()
+        return None
+    thread = threading.Thread(target=load, name="scipy-preload", daemon=True)
+    thread.start()
+    return thread
+
+def process_gpr_data(gpr_raw, stream_filter=None, fs=config.GPR_FS, out=None):
+    """
+    Convert raw GPR data (comma-separated values or a NumPy array decoded from
+    a binary frame) to NumPy array and apply filtering.
+    An empty trace (a LiDAR-only frame) gives an empty array.
+    stream_filter: optional BandpassFilter; when given, the trace is treated as
+                   the next chunk of a continuous stream and filtered causally
+                   with state carried over from the previous call.
+    fs: sampling rate of the trace (lower than GPR_FS for decimated traces;
+        the high cutoff is then kept below the Nyquist frequency).
+    out: optional contiguous float64 array of the trace's length (it may be
+         the trace itself) to filter into instead of allocating a new one.
     """
     try:
-        str_values = gpr_raw.split(',')
-        data = np.array([float(val.strip()) for val in str_values if val.strip() != ""])
-        filtered = butter_bandpass_filter(data, lowcut=100, highcut=1000, fs=4000, order=3)
-        logger.info("GPR data processed and filtered")
+        data, malformed = parse_sensor_values(gpr_raw)
+        if malformed:
+            logger.warning(f"Skipped {len(malformed)} malformed GPR values, first: {malformed[0]}")
+        if len(data) == 0:
+            # LiDAR-only frame (the synchronizer gave up waiting for a GPR sample)
+            return np.array([])
+        if stream_filter is not None:
+            filtered = stream_filter.stream(data, out=out)
+        else:
+            filtered = butter_bandpass_filter(data, lowcut=config.GPR_LOWCUT,
+                                              highcut=min(config.GPR_HIGHCUT, 0.45 * fs),
+                                              fs=fs, order=config.GPR_FILTER_ORDER, out=out)
+        logger.debug("GPR data processed and filtered")
         return filtered
     except Exception as e:
         logger.error(f"Failed to process GPR data: {e}")
         return np.array([])
 
-def butter_bandpass_filter(data, lowcut, highcut, fs, order=5):
+def _gain_curve(n_samples, power):
+    """Time-power gain curve t**power, with t counted in samples from 1."""
+    return np.arange(1, n_samples + 1, dtype=np.float64) ** power
+
+def _process_bscan_block(block, sos, gain):
+    """Bandpass, gain and normalize a dewowed, background-removed (traces x samples) block."""
+    block = _signal().sosfiltfilt(sos, block, axis=1)
+    block *= gain
+    return normalize_data(block, axis=1, out=block)
+
+def iter_gpr_bscan(traces, chunk_size=config.GPR_BSCAN_CHUNK,
+                   dewow_window=config.GPR_DEWOW_WINDOW, gain_power=config.GPR_GAIN_POWER):
+    """
+    Process a survey line of GPR traces chunk by chunk.
+    traces: 2-D array (traces x samples) or any iterable of traces
+            (comma-separated strings or 1-D arrays); iterables are consumed
+            lazily so only `chunk_size` raw traces are held at a time.
+    Background removal subtracts the mean trace of the whole line from a 2-D
+    array, and from an iterable the running mean of the traces before each
+    one (the rest is not read yet; the first trace is kept as is). Either way
+    the state is carried across chunks: chunk_size bounds memory but does
+    not change the result.
+    Yields processed (chunk traces x samples) float64 blocks normalized per trace.
     """
-    Apply a Butterworth bandpass filter.
+    sos = design_bandpass(float(config.GPR_LOWCUT), float(config.GPR_HIGHCUT),
+                          float(config.GPR_FS), int(config.GPR_FILTER_ORDER))
+    uniform_filter1d = _ndimage().uniform_filter1d
+    mean_trace = None
+    if isinstance(traces, np.ndarray) and traces.ndim == 2:
+        step = chunk_size or max(len(traces), 1)
+        blocks = (traces[i:i + step] for i in range(0, len(traces), step))
+        if len(traces):
+            # Dewow is linear, so the dewowed mean trace is the mean of the dewowed traces
+            mean_trace = traces.mean(axis=0, dtype=np.float64)
+            mean_trace -= uniform_filter1d(mean_trace, size=dewow_window, mode='nearest')
+    else:
+        iterator = iter(traces)
+        blocks = iter(lambda: list(islice(iterator, chunk_size)) if chunk_size else list(iterator), [])
+    gain = None
+    running_sum, running_count = None, 0
+    for block in blocks:
+        matrix, malformed = parse_sensor_matrix(block)
+        if malformed:
+            logger.warning(f"Skipped {len(malformed)} malformed GPR values, first: {malformed[0]}")
+        if matrix.size == 0:
+            continue
+        if gain is None or len(gain) != matrix.shape[1]:
+            gain = _gain_curve(matrix.shape[1], gain_power)
+        matrix = np.asarray(matrix, dtype=np.float64)
+        block = matrix - uniform_filter1d(matrix, size=dewow_window, axis=1, mode='nearest')  # dewow
+        if mean_trace is not None and len(mean_trace) == block.shape[1]:
+            block -= mean_trace
+        else:
+            if running_sum is None or len(running_sum) != block.shape[1]:
+                running_sum, running_count = np.zeros(block.shape[1]), 0
+            # Sum of all earlier traces, per trace
+            background = np.cumsum(block, axis=0)
+            background += running_sum
+            running_sum = background[-1].copy()
+            background -= block
+            background /= np.maximum(np.arange(running_count, running_count + len(block)), 1)[:, None]
+            running_count += len(block)
+            block -= background
+        yield _process_bscan_block(block, sos, gain)
+
+def process_gpr_bscan(traces, chunk_size=None, dewow_window=config.GPR_DEWOW_WINDOW,
+                      gain_power=config.GPR_GAIN_POWER):
+    """
+    Process many GPR A-scans at once into a B-scan matrix (traces x samples):
+    parse, dewow, background removal, bandpass, gain and per-trace normalization.
+    chunk_size: optional number of traces processed per block to bound memory.
+    Returns an empty array on failure.
     """
     try:
-        nyq = 0.5 * fs
-        low = lowcut / nyq
-        high = highcut / nyq
-        b, a = butter(order, [low, high], btype='band')
-        filtered_data = filtfilt(b, a, data)
+        blocks = list(iter_gpr_bscan(traces, chunk_size, dewow_window, gain_power))
+        if not blocks:
+            return np.empty((0, 0))
+        n_samples = min(block.shape[1] for block in blocks)
+        bscan = np.concatenate([block[:, :n_samples] for block in blocks]) if len(blocks) > 1 else blocks[0]
+        logger.info(f"GPR B-scan processed: {bscan.shape[0]} traces x {bscan.shape[1]} samples")
+        return bscan
+    except Exception as e:
+        logger.error(f"Failed to process GPR B-scan: {e}")
+        return np.empty((0, 0))
+
+@lru_cache(maxsize=config.FILTER_CACHE_SIZE)
+def design_bandpass(lowcut, highcut, fs, order):
+    """
+    Design a Butterworth bandpass in second-order-sections form.
+    Designs in laptop/filter_table.py are used as is; others are computed
+    with scipy.signal.butter. Designs are memoized per (lowcut, highcut, fs,
+    order); the returned array is shared between callers and must not be modified.
+    """
+    table = BANDPASS_SOS.get((lowcut, highcut, fs, order))
+    if table is not None:
+        return np.array(table)
+    nyq = 0.5 * fs
+    sos = _signal().butter(order, [lowcut / nyq, highcut / nyq], btype='band', output='sos')
+    return sos
+
+class BandpassFilter:
+    """
+    Butterworth bandpass filter with a cached SOS design.
+    apply() filters a whole trace offline (zero-phase).
+    stream() filters consecutive chunks causally, carrying the filter state
+    (zi) between calls so chunk boundaries do not produce edge transients.
+    Both take an optional `out=` contiguous float64 array for 1-D data.
+    """
+
+    def __init__(self, lowcut=config.GPR_LOWCUT, highcut=config.GPR_HIGHCUT,
+                 fs=config.GPR_FS, order=config.GPR_FILTER_ORDER):
+        self.design = (float(lowcut), float(highcut), float(fs), int(order))
+        self.sos = design_bandpass(*self.design)
+        self.zi = None
+
+    def apply(self, data, axis=-1, out=None):
+        """Zero-phase filter of a complete trace (or traces along `axis`)."""
+        if out is not None and np.ndim(data) == 1:
+            return _sosfiltfilt_into(_filtfilt_plan(*self.design), data, out)
+        return _signal().sosfiltfilt(self.sos, data, axis=axis)
+
+    def stream(self, chunk, out=None):
+        """Filter the next chunk of a continuous 1-D signal."""
+        chunk = np.asarray(chunk)
+        if chunk.size == 0:
+            return chunk
+        if self.zi is None:
+            # Start in steady state for the first sample to avoid a step transient
+            self.zi = _signal().sosfilt_zi(self.sos) * chunk[0]
+        filtered, self.zi = _signal().sosfilt(self.sos, chunk.astype(np.float64, copy=False), zi=self.zi)
+        if out is not None:
+            out[:] = filtered
+            return out
+        return filtered
+
+    def reset(self):
+        """Forget the streaming state (e.g. at the start of a new survey line)."""
+        self.zi = None
+
+def butter_bandpass_filter(data, lowcut, highcut, fs, order=5, out=None):
+    """
+    Apply a zero-phase Butterworth bandpass filter using a cached design.
+    out: optional contiguous float64 array (may be `data`) to filter into in place.
+    """
+    try:
+        if out is not None:
+            return _sosfiltfilt_into(_filtfilt_plan(float(lowcut), float(highcut), float(fs), int(order)),
+                                     data, out)
+        sos = design_bandpass(float(lowcut), float(highcut), float(fs), int(order))
+        filtered_data = _signal().sosfiltfilt(sos, data)
         return filtered_data
     except Exception as e:
         logger.error(f"Error in bandpass filter: {e}")
         return data
 
-def detect_anomalies(data, threshold=0.8):
+def detect_anomalies(data, threshold=0.8, regions=False, max_regions=None):
     """
     Detect anomalies in the filtered GPR data.
-    Returns indices where data exceeds the threshold.
+    Returns indices where data exceeds the threshold, or with regions=True a
+    list of (start, end, peak) tuples for contiguous runs (see threshold_regions).
     """
     try:
-        anomalies = [i for i, val in enumerate(data) if val > threshold]
-        logger.info(f"Detected anomalies at indices: {anomalies}")
+        if regions:
+            anomalies = threshold_regions(data, threshold, max_regions)
+        else:
+            anomalies = np.flatnonzero(np.asarray(data) > threshold).tolist()
+        logger.debug(f"Detected {len(anomalies)} anomal{'y regions' if regions else 'ous samples'}")
         return anomalies
     except Exception as e:
         logger.error(f"Error detecting anomalies: {e}")
         return []
+
+def detect_anomalies_2d(bscan, threshold=0.8, max_regions=None):
+    """
+    Detect anomalies in a B-scan matrix (traces x samples) with
+    connected-component labeling.
+    Returns a list of dicts with "traces" and "samples" (start, end) inclusive
+    bounds, the "peak" (trace, sample) position, its "value" and region "size".
+    max_regions: keep only the regions with the highest peaks.
+    """
+    try:
+        bscan = np.asarray(bscan)
+        ndimage = _ndimage()
+        labels, count = ndimage.label(bscan > threshold)
+        if count == 0:
+            return []
+        index = np.arange(1, count + 1)
+        peaks = np.asarray(ndimage.maximum(bscan, labels, index))
+        if max_regions is not None and count > max_regions:
+            index = np.sort(index[np.argsort(-peaks, kind='stable')[:max_regions]])
+            peaks = np.asarray(ndimage.maximum(bscan, labels, index))
+        positions = ndimage.maximum_position(bscan, labels, index)
+        sizes = np.bincount(labels.ravel(), minlength=count + 1)
+        slices = ndimage.find_objects(labels)
+        anomalies = []
+        for region, peak, position in zip(index.tolist(), peaks.tolist(), positions):
+            trace_slice, sample_slice = slices[region - 1]
+            anomalies.append({
+                "traces": (trace_slice.start, trace_slice.stop - 1),
+                "samples": (sample_slice.start, sample_slice.stop - 1),
+                "peak": tuple(int(p) for p in position),
+                "value": peak,
+                "size": int(sizes[region]),
+            })
+        logger.debug(f"Detected {len(anomalies)} B-scan anomaly regions")
+        return anomalies
+    except Exception as e:
+        logger.error(f"Error detecting B-scan anomalies: {e}")
+        return []
@@ -4,33 +4,45 @@ Processes raw LiDAR sensor data and extracts useful information.
 """
 import numpy as np
 import logging
+from laptop import config
+from shared.utils import parse_sensor_values, threshold_regions
+from shared import metrics
 
 logger = logging.getLogger("LidarProcessing")
 logger.setLevel(logging.INFO)
 
+payload_log = metrics.Sampler(config.PAYLOAD_LOG_EVERY)
+
 def process_lidar_data(lidar_raw):
     """
     Convert comma-separated string of LiDAR readings to a NumPy array.
+    Arrays decoded from binary frames are used as-is (no copy).
     Applies basic filtering and error handling.
     """
     try:
         # Example: Expecting a string like "1.2,3.4,2.5,..." 
-        str_values = lidar_raw.split(',')
-        points = np.array([float(val.strip()) for val in str_values if val.strip() != ""])
-        logger.info(f"Processed LiDAR data: {points}")
+        points, malformed = parse_sensor_values(lidar_raw)
+        if malformed:
+            logger.warning(f"Skipped {len(malformed)} malformed LiDAR values, first: {malformed[0]}")
+        if payload_log.sample():
+            logger.info(f"Processed LiDAR data: {points}")
         return points
     except Exception as e:
         logger.error(f"Failed to process LiDAR data: {e}")
         return np.array([])
 
-def detect_obstacles(points, threshold=0.5):
+def detect_obstacles(points, threshold=0.5, regions=False, max_regions=None):
     """
     Simple detection of obstacles based on thresholding.
-    Returns list of indices where points exceed threshold.
+    Returns list of indices where points exceed threshold, or with
+    regions=True a list of (start, end, peak) tuples for contiguous runs.
     """
     try:
-        obstacles = [i for i, p in enumerate(points) if p > threshold]
-        logger.info(f"Detected obstacles at indices: {obstacles}")
+        if regions:
+            obstacles = threshold_regions(points, threshold, max_regions)
+        else:
+            obstacles = np.flatnonzero(np.asarray(points) > threshold).tolist()
+        logger.debug(f"Detected {len(obstacles)} obstacle{' regions' if regions else ' points'}")
         return obstacles
     except Exception as e:
         logger.error(f"Error detecting obstacles: {e}")
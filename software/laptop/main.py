@@ -2,6 +2,7 @@
 laptop/main.py
 Main processing loop: subscribes to sensor data, processes it, and sends control commands.
 """
+import os
 import time
 import json
 import logging
@@ -12,62 +13,208 @@ import paho.mqtt.client as mqtt
 from laptop import config
 from laptop.receiver import setup_receiver
 from laptop.lidar_processing import process_lidar_data, detect_obstacles
-from laptop.gpr_processing import process_gpr_data, detect_anomalies
-from laptop.drone_commands import send_drone_command
+from laptop.gpr_processing import process_gpr_data, detect_anomalies, preload
+from laptop.gpr_engine import GprEngine
+from laptop.fleet import Fleet, StatusReporter, DEFAULT_DRONE
+from laptop.drone_commands import send_drone_command, get_publisher
+from laptop.pipeline import AnalysisPipeline
+from laptop.recorder import SurveyRecorder
+from laptop.terrain_map import TerrainMap, LocalFrame
+from laptop.anomaly_index import AnomalyIndex
+from shared import metrics
+from shared.buffers import FramePool
 
 logger = logging.getLogger("LaptopMain")
 logger.setLevel(logging.INFO)
 
-# Shared dictionary to hold the latest sensor data
-shared_data = {"latest_data": None}
+# Per-drone state (queues, streaming GPR filters, decision order) for every
+# drone reporting to this laptop
+fleet = Fleet()
 
-def analyze_and_decide():
+# Received traces are decoded into reusable buffers and filtered in place;
+# a recorder keeps raw frames, so recording decodes into fresh arrays
+frame_pool = FramePool(config.FRAME_POOL_BUFFERS, config.FRAME_POOL_SAMPLES) \
+    if config.FRAME_POOL_BUFFERS and not config.RECORD_SURVEYS else None
+
+# Shared dictionary to hold the latest sensor data (of any drone)
+shared_data = {"latest_data": None, "fleet": fleet, "pool": frame_pool}
+
+# Worker processes for GPR filtering/detection (started in main()); the
+# streaming filter keeps state across frames, so it always runs in-thread
+gpr_engine = GprEngine() if config.GPR_WORKERS and not config.GPR_STREAMING_FILTER else None
+
+# Spatial memory across frames (needs a pose on the frame): LiDAR terrain and
+# georeferenced GPR anomalies, in one local frame
+local_frame = LocalFrame()
+terrain_map = TerrainMap(frame=local_frame)
+anomaly_index = AnomalyIndex(frame=local_frame)
+
+lidar_timer = metrics.stage_timer("lidar")
+gpr_timer = metrics.stage_timer("gpr")
+detect_timer = metrics.stage_timer("detect")
+imaging_timer = metrics.stage_timer("imaging")
+terrain_timer = metrics.stage_timer("terrain")
+frame_age = metrics.histogram("frame_age_seconds", "Sensor capture to drone command")
+decisions = {action: metrics.counter("decisions_total", "Drone commands decided", labels={"action": action})
+             for action in ("hover", "move")}
+
+def decide(data):
     """
-    Analyze the sensor data and decide what drone command to send.
+    Process one sensor frame and return the drone command to send.
     For example, if GPR anomalies are detected, command drone to hover.
     """
-    data = shared_data.get("latest_data", None)
+    lidar_raw = data.get("lidar", "")
+    gpr_raw = data.get("gpr", "")
+    drone = fleet.drone(data.get("drone_id", DEFAULT_DRONE))
+    # Under load the Pi averages GPR samples in blocks (see rpi/rate_control.py)
+    gpr_decimation = data.get("gpr_decimation", 1)
+    gpr_fs = config.GPR_FS / gpr_decimation
+    with lidar_timer.time():
+        lidar_points = process_lidar_data(lidar_raw)
+    if gpr_engine is not None and len(gpr_raw):
+        # Filtering and detection both run in a worker process
+        with gpr_timer.time():
+            gpr_data, anomalies = gpr_engine.process(gpr_raw, fs=gpr_fs)
+        with detect_timer.time():
+            obstacles = detect_obstacles(lidar_points, threshold=0.5, regions=True,
+                                         max_regions=config.MAX_DETECTION_REGIONS)
+    else:
+        with gpr_timer.time():
+            # A decimated trace does not continue the full-rate stream
+            stream_filter = drone.gpr_filter if gpr_decimation == 1 else None
+            # A pooled trace belongs to this frame only, so it is filtered in place
+            out = gpr_raw if frame_pool is not None and frame_pool.owns(gpr_raw) else None
+            gpr_data = process_gpr_data(gpr_raw, stream_filter=stream_filter, fs=gpr_fs, out=out)
+        with detect_timer.time():
+            obstacles = detect_obstacles(lidar_points, threshold=0.5, regions=True,
+                                         max_regions=config.MAX_DETECTION_REGIONS)
+            anomalies = []
+            if drone.gpr_imager is None:
+                anomalies = detect_anomalies(gpr_data, threshold=0.8, regions=True,
+                                             max_regions=config.MAX_DETECTION_REGIONS)
+    obstacle_distance = None
+    pose = data.get("pose")
+    timestamp = data.get("gpr_timestamp", data.get("timestamp", time.time()))
+    if drone.gpr_imager is not None:
+        # Detect on the migrated image; targets are tagged with their own trace's pose and time
+        with imaging_timer.time():
+            anomalies = image_anomalies(drone.gpr_imager, gpr_data, gpr_fs, (pose, timestamp))
+        targets = [(*anomaly["tag"], anomaly["peak"][1], anomaly["score"]) for anomaly in anomalies]
+    else:
+        targets = [(pose, timestamp, peak, float(gpr_data[peak])) for _, _, peak in anomalies]
+    if pose is not None and len(lidar_points):
+        with terrain_timer.time():
+            terrain_map.integrate_scan(lidar_points, pose)
+            obstacle_distance = terrain_map.obstacle_ahead(pose)
+    for target_pose, target_time, sample, value in targets:
+        if target_pose is not None:
+            anomaly_index.insert(target_pose, target_time, sample * gpr_decimation, value)
+    return choose_action(obstacles, anomalies, obstacle_distance)
+
+def image_anomalies(imager, gpr_data, fs, tag):
+    """
+    Add a filtered trace to a drone's migrated B-scan and, every
+    GPR_IMAGE_DETECT_EVERY traces, return the newly focused targets.
+    """
+    if not len(gpr_data):
+        return []
+    imager.push(gpr_data, fs=fs, tag=tag)
+    if imager.traces % config.GPR_IMAGE_DETECT_EVERY:
+        return []
+    return imager.detect()
+
+def choose_action(obstacles, anomalies, obstacle_distance=None):
+    """
+    Map detected obstacles and GPR anomalies to a drone command.
+    obstacle_distance: metres to the nearest obstacle ahead in the terrain map, or None.
+    """
+    # Decision logic: if any anomalies found, hover; otherwise, continue moving forward.
+    if anomalies:
+        decision = {"action": "hover"}
+        logger.debug("Anomaly detected: sending hover command")
+    elif obstacles or obstacle_distance is not None:
+        decision = {"action": "move", "direction": "backward", "speed": 5}
+        logger.debug("Obstacle detected: moving backward")
+    else:
+        decision = {"action": "move", "direction": "forward", "speed": 10}
+        logger.debug("No obstacles: moving forward")
+    decisions[decision["action"]].inc()
+    return decision
+
+def analyze_and_decide(data=None):
+    """
+    Analyze a sensor frame (default: the latest received one), decide what
+    drone command to send and send it to the drone the frame came from.
+    Returns the decision, or None if no command was sent.
+    """
+    if data is None:
+        data = shared_data.get("latest_data", None)
     if data is None:
         logger.warning("No sensor data available for analysis")
-        return
+        return None
 
     try:
-        lidar_raw = data.get("lidar", "")
-        gpr_raw = data.get("gpr", "")
-        lidar_points = process_lidar_data(lidar_raw)
-        obstacles = detect_obstacles(lidar_points, threshold=0.5)
-        
-        gpr_data = process_gpr_data(gpr_raw)
-        anomalies = detect_anomalies(gpr_data, threshold=0.8)
-        
-        # Decision logic: if any anomalies found, hover; otherwise, continue moving forward.
-        if anomalies:
-            decision = {"action": "hover"}
-            logger.info("Anomaly detected: sending hover command")
-        elif obstacles:
-            decision = {"action": "move", "direction": "backward", "speed": 5}
-            logger.info("Obstacle detected: moving backward")
-        else:
-            decision = {"action": "move", "direction": "forward", "speed": 10}
-            logger.info("No obstacles: moving forward")
-            
-        send_drone_command(decision)
+        decision = decide(data)
+        timestamp = data.get("timestamp", time.time())
+        drone = fleet.drone(data.get("drone_id", DEFAULT_DRONE))
+        with drone.lock:
+            if timestamp < drone.last_decision:
+                logger.debug(f"Skipping decision for a frame older than the last command to {drone.drone_id}")
+                return None
+            drone.last_decision = timestamp
+            drone.decisions += 1
+            send_drone_command(decision, topic=drone.command_topic)
+            age = time.time() - timestamp
+            drone.record_lag(age)
+        frame_age.observe(age)
+        return decision
     except Exception as e:
         logger.error(f"Error in decision analysis: {e}")
+        return None
 
 def main():
+    preload()  # import SciPy in the background while connecting
+    metrics.configure(config.METRICS_ENABLED, config.METRICS_PORT, config.METRICS_SUMMARY_INTERVAL)
+    workers = config.ANALYSIS_WORKERS
+    if (config.GPR_STREAMING_FILTER or config.GPR_IMAGING) and workers != 1:
+        logger.warning("Streaming GPR filter/imaging needs in-order frames; using a single analysis worker")
+        workers = 1
+    if gpr_engine is not None:
+        gpr_engine.start()
+    publisher = get_publisher()  # connect before the first decision is due
+    # Workers take frames round-robin across drones
+    pipeline = AnalysisPipeline(analyze_and_decide, workers=workers, queue=fleet.queue)
+    shared_data["queue"] = pipeline.queue
+    recorder = None
+    if config.RECORD_SURVEYS:
+        recorder = SurveyRecorder(os.path.join(config.RECORD_DIR, time.strftime("%Y%m%d-%H%M%S")))
+        shared_data["recorder"] = recorder
+
     # Setup MQTT receiver for sensor data
     client = setup_receiver(shared_data)
     client_thread = threading.Thread(target=client.loop_forever, daemon=True)
     client_thread.start()
-    
+    pipeline.start()
+    # Lag reports let each drone's rate controller shed load
+    status_reporter = StatusReporter(fleet, publisher.publish).start()
+
     logger.info("Laptop main loop started. Waiting for sensor data...")
     try:
         while True:
-            analyze_and_decide()
-            time.sleep(2)  # Frequency of analysis can be adjusted
+            time.sleep(config.STATS_INTERVAL)
+            logger.info(f"Pipeline stats: {pipeline.stats()} Command stats: {publisher.stats()} "
+                        f"Anomalies: {anomaly_index.stats()} Fleet: {fleet.stats()}"
+                        + (f" GPR engine: {gpr_engine.stats()}" if gpr_engine is not None else "")
+                        + (f" Frame pool: {frame_pool.stats()}" if frame_pool is not None else ""))
     except KeyboardInterrupt:
         logger.info("Shutdown signal received. Exiting main loop.")
+        status_reporter.stop()
+        pipeline.stop(timeout=2)
+        publisher.stop()
+        if gpr_engine is not None:
+            gpr_engine.stop()
+        if recorder is not None:
+            recorder.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,156 @@
+"""
+laptop/pipeline.py
+Event-driven analysis pipeline.
+The MQTT receiver pushes every frame into a bounded queue and a pool of
+worker threads analyzes frames as they arrive, instead of polling the
+latest frame on a timer.
+"""
+import time
+import logging
+import threading
+from collections import deque
+import numpy as np
+from laptop import config
+
+logger = logging.getLogger("Pipeline")
+logger.setLevel(logging.INFO)
+
+# Drop policies for a full FrameQueue
+DROP_OLDEST = "drop_oldest"    # discard the oldest queued frame (freshest data wins)
+DROP_NEWEST = "drop_newest"    # discard the incoming frame
+BLOCK = "block"                # make the producer wait for space
+
+
+class FrameQueue:
+    """Bounded FIFO of sensor frames with a configurable drop policy."""
+
+    def __init__(self, maxsize=config.FRAME_QUEUE_SIZE, drop_policy=config.FRAME_DROP_POLICY):
+        if drop_policy not in (DROP_OLDEST, DROP_NEWEST, BLOCK):
+            raise ValueError(f"Unknown drop policy: {drop_policy}")
+        self.maxsize = maxsize
+        self.drop_policy = drop_policy
+        self._frames = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._frames)
+
+    def put(self, frame, timeout=None):
+        """
+        Add a frame. Returns False if a frame (this one or an older one) was
+        dropped, or if the queue is closed or a blocking put timed out.
+        """
+        with self._cond:
+            if self._closed:
+                return False
+            accepted = True
+            if len(self._frames) >= self.maxsize:
+                if self.drop_policy == DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                if self.drop_policy == DROP_OLDEST:
+                    self._frames.popleft()
+                    self.dropped += 1
+                    accepted = False
+                elif not self._cond.wait_for(lambda: len(self._frames) < self.maxsize or self._closed, timeout) \
+                        or self._closed:
+                    self.dropped += 1
+                    return False
+            self._frames.append(frame)
+            self._cond.notify_all()
+            return accepted
+
+    def get(self, timeout=None):
+        """Remove and return the oldest frame, or None on timeout/close."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._frames or self._closed, timeout) or not self._frames:
+                return None
+            frame = self._frames.popleft()
+            self._cond.notify_all()
+            return frame
+
+    def close(self):
+        """Wake all waiters; queued frames can still be drained with get()."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class AnalysisPipeline:
+    """
+    Worker pool that consumes a FrameQueue and calls `handler(frame)` per frame.
+    End-to-end latency (frame["timestamp"] -> handler returned, i.e. decision
+    sent) is recorded per frame. Timestamps come from the sensor node's clock,
+    so the two hosts should be time-synchronized (e.g. NTP/chrony).
+    """
+
+    def __init__(self, handler, workers=config.ANALYSIS_WORKERS, queue=None,
+                 latency_window=config.LATENCY_WINDOW):
+        self.handler = handler
+        self.workers = workers
+        self.queue = queue if queue is not None else FrameQueue()
+        self._latencies = deque(maxlen=latency_window)
+        self._threads = []
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.errors = 0
+
+    def start(self):
+        self._stop_event.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"analysis-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Analysis pipeline started with {self.workers} worker(s)")
+        return self
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        self.queue.close()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        logger.info("Analysis pipeline stopped")
+
+    def submit(self, frame):
+        """Queue a frame for analysis (same as queue.put)."""
+        return self.queue.put(frame)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            frame = self.queue.get(timeout=0.5)
+            if frame is None:
+                continue
+            try:
+                self.handler(frame)
+                ok = True
+            except Exception as e:
+                logger.error(f"Error analyzing frame: {e}")
+                ok = False
+            done = time.time()
+            with self._lock:
+                if ok:
+                    self.processed += 1
+                else:
+                    self.errors += 1
+                timestamp = frame.get("timestamp") if isinstance(frame, dict) else None
+                if ok and timestamp is not None:
+                    self._latencies.append(done - timestamp)
+
+    def stats(self):
+        """Return counters and end-to-end latency percentiles (seconds)."""
+        with self._lock:
+            latencies = np.array(self._latencies)
+            stats = {
+                "processed": self.processed,
+                "errors": self.errors,
+                "dropped": self.queue.dropped,
+                "queued": len(self.queue),
+            }
+        if latencies.size:
+            stats["latency_p50"] = float(np.percentile(latencies, 50))
+            stats["latency_p99"] = float(np.percentile(latencies, 99))
+        return stats
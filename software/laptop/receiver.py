@@ -2,15 +2,60 @@
 laptop/receiver.py
 Handles incoming sensor data from Raspberry Pi.
 This module uses a callback to process messages and passes them to a handler.
+With a Fleet in the userdata, frames are tagged with the drone id taken from
+the topic (drone/<id>/data) and deduplicated per drone. With a FramePool as
+userdata["pool"], binary traces are decoded straight into pooled buffers.
 """
-import json
+import time
 import logging
+import threading
+from collections import deque
 import paho.mqtt.client as mqtt
 from laptop import config
+from shared.message_protocol import parse_message, unpack_messages
+from shared import metrics
 
 logger = logging.getLogger("Receiver")
 logger.setLevel(logging.INFO)
 
+class DuplicateFilter:
+    """
+    Remembers the last `window` frame keys (sequence number, capture timestamp)
+    so frames replayed by the Pi's store-and-forward spool are processed once.
+    The timestamp keeps keys unique when the Pi restarts its sequence counter.
+    """
+
+    def __init__(self, window=config.DEDUPE_WINDOW):
+        self._order = deque()
+        self._seen = set()
+        self._window = window
+        self._lock = threading.Lock()
+        self.duplicates = 0
+
+    def is_duplicate(self, payload):
+        """Return True if this frame was already seen; otherwise remember it."""
+        seq = payload.get("seq")
+        if seq is None:
+            return False
+        key = (seq, payload.get("timestamp"))
+        with self._lock:
+            if key in self._seen:
+                self.duplicates += 1
+                return True
+            self._seen.add(key)
+            self._order.append(key)
+            if len(self._order) > self._window:
+                self._seen.discard(self._order.popleft())
+            return False
+
+duplicate_filter = DuplicateFilter()
+
+frames_received = metrics.counter("frames_received_total", "Sensor frames received")
+duplicate_frames = metrics.counter("frames_duplicate_total", "Replayed frames dropped as duplicates")
+receive_errors = metrics.counter("receive_errors_total", "Messages that failed to unpack or parse")
+parse_timer = metrics.stage_timer("parse")
+payload_log = metrics.Sampler(config.PAYLOAD_LOG_EVERY)
+
 def process_incoming_data(data):
     """
     Process the incoming sensor data.
@@ -18,29 +63,68 @@ def process_incoming_data(data):
     """
     try:
         # Example: Simply log the data; further processing done in main loop
-        logger.info(f"Processing data: {data}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Processing data: {data}")
         return data
     except Exception as e:
         logger.error(f"Error processing data: {e}")
         return None
 
 def on_message(client, userdata, message):
-    """MQTT callback when sensor data is received."""
+    """MQTT callback when sensor data is received.
+    Batched payloads are split transparently and each message is handled in order.
+    """
+    try:
+        messages = unpack_messages(message.payload)
+    except Exception as e:
+        logger.error(f"Failed to unpack incoming batch: {e}")
+        receive_errors.inc()
+        return
+    fleet = userdata.get("fleet") if userdata else None
+    drone = fleet.from_topic(message.topic) if fleet is not None else None
+    for raw in messages:
+        handle_message(raw, userdata, drone)
+
+def handle_message(raw, userdata, drone=None):
+    """
+    Parse one sensor message and hand it to the analysis stage.
+    drone: DroneState of the sending drone (see laptop/fleet.py), if known.
+    """
     try:
-        payload = json.loads(message.payload.decode())
-        logger.info(f"Received data: {payload}")
+        # Accepts both binary frames and JSON; binary traces arrive as NumPy views
+        # of the message, or as pooled float64 buffers the analysis may filter in place
+        with parse_timer.time():
+            payload = parse_message(raw, userdata.get("pool"))
+        if (drone.duplicates if drone is not None else duplicate_filter).is_duplicate(payload):
+            duplicate_frames.inc()
+            logger.debug(f"Dropping duplicate frame #{payload.get('seq')}")
+            return
+        frames_received.inc()
+        if payload_log.sample():
+            logger.info(f"Received data: {payload}")
         processed = process_incoming_data(payload)
         if processed:
+            if drone is not None:
+                processed["drone_id"] = drone.drone_id
+                drone.latest_data = processed
+                drone.last_seen = time.time()
+                drone.frames += 1
             userdata["latest_data"] = processed
+            if userdata.get("recorder") is not None:
+                userdata["recorder"].record(processed)
+            # Event-driven analysis: every frame is queued, not just the latest
+            if userdata.get("queue") is not None:
+                userdata["queue"].put(processed)
     except Exception as e:
         logger.error(f"Failed to process incoming message: {e}")
+        receive_errors.inc()
 
 def setup_receiver(client_userdata=None):
     """Setup the MQTT receiver client."""
     client = mqtt.Client(userdata=client_userdata)
     client.on_message = on_message
     client.connect(config.BROKER_IP, config.MQTT_PORT, keepalive=60)
-    client.subscribe(config.MQTT_DATA_TOPIC)
+    client.subscribe([(config.MQTT_DATA_TOPIC, 0), (config.MQTT_FLEET_DATA_TOPIC, 0)])
     return client
 
 if __name__ == "__main__":
@@ -0,0 +1,246 @@
+"""
+laptop/recorder.py
+Columnar on-disk recording of received sensor frames.
+Each sensor is written as chunked segments of NumPy .npy columns:
+    <sensor>_<n>_values.npy      all samples of the segment, concatenated (float32)
+    <sensor>_<n>_offsets.npy     int64 start offset of every frame (+ end offset)
+    <sensor>_<n>_timestamps.npy  float64 frame timestamp ("timestamp" of the payload)
+    <sensor>_<n>_captured.npy    float64 sensor capture timestamp
+    <sensor>_<n>_seq.npy         int64 frame sequence number
+    <sensor>_<n>_pose.npy        float64 drone pose (POSE_FIELDS + time, NaN if none)
+    <sensor>_<n>_decimation.npy  int64 decimation factor of the trace (1 = full resolution)
+    <sensor>_<n>_drone.npy       unicode id of the sending drone ("" if unknown)
+plus index.json listing the segments with their time range. Frames within a
+segment are stored in (timestamp, seq, drone) order; frames replayed late from the
+drone's spool can still fall in the time range of earlier segments, so
+segments may overlap. Segments can be memory-mapped back with SurveyReader.
+"""
+import os
+import json
+import time
+import heapq
+import queue
+import logging
+import threading
+import numpy as np
+from laptop import config
+from shared.utils import parse_sensor_values
+from shared.message_protocol import POSE_FIELDS
+
+logger = logging.getLogger("Recorder")
+logger.setLevel(logging.INFO)
+
+SENSORS = ("lidar", "gpr")
+INDEX_FILE = "index.json"
+COLUMNS = ("values", "offsets", "timestamps", "captured", "seq", "pose", "decimation", "drone")
+POSE_COLUMNS = POSE_FIELDS + ("time",)
+NO_POSE = (float("nan"),) * len(POSE_COLUMNS)
+
+
+class _SegmentBuilder:
+    """Accumulates one sensor's frames until a segment is written."""
+
+    def __init__(self):
+        self.values, self.timestamps, self.captured, self.seq, self.pose = [], [], [], [], []
+        self.decimation, self.drone = [], []
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, values, timestamp, captured, seq, pose, decimation=1, drone=""):
+        self.values.append(values)
+        self.timestamps.append(timestamp)
+        self.captured.append(captured)
+        self.seq.append(seq)
+        self.pose.append(pose)
+        self.decimation.append(decimation)
+        self.drone.append(drone)
+
+    def columns(self):
+        """The segment's columns, frames sorted by (timestamp, seq, drone)."""
+        timestamps = np.asarray(self.timestamps, dtype=np.float64)
+        seq = np.asarray(self.seq, dtype=np.int64)
+        drone = np.asarray(self.drone, dtype=np.str_)
+        order = np.lexsort((drone, seq, timestamps))
+        frames = [self.values[i] for i in order.tolist()]
+        lengths = np.fromiter((len(v) for v in frames), dtype=np.int64, count=len(frames))
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+        values = np.concatenate(frames).astype(np.float32, copy=False) if frames else np.empty(0, np.float32)
+        return {
+            "values": values,
+            "offsets": offsets,
+            "timestamps": timestamps[order],
+            "captured": np.asarray(self.captured, dtype=np.float64)[order],
+            "seq": seq[order],
+            "pose": np.asarray(self.pose, dtype=np.float64).reshape(-1, len(POSE_COLUMNS))[order],
+            "decimation": np.asarray(self.decimation, dtype=np.int64)[order],
+            "drone": drone[order],
+        }
+
+
+class SurveyRecorder:
+    """
+    Records received payloads into `directory`. record() only enqueues; a
+    writer thread parses frames and writes a segment every `segment_frames`
+    frames per sensor, so the receiver callback is never blocked on disk I/O.
+    """
+
+    def __init__(self, directory, segment_frames=config.RECORD_SEGMENT_FRAMES,
+                 max_queue=config.RECORD_QUEUE_SIZE):
+        self.directory = directory
+        self.segment_frames = segment_frames
+        os.makedirs(directory, exist_ok=True)
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._builders = {sensor: _SegmentBuilder() for sensor in SENSORS}
+        self._segment_ids = {sensor: 0 for sensor in SENSORS}
+        self._index = {"sensors": list(SENSORS), "segments": []}
+        self._thread = threading.Thread(target=self._run, name="survey-recorder", daemon=True)
+        self._thread.start()
+        self.recorded = 0
+        self.dropped = 0
+        logger.info(f"Recording survey to {directory}")
+
+    def record(self, payload):
+        """Queue a parsed payload ({"lidar": ..., "gpr": ..., "timestamp": ...})."""
+        try:
+            self._queue.put_nowait(payload)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        """Write remaining frames and the index."""
+        self._queue.put(None)
+        self._thread.join()
+        for sensor in SENSORS:
+            self._write_segment(sensor)
+        self._write_index()
+        logger.info(f"Recorded {self.recorded} frames to {self.directory} ({self.dropped} dropped)")
+
+    def _run(self):
+        while True:
+            payload = self._queue.get()
+            if payload is None:
+                return
+            try:
+                self._add(payload)
+            except Exception as e:
+                logger.error(f"Error recording frame: {e}")
+
+    def _add(self, payload):
+        timestamp = payload.get("timestamp", time.time())
+        seq = payload.get("seq", -1)
+        pose = payload.get("pose")
+        pose = tuple(pose.get(field, np.nan) for field in POSE_COLUMNS) if pose else NO_POSE
+        for sensor in SENSORS:
+            raw = payload.get(sensor)
+            if raw is None or len(raw) == 0:
+                continue
+            values, _ = parse_sensor_values(raw, dtype=np.float32)
+            builder = self._builders[sensor]
+            builder.add(values, timestamp, payload.get(f"{sensor}_timestamp", timestamp), seq, pose,
+                        payload.get(f"{sensor}_decimation", 1), payload.get("drone_id", ""))
+            if len(builder) >= self.segment_frames:
+                self._write_segment(sensor)
+        self.recorded += 1
+
+    def _write_segment(self, sensor):
+        builder = self._builders[sensor]
+        if not len(builder):
+            return
+        columns = builder.columns()
+        stem = f"{sensor}_{self._segment_ids[sensor]:05d}"
+        for name, column in columns.items():
+            np.save(os.path.join(self.directory, f"{stem}_{name}.npy"), column)
+        self._index["segments"].append({
+            "sensor": sensor,
+            "stem": stem,
+            "frames": len(builder),
+            "start": float(columns["timestamps"].min()),
+            "end": float(columns["timestamps"].max()),
+        })
+        self._segment_ids[sensor] += 1
+        self._builders[sensor] = _SegmentBuilder()
+        self._write_index()
+
+    def _write_index(self):
+        path = os.path.join(self.directory, INDEX_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump(self._index, f, indent=1)
+        os.replace(path + ".tmp", path)
+
+
+class SurveyReader:
+    """Memory-mapped access to a survey written by SurveyRecorder."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, INDEX_FILE)) as f:
+            self.index = json.load(f)
+
+    def segments(self, sensor):
+        return [segment for segment in self.index["segments"] if segment["sensor"] == sensor]
+
+    def load_segment(self, segment):
+        """Return the segment's columns as read-only memory maps (missing columns are skipped)."""
+        columns = {}
+        for name in COLUMNS:
+            path = os.path.join(self.directory, f"{segment['stem']}_{name}.npy")
+            if os.path.exists(path):
+                columns[name] = np.load(path, mmap_mode="r")
+        return columns
+
+    def _segment_frames(self, sensor, segment, start, end):
+        columns = self.load_segment(segment)
+        offsets = columns["offsets"]
+        poses = columns.get("pose")
+        # Surveys recorded before the column existed are full resolution
+        decimation = columns["decimation"].tolist() if "decimation" in columns else None
+        drones = columns["drone"].tolist() if "drone" in columns else [""] * len(columns["seq"])
+        timestamps = columns["timestamps"].tolist()
+        seqs = columns["seq"].tolist()
+        # Identity for segments sorted at flush; also orders surveys recorded before that
+        for i in np.lexsort((np.asarray(drones, dtype=np.str_), columns["seq"], columns["timestamps"])).tolist():
+            timestamp = timestamps[i]
+            if (start is not None and timestamp < start) or (end is not None and timestamp > end):
+                continue
+            pose = None
+            if poses is not None and not np.isnan(poses[i, 0]):
+                pose = dict(zip(POSE_COLUMNS, poses[i].tolist()))
+            yield (timestamp, seqs[i], drones[i], sensor, columns["values"][offsets[i]:offsets[i + 1]],
+                   float(columns["captured"][i]), pose, decimation[i] if decimation is not None else 1)
+
+    def _sensor_frames(self, sensor, start, end):
+        """One sensor's frames in (timestamp, seq, drone) order, merged across (possibly overlapping) segments."""
+        segments = [segment for segment in self.segments(sensor)
+                    if not ((start is not None and segment["end"] < start) or (end is not None and segment["start"] > end))]
+        return heapq.merge(*(self._segment_frames(sensor, segment, start, end) for segment in segments),
+                           key=lambda entry: entry[:3])
+
+    def frames(self, start=None, end=None):
+        """
+        Yield recorded payloads in timestamp order, in the same layout the
+        receiver produces: {"lidar": ndarray, "gpr": ndarray, "timestamp": t,
+        "seq": n, "<sensor>_timestamp": t, "pose": {...}, "drone_id": id}.
+        Sensor arrays are memmap views; "pose" is present only if one was
+        recorded, "<sensor>_decimation" only for decimated traces and
+        "drone_id" only if the sending drone was known.
+        """
+        merged = heapq.merge(*(self._sensor_frames(sensor, start, end) for sensor in SENSORS),
+                             key=lambda entry: entry[:3])
+        frame, key = None, None
+        for timestamp, seq, drone, sensor, values, captured, pose, decimation in merged:
+            if (timestamp, seq, drone) != key:
+                if frame is not None:
+                    yield frame
+                key = (timestamp, seq, drone)
+                frame = {"timestamp": timestamp, "seq": seq}
+                if drone:
+                    frame["drone_id"] = drone
+            frame[sensor] = values
+            frame[f"{sensor}_timestamp"] = captured
+            if pose is not None:
+                frame["pose"] = pose
+            if decimation > 1:
+                frame[f"{sensor}_decimation"] = decimation
+        if frame is not None:
+            yield frame
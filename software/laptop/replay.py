@@ -0,0 +1,83 @@
+"""
+laptop/replay.py
+Replays a survey recorded by laptop/recorder.py through the laptop processing
+chain (LiDAR/GPR processing, detection and the drone decision). Frames keep
+the drone_id they were received with, so each drone of a fleet survey gets
+its own streaming filter, GPR image and decision order.
+
+Usage (from the software/ directory):
+    python -m laptop.replay surveys/20240101-120000            # as fast as possible
+    python -m laptop.replay surveys/20240101-120000 --speed 4  # 4x real time
+    python -m laptop.replay surveys/20240101-120000 --send     # also publish commands
+"""
+import time
+import argparse
+import logging
+from collections import Counter
+from laptop.recorder import SurveyReader
+from laptop.main import decide, analyze_and_decide
+
+logger = logging.getLogger("Replay")
+logger.setLevel(logging.INFO)
+
+
+def replay(directory, speed=0.0, send=False, start=None, end=None):
+    """
+    Stream every recorded frame through decide() (or analyze_and_decide() when
+    `send` is set, which also publishes the commands).
+    speed: 0 replays as fast as possible, otherwise frames are paced at
+           `speed` times the recorded rate.
+    Returns a summary dict with throughput and decision counts.
+    """
+    reader = SurveyReader(directory)
+    handler = analyze_and_decide if send else decide
+    decisions = Counter()
+    durations = []
+    first_recorded = None
+    started = time.perf_counter()
+    for frame in reader.frames(start, end):
+        if speed > 0:
+            if first_recorded is None:
+                first_recorded = frame["timestamp"]
+            delay = (frame["timestamp"] - first_recorded) / speed - (time.perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+        t0 = time.perf_counter()
+        decision = handler(frame)
+        durations.append(time.perf_counter() - t0)
+        decisions[decision["action"] if decision else "none"] += 1
+    elapsed = time.perf_counter() - started
+    durations.sort()
+    summary = {
+        "frames": len(durations),
+        "elapsed": elapsed,
+        "frames_per_sec": len(durations) / elapsed if elapsed > 0 else 0.0,
+        "decisions": dict(decisions),
+    }
+    if durations:
+        summary["latency_p50"] = durations[len(durations) // 2]
+        summary["latency_p99"] = durations[min(len(durations) - 1, int(len(durations) * 0.99))]
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded survey through the processing chain")
+    parser.add_argument("directory", help="Survey directory written by the recorder")
+    parser.add_argument("--speed", type=float, default=0.0,
+                        help="Replay speed relative to the recording (0 = as fast as possible)")
+    parser.add_argument("--send", action="store_true", help="Publish the resulting drone commands")
+    parser.add_argument("--start", type=float, default=None, help="Skip frames before this timestamp")
+    parser.add_argument("--end", type=float, default=None, help="Stop after this timestamp")
+    args = parser.parse_args()
+
+    # The per-frame decision log lines would dominate the replay time
+    logging.getLogger("LaptopMain").setLevel(logging.WARNING)
+    summary = replay(args.directory, speed=args.speed, send=args.send, start=args.start, end=args.end)
+    logger.info(f"Replayed {summary['frames']} frames in {summary['elapsed']:.2f}s "
+                f"({summary['frames_per_sec']:.1f} frames/s)")
+    print(summary)
+
+
+if __name__ == "__main__":
+    logging.basicConfig()
+    main()
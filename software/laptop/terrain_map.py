@@ -0,0 +1,198 @@
+"""
+laptop/terrain_map.py
+Incremental 2.5-D terrain map built from LiDAR scans.
+The map is a sparse set of fixed-size tiles, each holding the highest return
+(metres, same vertical datum as the drone altitude) and the number of returns
+per cell. Tiles are created on first touch and the least recently used tiles
+are evicted beyond max_tiles, so memory stays bounded on large surveys.
+Scans are merged with vectorized scatter operations: the cost of an update is
+proportional to the number of points in the scan, not to the map size.
+
+Poses are dicts in the format attached to sensor frames:
+    {"lat": deg, "lon": deg, "alt": m above home, "yaw": rad, clockwise from north}
+LocalFrame converts them to metres east/north of the first pose seen.
+"""
+import math
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from laptop import config
+
+logger = logging.getLogger("TerrainMap")
+logger.setLevel(logging.INFO)
+
+EARTH_RADIUS = 6371000.0
+
+
+class LocalFrame:
+    """Equirectangular east/north metres relative to a fixed origin (fine over a few km)."""
+
+    def __init__(self, origin_lat=None, origin_lon=None):
+        self.origin = None
+        if origin_lat is not None and origin_lon is not None:
+            self._set_origin(origin_lat, origin_lon)
+
+    def _set_origin(self, lat, lon):
+        self.origin = (lat, lon)
+        self._cos_lat = math.cos(math.radians(lat))
+
+    def to_local(self, lat, lon):
+        """Return (east, north) in metres; the first position seen becomes the origin."""
+        if self.origin is None:
+            self._set_origin(lat, lon)
+        east = math.radians(lon - self.origin[1]) * EARTH_RADIUS * self._cos_lat
+        north = math.radians(lat - self.origin[0]) * EARTH_RADIUS
+        return east, north
+
+    def pose(self, pose):
+        """Pose dict -> (east, north, alt, yaw)."""
+        east, north = self.to_local(pose["lat"], pose["lon"])
+        return east, north, pose.get("alt", 0.0), pose.get("yaw", 0.0)
+
+
+def scan_to_points(ranges, east, north, alt, yaw, fov=math.radians(config.LIDAR_FOV_DEG),
+                   pitch=math.radians(config.LIDAR_MOUNT_PITCH_DEG), max_range=config.LIDAR_MAX_RANGE):
+    """
+    Project a planar LiDAR scan into world coordinates.
+    The scan's beams are spread evenly over `fov`, centred on the heading, in a
+    plane tilted down by `pitch`. Returns an (N, 3) array of east/north/up
+    points; beams with no return (<= 0, non-finite or beyond max_range) are dropped.
+    """
+    ranges = np.asarray(ranges, dtype=np.float64)
+    n = ranges.size
+    if n == 0:
+        return np.empty((0, 3))
+    beam = np.linspace(-fov / 2, fov / 2, n, endpoint=fov < 2 * math.pi) if n > 1 else np.zeros(1)
+    valid = np.isfinite(ranges) & (ranges > 0) & (ranges <= max_range)
+    r, beam = ranges[valid], beam[valid]
+    horizontal = r * math.cos(pitch)
+    bearing = yaw + beam  # clockwise from north
+    points = np.empty((r.size, 3))
+    points[:, 0] = east + horizontal * np.sin(bearing)
+    points[:, 1] = north + horizontal * np.cos(bearing)
+    points[:, 2] = alt - r * math.sin(pitch)
+    return points
+
+
+class TerrainMap:
+    """
+    Tiled height/occupancy grid.
+    cell_size: metres per cell; tile_cells: cells per tile side;
+    max_tiles: tiles kept in memory (least recently updated/queried evicted).
+    frame: LocalFrame shared with other maps so they agree on the origin.
+    All methods are thread-safe.
+    """
+
+    def __init__(self, cell_size=config.TERRAIN_CELL_SIZE, tile_cells=config.TERRAIN_TILE_CELLS,
+                 max_tiles=config.TERRAIN_MAX_TILES, frame=None):
+        self.cell_size = cell_size
+        self.tile_cells = tile_cells
+        self.max_tiles = max_tiles
+        self._tiles = OrderedDict()  # (tile_x, tile_y) -> (heights, hits)
+        self._lock = threading.Lock()
+        self.frame = frame if frame is not None else LocalFrame()
+        self.points_added = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._tiles)
+
+    def _tile(self, key, create):
+        tile = self._tiles.get(key)
+        if tile is not None:
+            self._tiles.move_to_end(key)
+        elif create:
+            tile = (np.full((self.tile_cells, self.tile_cells), -np.inf, dtype=np.float32),
+                    np.zeros((self.tile_cells, self.tile_cells), dtype=np.uint32))
+            self._tiles[key] = tile
+            while len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+                self.evicted += 1
+        return tile
+
+    def _cells(self, east, north):
+        return (np.floor(np.asarray(east) / self.cell_size).astype(np.int64),
+                np.floor(np.asarray(north) / self.cell_size).astype(np.int64))
+
+    def add_points(self, points):
+        """Merge an (N, 3) array of east/north/up points into the map."""
+        points = np.asarray(points)
+        if points.size == 0:
+            return
+        cx, cy = self._cells(points[:, 0], points[:, 1])
+        tx, ty = cx // self.tile_cells, cy // self.tile_cells
+        lx, ly = cx - tx * self.tile_cells, cy - ty * self.tile_cells
+        keys, inverse = np.unique(np.stack((tx, ty), axis=1), axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        # Group the points by tile once (a scan usually touches a handful of tiles)
+        order = np.argsort(inverse, kind="stable")
+        bounds = np.searchsorted(inverse[order], np.arange(len(keys) + 1))
+        heights_in = points[:, 2].astype(np.float32)
+        with self._lock:
+            for i, key in enumerate(map(tuple, keys.tolist())):
+                idx = order[bounds[i]:bounds[i + 1]]
+                heights, hits = self._tile(key, create=True)
+                np.maximum.at(heights, (lx[idx], ly[idx]), heights_in[idx])
+                np.add.at(hits, (lx[idx], ly[idx]), 1)
+            self.points_added += len(points)
+
+    def integrate_scan(self, ranges, pose):
+        """Project a LiDAR scan taken at `pose` (see module docstring) into the map."""
+        east, north, alt, yaw = self.frame.pose(pose)
+        self.add_points(scan_to_points(ranges, east, north, alt, yaw))
+
+    def heights(self, east, north, min_hits=1):
+        """Highest return at each query position (-inf where unknown or below min_hits)."""
+        cx, cy = self._cells(east, north)
+        cx, cy = np.atleast_1d(cx), np.atleast_1d(cy)
+        tx, ty = cx // self.tile_cells, cy // self.tile_cells
+        lx, ly = cx - tx * self.tile_cells, cy - ty * self.tile_cells
+        result = np.full(cx.shape, -np.inf, dtype=np.float32)
+        keys, inverse = np.unique(np.stack((tx, ty), axis=1), axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        with self._lock:
+            for i, key in enumerate(map(tuple, keys.tolist())):
+                tile = self._tile(key, create=False)
+                if tile is None:
+                    continue
+                sel = inverse == i
+                heights, hits = tile
+                values = heights[lx[sel], ly[sel]]
+                values[hits[lx[sel], ly[sel]] < min_hits] = -np.inf
+                result[sel] = values
+        return result
+
+    def obstacle_ahead(self, pose, distance=config.OBSTACLE_LOOKAHEAD, width=config.OBSTACLE_CORRIDOR_WIDTH,
+                       clearance=config.OBSTACLE_CLEARANCE, min_hits=config.TERRAIN_MIN_HITS):
+        """
+        Distance (m) to the nearest mapped cell within `distance` along the
+        heading, inside a corridor `width` m wide, whose terrain reaches within
+        `clearance` m of the drone's altitude; None if the corridor is clear.
+        Cost is proportional to the corridor area, not the map size.
+        """
+        east, north, alt, yaw = self.frame.pose(pose)
+        step = self.cell_size / 2
+        along = np.arange(step, distance + step, step)
+        across = np.arange(-width / 2, width / 2 + step, step)
+        a, c = np.meshgrid(along, across, indexing="ij")
+        sin_yaw, cos_yaw = math.sin(yaw), math.cos(yaw)
+        qe = east + a * sin_yaw + c * cos_yaw
+        qn = north + a * cos_yaw - c * sin_yaw
+        heights = self.heights(qe.ravel(), qn.ravel(), min_hits=min_hits).reshape(a.shape)
+        blocked = np.flatnonzero((heights >= alt - clearance).any(axis=1))
+        return float(along[blocked[0]]) if blocked.size else None
+
+    def stats(self):
+        with self._lock:
+            return {"tiles": len(self._tiles), "points": self.points_added, "evicted": self.evicted,
+                    "memory_bytes": len(self._tiles) * self.tile_cells ** 2 * 8}
+
+
+if __name__ == "__main__":
+    terrain = TerrainMap()
+    pose = {"lat": 47.0, "lon": 8.0, "alt": 10.0, "yaw": 0.0}
+    scan = np.full(360, 30.0)
+    scan[170:190] = 6.0  # wall straight ahead
+    terrain.integrate_scan(scan, pose)
+    print(terrain.stats(), terrain.obstacle_ahead(pose, clearance=8.0))
@@ -15,9 +15,76 @@ SERIAL_BAUDRATE = 115200         # Baud rate for both sensors
 DEFAULT_TAKEOFF_ALTITUDE = 20    # Meters
 DEFAULT_SPEED = 10               # Meters per second
 
+# MAVLink session
+MAVLINK_CONNECTION = "udp:0.0.0.0:14550"  # Flight controller / SITL endpoint
+HEARTBEAT_TIMEOUT = 3            # Seconds without heartbeat before reconnecting
+MAVLINK_RECONNECT_MIN_DELAY = 1  # Seconds; doubles per failed attempt
+MAVLINK_RECONNECT_MAX_DELAY = 30
+COMMAND_ACK_TIMEOUT = 2          # Seconds to wait for COMMAND_ACK
+COMMAND_MAX_AGE = 5              # Seconds a queued command stays valid
+COMMAND_QUEUE_SIZE = 32
+LATENCY_WINDOW = 1000            # Samples kept for latency statistics
+TELEMETRY_RATE_HZ = 10           # Requested GLOBAL_POSITION_INT/ATTITUDE/SYS_STATUS rate (0 = autopilot default)
+TELEMETRY_MAX_AGE = 1.0          # Seconds a position stays valid for tagging sensor frames
+ATTACH_POSE = True               # Attach the latest drone pose to every published frame
+
 # MQTT Topics
-MQTT_DATA_TOPIC = "drone/data"
-MQTT_COMMAND_TOPIC = "drone/commands"
+DRONE_ID = "default"             # Fleet id; other ids use drone/<id>/data and drone/<id>/commands
+MQTT_DATA_TOPIC = "drone/data" if DRONE_ID == "default" else f"drone/{DRONE_ID}/data"
+MQTT_COMMAND_TOPIC = "drone/commands" if DRONE_ID == "default" else f"drone/{DRONE_ID}/commands"
+MQTT_STATUS_TOPIC = "drone/status" if DRONE_ID == "default" else f"drone/{DRONE_ID}/status"  # Laptop lag reports
+MQTT_CLIENT_ID = f"rpi-{DRONE_ID}"  # Unique per drone: the broker drops a session when its id reconnects
+MESSAGE_FORMAT = "binary"        # "binary" (packed frames) or "json"; laptop accepts both
+DATA_QOS = 0                     # MQTT QoS for sensor data
+
+# Sensor data batching/compression
+BATCH_CODEC = "zlib"             # "none", "zlib" or "lz4" (needs the lz4 package)
+DELTA_ENCODING = True            # Delta-encode binary trace values before compression
+BATCH_MIN_FRAMES = 1             # Batch size when the link keeps up
+BATCH_MAX_FRAMES = 32            # Upper bound for the adaptive batch size
+BATCH_MAX_DELAY_MS = 200         # Oldest frame age that forces a flush
+BATCH_BACKLOG_HIGH = 4           # Outstanding publishes that trigger larger batches
+
+# Adaptive sampling (rpi/rate_control.py)
+# Quality levels from best to most degraded: (max frames/s, 0 = as fast as the
+# sensors deliver; GPR sample decimation; LiDAR beam decimation). GPR
+# resolution is given up before frame rate, and frame rate before LiDAR.
+RATE_LEVELS = (
+    (0, 1, 1),
+    (0, 2, 1),
+    (10, 2, 1),
+    (10, 4, 1),
+    (5, 4, 2),
+    (2, 8, 2),
+)
+RATE_UPDATE_INTERVAL = 0.5       # Seconds between load evaluations
+RATE_STEP_DOWN_INTERVAL = 1.0    # Min seconds between two quality reductions
+RATE_STEP_UP_INTERVAL = 5.0      # Seconds of headroom before quality is raised again
+RATE_HEADROOM = 0.6              # Load (fraction of every limit below) that counts as headroom
+RATE_BACKLOG_HIGH = 8            # Outstanding MQTT publishes at full load
+RATE_LAG_HIGH = 1.0              # Laptop processing lag (s) at full load
+RATE_LAPTOP_QUEUE_HIGH = 16      # Frames queued on the laptop at full load
+RATE_CPU_HIGH = 0.85             # Pi CPU utilisation at full load
+RATE_TEMP_BASE = 50.0            # SoC temperature (C) below which heat adds no load
+RATE_TEMP_HIGH = 75.0            # SoC temperature (C) at full load (a Pi 4 throttles at 80)
+RATE_STATUS_MAX_AGE = 5.0        # Seconds a laptop status report stays valid
+CPU_TEMP_PATH = "/sys/class/thermal/thermal_zone0/temp"
+
+# Store-and-forward spool for link outages
+SPOOL_PATH = "/var/tmp/terrasearch/sensor_spool.bin"
+SPOOL_CAPACITY_BYTES = 256 * 1024 * 1024  # Oldest records are evicted beyond this
+SPOOL_DRAIN_RATE = 50            # Max spooled payloads replayed per second
+SPOOL_FLUSH_INTERVAL = 5         # Seconds between forced msync of the spool file
 
 # Other Settings
 SENSOR_READ_TIMEOUT = 2          # Seconds before retrying sensor read
+SENSOR_BUFFER_SIZE = 256         # Samples kept per sensor stream ring buffer
+SENSOR_RECONNECT_INTERVAL = 1    # Seconds to wait after a failed serial read or reopen
+SYNC_TOLERANCE = 0.05            # Max LiDAR/GPR capture-time difference for a pair (s)
+SYNC_MAX_WAIT = 0.5              # Seconds before an unmatched sample is published alone
+
+# Metrics and logging
+METRICS_ENABLED = True           # Collect counters/histograms (near-zero cost when False)
+METRICS_PORT = 9101              # Local Prometheus-text endpoint (0 = disabled)
+METRICS_SUMMARY_INTERVAL = 60    # Seconds between metrics summary log lines (0 = disabled)
+PAYLOAD_LOG_EVERY = 100          # Log one sensor payload in this many (0 = never)
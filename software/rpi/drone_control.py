@@ -2,21 +2,30 @@
 rpi/drone_control.py
 Controls drone movement via MAVLink.
 Includes functions for connecting, takeoff, landing, and sending commands.
+pymavlink is imported on first use (by the session's reader thread): loading
+it takes seconds on a Pi and must not delay the first published sensor frame.
 """
 import time
+import queue
 import logging
-from pymavlink import mavutil
+import threading
+from collections import deque
 from rpi import config
 
 logger = logging.getLogger("DroneControl")
 logger.setLevel(logging.INFO)
 
-def connect_drone(connection_str="udp:0.0.0.0:14550", retry_interval=5, max_retries=5):
+def load_mavutil():
+    """pymavlink.mavutil, imported on the first call."""
+    from pymavlink import mavutil
+    return mavutil
+
+def connect_drone(connection_str=config.MAVLINK_CONNECTION, retry_interval=5, max_retries=5):
     """Connect to the drone via MAVLink with retries."""
     retries = 0
     while retries < max_retries:
         try:
-            drone = mavutil.mavlink_connection(connection_str)
+            drone = load_mavutil().mavlink_connection(connection_str)
             drone.wait_heartbeat(timeout=10)
             logger.info("Drone connected via MAVLink")
             return drone
@@ -32,7 +41,7 @@ def takeoff(drone, altitude=config.DEFAULT_TAKEOFF_ALTITUDE):
         drone.mav.command_long_send(
             drone.target_system,
             drone.target_component,
-            mavutil.mavlink.MAV_CMD_NAV_TAKEOFF,
+            load_mavutil().mavlink.MAV_CMD_NAV_TAKEOFF,
             0, 0, 0, 0, 0, 0, 0, altitude
         )
         logger.info(f"Takeoff command sent to reach altitude {altitude}m")
@@ -45,7 +54,7 @@ def land(drone):
         drone.mav.command_long_send(
             drone.target_system,
             drone.target_component,
-            mavutil.mavlink.MAV_CMD_NAV_LAND,
+            load_mavutil().mavlink.MAV_CMD_NAV_LAND,
             0, 0, 0, 0, 0, 0, 0, 0
         )
         logger.info("Landing command sent")
@@ -59,7 +68,244 @@ def move(drone, direction="forward", speed=config.DEFAULT_SPEED):
     try:
         # Example command: sending a text-based command via MAVLink message
         command_str = f"MOVE {direction.upper()} {speed}"
-        drone.mav.statustext_send(command_str.encode())
+        drone.mav.statustext_send(load_mavutil().mavlink.MAV_SEVERITY_INFO, command_str.encode())
         logger.info(f"Move command sent: {command_str}")
     except Exception as e:
         logger.error(f"Failed to send move command: {e}")
+
+# MAVLink commands acknowledged with COMMAND_ACK, per action (MAV_CMD names,
+# resolved to ids when executed)
+_ACKED_COMMANDS = {
+    "takeoff": "MAV_CMD_NAV_TAKEOFF",
+    "land": "MAV_CMD_NAV_LAND",
+}
+
+class DroneSession:
+    """
+    Long-lived MAVLink session.
+    A reader thread owns the connection: it connects (retrying with
+    exponential backoff), watches heartbeats, reconnects when they stop and
+    routes incoming messages (COMMAND_ACK, and any handler registered with
+    add_message_handler). A dispatcher thread executes queued commands so the
+    MQTT callback only has to call submit().
+    connect_fn: factory for the connection (mavutil.mavlink_connection by
+                default), e.g. to point the session at a simulated endpoint.
+    """
+
+    def __init__(self, connection_str=config.MAVLINK_CONNECTION, connect_fn=None,
+                 heartbeat_timeout=config.HEARTBEAT_TIMEOUT, ack_timeout=config.COMMAND_ACK_TIMEOUT,
+                 max_command_age=config.COMMAND_MAX_AGE):
+        self.connection_str = connection_str
+        self.connect_fn = connect_fn
+        self.heartbeat_timeout = heartbeat_timeout
+        self.ack_timeout = ack_timeout
+        self.max_command_age = max_command_age
+        self.drone = None
+        self.last_heartbeat = 0.0
+        self._connected = threading.Event()
+        self._stop_event = threading.Event()
+        self._commands = queue.Queue(maxsize=config.COMMAND_QUEUE_SIZE)
+        self._handlers = {}
+        self._connect_handlers = []
+        self._acks = {}  # MAV_CMD id -> [Event, COMMAND_ACK message or None]
+        self._lock = threading.Lock()
+        self._latencies = {}  # action -> deque of submit -> done/ack seconds
+        self._threads = []
+        self.stats_counters = {"submitted": 0, "executed": 0, "acked": 0, "rejected": 0,
+                               "ack_timeouts": 0, "expired": 0, "dropped": 0, "reconnects": 0}
+
+    @property
+    def connected(self):
+        return self._connected.is_set()
+
+    def start(self):
+        """Start the connection/reader and dispatcher threads."""
+        if self._threads:
+            return self
+        self._stop_event.clear()
+        for target, name in ((self._reader_loop, "mavlink-reader"), (self._dispatch_loop, "mavlink-dispatch")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._disconnect()
+
+    def wait_connected(self, timeout=None):
+        """Block until a heartbeat has been received. Returns the connection state."""
+        return self._connected.wait(timeout)
+
+    def add_message_handler(self, msg_type, handler):
+        """Call handler(msg) from the reader thread for every message of msg_type."""
+        self._handlers.setdefault(msg_type, []).append(handler)
+
+    def add_connect_handler(self, handler):
+        """Call handler(drone) from the reader thread after every (re)connect."""
+        self._connect_handlers.append(handler)
+
+    def submit(self, command):
+        """
+        Queue a command dict ({"action": "takeoff"/"land"/"move", ...}) without
+        blocking. Returns False if the dispatch queue is full.
+        """
+        try:
+            self._commands.put_nowait((time.monotonic(), command))
+        except queue.Full:
+            self._count("dropped")
+            logger.error(f"Command queue full; dropping command: {command}")
+            return False
+        self._count("submitted")
+        return True
+
+    def _count(self, name):
+        """Increment a stats counter (called from the MQTT, reader and dispatcher threads)."""
+        with self._lock:
+            self.stats_counters[name] += 1
+
+    def _connect(self):
+        connect_fn = self.connect_fn or load_mavutil().mavlink_connection
+        drone = connect_fn(self.connection_str)
+        if drone.wait_heartbeat(timeout=self.heartbeat_timeout) is None:
+            drone.close()
+            raise ConnectionError(f"No heartbeat within {self.heartbeat_timeout}s")
+        self.drone = drone
+        self.last_heartbeat = time.monotonic()
+        self._connected.set()
+        logger.info("Drone connected via MAVLink")
+        for handler in self._connect_handlers:
+            try:
+                handler(drone)
+            except Exception as e:
+                logger.error(f"Error in connect handler: {e}")
+
+    def _disconnect(self):
+        self._connected.clear()
+        drone, self.drone = self.drone, None
+        if drone is not None:
+            try:
+                drone.close()
+            except Exception:
+                pass
+
+    def _reader_loop(self):
+        delay = config.MAVLINK_RECONNECT_MIN_DELAY
+        while not self._stop_event.is_set():
+            drone = self.drone
+            if drone is None:
+                try:
+                    self._connect()
+                    delay = config.MAVLINK_RECONNECT_MIN_DELAY
+                except Exception as e:
+                    logger.error(f"Drone connection failed: {e}. Retrying in {delay}s...")
+                    self._stop_event.wait(delay)
+                    delay = min(delay * 2, config.MAVLINK_RECONNECT_MAX_DELAY)
+                continue
+            try:
+                msg = drone.recv_match(blocking=True, timeout=0.5)
+            except Exception as e:
+                logger.error(f"MAVLink read failed: {e}; reconnecting")
+                self._count("reconnects")
+                self._disconnect()
+                continue
+            now = time.monotonic()
+            if msg is None:
+                if now - self.last_heartbeat > self.heartbeat_timeout:
+                    logger.warning("Drone heartbeat lost; reconnecting")
+                    self._count("reconnects")
+                    self._disconnect()
+                continue
+            self._route(msg, now)
+
+    def _route(self, msg, now):
+        msg_type = msg.get_type()
+        if msg_type == "HEARTBEAT":
+            self.last_heartbeat = now
+        elif msg_type == "COMMAND_ACK":
+            with self._lock:
+                waiter = self._acks.get(msg.command)
+            if waiter is not None:
+                waiter[1] = msg
+                waiter[0].set()
+        for handler in self._handlers.get(msg_type, ()):
+            try:
+                handler(msg)
+            except Exception as e:
+                logger.error(f"Error in {msg_type} handler: {e}")
+
+    def _dispatch_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                submitted, command = self._commands.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            remaining = self.max_command_age - (time.monotonic() - submitted)
+            if not self._connected.wait(max(remaining, 0)) or self.drone is None:
+                self._count("expired")
+                logger.error(f"Dropping stale command (no drone connection): {command}")
+                continue
+            try:
+                self._execute(command, submitted)
+            except Exception as e:
+                logger.error(f"Error executing command {command}: {e}")
+
+    def _execute(self, command, submitted):
+        # stop() or the reader thread may clear self.drone while a command runs
+        drone = self.drone
+        if drone is None:
+            self._count("expired")
+            logger.error(f"Dropping command (drone disconnected): {command}")
+            return
+        action = command.get("action")
+        ack_id = getattr(load_mavutil().mavlink, _ACKED_COMMANDS[action]) if action in _ACKED_COMMANDS else None
+        waiter = None
+        if ack_id is not None:
+            waiter = [threading.Event(), None]
+            with self._lock:
+                self._acks[ack_id] = waiter
+        try:
+            if action == "takeoff":
+                takeoff(drone, command.get("altitude", config.DEFAULT_TAKEOFF_ALTITUDE))
+            elif action == "land":
+                land(drone)
+            elif action == "move":
+                move(drone, direction=command.get("direction", "forward"),
+                     speed=command.get("speed", config.DEFAULT_SPEED))
+            else:
+                logger.warning(f"Unknown command received: {action}")
+                return
+            self._count("executed")
+            if waiter is not None:
+                if not waiter[0].wait(self.ack_timeout):
+                    self._count("ack_timeouts")
+                    logger.warning(f"No COMMAND_ACK for {action} within {self.ack_timeout}s")
+                    return
+                if waiter[1].result == load_mavutil().mavlink.MAV_RESULT_ACCEPTED:
+                    self._count("acked")
+                else:
+                    self._count("rejected")
+                    logger.warning(f"{action} rejected by autopilot: result={waiter[1].result}")
+            self._record_latency(action, time.monotonic() - submitted)
+        finally:
+            if waiter is not None:
+                with self._lock:
+                    if self._acks.get(ack_id) is waiter:
+                        del self._acks[ack_id]
+
+    def _record_latency(self, action, latency):
+        with self._lock:
+            self._latencies.setdefault(action, deque(maxlen=config.LATENCY_WINDOW)).append(latency)
+
+    def stats(self):
+        """Counters plus per-action submit -> sent/acknowledged latency (seconds)."""
+        with self._lock:
+            stats = dict(self.stats_counters, connected=self.connected, queued=self._commands.qsize())
+            for action, latencies in self._latencies.items():
+                ordered = sorted(latencies)
+                stats[f"{action}_latency_p50"] = ordered[len(ordered) // 2]
+                stats[f"{action}_latency_max"] = ordered[-1]
+        return stats
@@ -4,9 +4,10 @@ Interface for reading GPR sensor data.
 Includes reconnection and error-handling logic.
 """
 import serial
-import time
 import logging
+import threading
 from rpi import config
+from rpi.sensor_stream import SensorStream
 
 logger = logging.getLogger("GPR")
 logger.setLevel(logging.INFO)
@@ -50,13 +51,22 @@ class GprReader:
             logger.error(f"Error reading GPR data: {e}")
             return None
 
-def get_gpr_data():
-    reader = GprReader()
-    start_time = time.time()
-    while time.time() - start_time < config.SENSOR_READ_TIMEOUT:
-        data = reader.read_data()
-        if data is not None:
-            return data
-        time.sleep(0.1)
-    logger.error("Timeout reading GPR data")
-    return ""
+_stream = None
+_stream_lock = threading.Lock()
+
+def get_gpr_stream():
+    """Return the shared, already-started GPR stream (created on first use)."""
+    global _stream
+    with _stream_lock:
+        if _stream is None:
+            _stream = SensorStream("GPR", GprReader)
+        return _stream.start()
+
+def get_gpr_data(timeout=config.SENSOR_READ_TIMEOUT):
+    """Return the latest GPR line, waiting up to `timeout` for the first one."""
+    stream = get_gpr_stream()
+    sample = stream.latest() or stream.wait_for(timeout=timeout)
+    if sample is None:
+        logger.error("Timeout reading GPR data")
+        return ""
+    return sample.data
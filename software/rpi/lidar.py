@@ -4,9 +4,10 @@ Interface for reading LiDAR sensor data.
 Provides a robust reader that reconnects on errors.
 """
 import serial
-import time
 import logging
+import threading
 from rpi import config
+from rpi.sensor_stream import SensorStream
 
 logger = logging.getLogger("LiDAR")
 logger.setLevel(logging.INFO)
@@ -50,14 +51,23 @@ class LidarReader:
             logger.error(f"Error reading LiDAR data: {e}")
             return None
 
+_stream = None
+_stream_lock = threading.Lock()
+
+def get_lidar_stream():
+    """Return the shared, already-started LiDAR stream (created on first use)."""
+    global _stream
+    with _stream_lock:
+        if _stream is None:
+            _stream = SensorStream("LiDAR", LidarReader)
+        return _stream.start()
+
 # For ease of use, provide a module-level function
-def get_lidar_data():
-    reader = LidarReader()
-    start_time = time.time()
-    while time.time() - start_time < config.SENSOR_READ_TIMEOUT:
-        data = reader.read_data()
-        if data is not None:
-            return data
-        time.sleep(0.1)
-    logger.error("Timeout reading LiDAR data")
-    return ""
+def get_lidar_data(timeout=config.SENSOR_READ_TIMEOUT):
+    """Return the latest LiDAR line, waiting up to `timeout` for the first one."""
+    stream = get_lidar_stream()
+    sample = stream.latest() or stream.wait_for(timeout=timeout)
+    if sample is None:
+        logger.error("Timeout reading LiDAR data")
+        return ""
+    return sample.data
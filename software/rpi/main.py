@@ -11,9 +11,16 @@ import threading
 import paho.mqtt.client as mqtt
 
 from rpi import config
-from rpi.lidar import get_lidar_data
-from rpi.gpr import get_gpr_data
-from rpi.drone_control import connect_drone, takeoff, land, move
+from rpi.lidar import get_lidar_stream
+from rpi.gpr import get_gpr_stream
+from rpi.drone_control import DroneSession
+from rpi.telemetry import TelemetryCache
+from rpi.sync import SampleSynchronizer
+from rpi.publisher import BatchingPublisher
+from rpi.spool import SpoolBuffer, SpoolDrainer
+from rpi.rate_control import RateController
+from shared.message_protocol import create_payload
+from shared import metrics
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -22,47 +29,106 @@ logger = logging.getLogger("RPI_Main")
 # Global flag for shutdown
 shutdown_flag = False
 
+# Single MAVLink session shared by all incoming commands
+drone_session = DroneSession()
+# Latest position/attitude/battery, read on the session's reader thread
+telemetry = TelemetryCache().attach(drone_session)
+# Publish rate/resolution from link, laptop and CPU load
+rate_controller = RateController()
+
+frames_published = metrics.counter("sensor_frames_published_total", "Sensor frames handed to the publisher")
+unpaired_frames = metrics.counter("sensor_frames_unpaired_total", "Frames published with only one sensor")
+skipped_frames = metrics.counter("sensor_frames_skipped_total", "Frames not published to shed load")
+capture_latency = metrics.histogram("capture_to_publish_seconds", "Sensor capture to publish")
+encode_timer = metrics.stage_timer("encode")
+payload_log = metrics.Sampler(config.PAYLOAD_LOG_EVERY)
+
 def on_command(client, userdata, message):
-    """Callback for processing incoming drone commands."""
+    """Callback for processing incoming drone commands.
+    Commands are queued on the drone session so the MQTT thread never waits
+    for the MAVLink connection.
+    """
     try:
         command = json.loads(message.payload.decode())
         logger.info(f"Received command: {command}")
-        # Connect to drone if not already connected; for production, consider caching connection
-        drone = connect_drone()
-        if command.get("action") == "takeoff":
-            takeoff(drone, command.get("altitude", config.DEFAULT_TAKEOFF_ALTITUDE))
-        elif command.get("action") == "land":
-            land(drone)
-        elif command.get("action") == "move":
-            move(drone, direction=command.get("direction", "forward"), speed=command.get("speed", config.DEFAULT_SPEED))
-        else:
-            logger.warning("Unknown command received")
+        drone_session.submit(command)
     except Exception as e:
         logger.error(f"Error processing command: {e}")
 
+def on_status(client, userdata, message):
+    """Callback for the laptop's processing status, fed to the rate controller."""
+    try:
+        rate_controller.on_status(json.loads(message.payload.decode()))
+    except Exception as e:
+        logger.error(f"Error processing laptop status: {e}")
+
+def frame_payload(pair, seq, controller=rate_controller, telemetry_cache=telemetry, fmt=config.MESSAGE_FORMAT):
+    """Encode one synchronized (lidar, gpr) sample pair (a missing sample is None).
+    Returns (payload, readings, timestamps); payload is None when the rate
+    controller skips the frame to shed load.
+    """
+    readings, timestamps = {}, {}
+    for sensor, sample in zip(("lidar", "gpr"), pair):
+        readings[sensor] = sample.data if sample else ""
+        if sample:
+            timestamps[sensor] = sample.timestamp
+    captured = min(timestamps.values())
+    if not controller.admit(captured):
+        skipped_frames.inc()
+        return None, readings, timestamps
+    pose = telemetry_cache.pose() if config.ATTACH_POSE else None
+    with encode_timer.time():
+        readings, decimation = controller.decimate(readings)
+        payload = create_payload(readings, timestamp=captured, fmt=fmt, seq=seq, timestamps=timestamps,
+                                 delta=config.DELTA_ENCODING, pose=pose, decimation=decimation)
+    return payload, readings, timestamps
+
 def sensor_data_loop(mqtt_client):
-    """Continuously read sensor data and publish via MQTT."""
+    """Publish time-aligned LiDAR/GPR pairs via MQTT as fast as the sensors deliver them.
+    Both sensors are drained concurrently by their own stream threads and
+    paired by capture timestamp, so there is no fixed sleep in this loop.
+    Under load the rate controller skips frames and decimates traces.
+    """
+    synchronizer = SampleSynchronizer().attach(get_lidar_stream(), get_gpr_stream())
+    spool = SpoolBuffer()
+    publisher = BatchingPublisher(mqtt_client, spool=spool).start()
+    drainer = SpoolDrainer(spool, publisher.send_payload, mqtt_client.is_connected).start()
+    rate_controller.attach(publisher)
+    seq = 0
     while not shutdown_flag:
         try:
-            lidar_data = get_lidar_data()
-            gpr_data = get_gpr_data()
-            payload = {
-                "lidar": lidar_data,
-                "gpr": gpr_data,
-                "timestamp": time.time()
-            }
-            mqtt_client.publish(config.MQTT_DATA_TOPIC, json.dumps(payload))
-            logger.info(f"Published sensor data: {payload}")
+            pair = synchronizer.get(timeout=config.SENSOR_READ_TIMEOUT)
+            if pair is None:
+                logger.warning("No sensor data received")
+                continue
+            payload, readings, timestamps = frame_payload(pair, seq)
+            if payload is None:
+                continue
+            publisher.publish(payload)
+            frames_published.inc()
+            if len(timestamps) < 2:
+                unpaired_frames.inc()
+            capture_latency.observe(time.time() - min(timestamps.values()))
+            if payload_log.sample():
+                logger.info(f"Published sensor data #{seq}: {readings}")
+            seq += 1
         except Exception as e:
             logger.error(f"Error in sensor loop: {e}")
-        time.sleep(1)  # Adjust frequency as needed
+    publisher.stop()
+    drainer.stop()
+    spool.close()
 
 def main():
     try:
-        mqtt_client = mqtt.Client("RaspberryPi")
+        metrics.configure(config.METRICS_ENABLED, config.METRICS_PORT, config.METRICS_SUMMARY_INTERVAL)
+        # VERSION2 callbacks: on_command/on_status keep (client, userdata, message);
+        # the publisher's on_publish/on_disconnect accept the extra reason code/properties
+        mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=config.MQTT_CLIENT_ID)
         mqtt_client.connect(config.LAPTOP_IP, config.MQTT_PORT, keepalive=60)
-        mqtt_client.subscribe(config.MQTT_COMMAND_TOPIC)
+        mqtt_client.subscribe([(config.MQTT_COMMAND_TOPIC, 0), (config.MQTT_STATUS_TOPIC, 0)])
+        mqtt_client.message_callback_add(config.MQTT_STATUS_TOPIC, on_status)
         mqtt_client.on_message = on_command
+        drone_session.start()
         
         # Run sensor loop in a separate thread
         sensor_thread = threading.Thread(target=sensor_data_loop, args=(mqtt_client,), daemon=True)
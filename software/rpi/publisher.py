@@ -0,0 +1,187 @@
+"""
+rpi/publisher.py
+Batching, compressing publisher for sensor frames.
+Frames are collected until the batch is full or the oldest frame has waited
+max_delay, then sent as one compressed MQTT message. The batch size adapts to
+the number of publishes the MQTT client has not yet completed.
+"""
+import time
+import logging
+import threading
+import paho.mqtt.client as mqtt
+from rpi import config
+from shared.message_protocol import pack_batch
+
+logger = logging.getLogger("Publisher")
+logger.setLevel(logging.INFO)
+
+
+class BatchingPublisher:
+    """
+    Publishes encoded sensor messages to `topic` in batches.
+    - the target batch size starts at min_frames; it doubles while the publish
+      backlog is at or above backlog_high and shrinks by one frame while the
+      link keeps up, bounded by [min_frames, max_frames]
+    - a batch of one uncompressed message is sent as-is (no envelope)
+    - if `spool` is given, payloads that fail to publish are stored there for
+      later replay instead of being lost
+    Installs its own on_publish and on_disconnect callbacks on `client` to
+    measure the backlog; publishes outstanding at a disconnect are forgotten
+    (they will not complete, and a stale backlog would keep batches large).
+    """
+
+    def __init__(self, client, topic=config.MQTT_DATA_TOPIC, codec=config.BATCH_CODEC,
+                 min_frames=config.BATCH_MIN_FRAMES, max_frames=config.BATCH_MAX_FRAMES,
+                 max_delay=config.BATCH_MAX_DELAY_MS / 1000, backlog_high=config.BATCH_BACKLOG_HIGH,
+                 qos=config.DATA_QOS, spool=None):
+        self.client = client
+        self.spool = spool
+        self.topic = topic
+        self.codec = codec
+        self.min_frames = min_frames
+        self.max_frames = max_frames
+        self.max_delay = max_delay
+        self.backlog_high = backlog_high
+        self.qos = qos
+        self.batch_size = min_frames
+        self._batch = []
+        self._batch_started = 0.0
+        self._in_flight = set()
+        self._early_acks = set()  # mids completed before publish() returned
+        self._publishing = False  # inside client.publish() (on_publish may run from it)
+        # Re-entrant: without a network thread paho completes QoS 0 publishes
+        # (and calls on_publish) from inside client.publish()
+        self._lock = threading.RLock()
+        self._wakeup = threading.Condition(self._lock)
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.client.on_publish = self._on_publish
+        self.client.on_disconnect = self._on_disconnect
+        self.frames = 0
+        self.batches = 0
+        self.bytes_sent = 0
+        self.failed = 0
+        self.spooled = 0
+
+    @property
+    def backlog(self):
+        """Publishes handed to the client but not yet completed."""
+        return len(self._in_flight)
+
+    def start(self):
+        """Start the thread that flushes batches older than max_delay."""
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="batch-flusher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _on_publish(self, client, userdata, mid, *args):
+        # *args: paho's VERSION2 callbacks also pass reason code and properties
+        with self._lock:
+            if mid in self._in_flight:
+                self._in_flight.discard(mid)
+            elif self._publishing:
+                self._early_acks.add(mid)
+
+    def _on_disconnect(self, client, userdata, *args):
+        with self._lock:
+            if self._in_flight:
+                logger.warning(f"Disconnected with {len(self._in_flight)} publishes outstanding; "
+                               f"dropping them from the backlog")
+            self._in_flight.clear()
+
+    def publish(self, message):
+        """Queue one encoded message (JSON string or binary frames)."""
+        with self._wakeup:
+            if not self._batch:
+                self._batch_started = time.monotonic()
+                self._wakeup.notify_all()
+            self._batch.append(message)
+            self.frames += 1
+            if len(self._batch) >= self.batch_size:
+                self._send()
+
+    def flush(self):
+        """Send whatever is batched now."""
+        with self._lock:
+            if self._batch:
+                self._send()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            with self._wakeup:
+                if not self._batch:
+                    self._wakeup.wait(self.max_delay)
+                    continue
+                remaining = self._batch_started + self.max_delay - time.monotonic()
+                if remaining > 0:
+                    self._wakeup.wait(remaining)
+                    continue
+                self._send()
+
+    def _send(self):
+        """Publish the current batch. Called with the lock held so batches leave in order."""
+        batch, self._batch = self._batch, []
+        if len(batch) == 1 and self.codec == "none":
+            payload = batch[0]
+        else:
+            payload = pack_batch(batch, self.codec)
+        if not self.send_payload(payload) and self.spool is not None:
+            try:
+                self.spool.append(payload)
+                self.spooled += 1
+            except Exception as e:
+                logger.error(f"Error spooling sensor batch: {e}")
+        self._adapt()
+
+    def send_payload(self, payload):
+        """Publish an already packed payload. Returns True if the client accepted it."""
+        with self._lock:
+            self._publishing = True
+            try:
+                info = self.client.publish(self.topic, payload, qos=self.qos)
+            except Exception as e:
+                info = None
+                logger.error(f"Error publishing sensor batch: {e}")
+            finally:
+                self._publishing = False
+                early_acks, self._early_acks = self._early_acks, set()
+            if info is None or info.rc != mqtt.MQTT_ERR_SUCCESS:
+                self.failed += 1
+                if info is not None:
+                    logger.error(f"Error publishing sensor batch: {mqtt.error_string(info.rc)}")
+                return False
+            if info.mid not in early_acks:
+                self._in_flight.add(info.mid)
+            self.batches += 1
+            self.bytes_sent += len(payload)
+            return True
+
+    def _adapt(self):
+        backlog = len(self._in_flight)
+        if backlog >= self.backlog_high:
+            self.batch_size = min(self.batch_size * 2, self.max_frames)
+        elif backlog == 0 and self.batch_size > self.min_frames:
+            self.batch_size -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "frames": self.frames,
+                "batches": self.batches,
+                "bytes_sent": self.bytes_sent,
+                "failed": self.failed,
+                "spooled": self.spooled,
+                "backlog": len(self._in_flight),
+                "batch_size": self.batch_size,
+            }
@@ -0,0 +1,227 @@
+"""
+rpi/rate_control.py
+Adaptive sensor publish rate and resolution.
+RateController turns four load signals into a quality level (see
+config.RATE_LEVELS), each normalized so that 1.0 means "at the limit":
+    backlog  MQTT publishes not yet completed by the client
+    laptop   processing lag and queue depth reported by the laptop on the
+             status topic (ignored once older than RATE_STATUS_MAX_AGE)
+    cpu      Pi CPU utilisation (from /proc/stat, else the load average)
+    temp     SoC temperature
+The highest signal drives the level: at 1.0 or more quality drops one level
+(at most once per RATE_STEP_DOWN_INTERVAL); after RATE_STEP_UP_INTERVAL below
+RATE_HEADROOM it rises one level. Levels cap the frame rate and decimate
+traces; GPR is averaged over blocks of samples (a crude anti-alias filter) and
+LiDAR keeps the closest return of each block of beams, so obstacles survive.
+"""
+import os
+import time
+import logging
+import threading
+import numpy as np
+from rpi import config
+from shared.utils import parse_sensor_values
+
+logger = logging.getLogger("RateControl")
+logger.setLevel(logging.INFO)
+
+
+def decimate_mean(values, factor):
+    """Average consecutive blocks of `factor` values (the last block may be shorter)."""
+    values = np.asarray(values, dtype=np.float64)
+    if factor <= 1 or values.size == 0:
+        return values
+    full = values.size // factor * factor
+    reduced = values[:full].reshape(-1, factor).mean(axis=1)
+    if full < values.size:
+        reduced = np.append(reduced, values[full:].mean())
+    return reduced
+
+
+def decimate_min(values, factor):
+    """Minimum of consecutive blocks of `factor` values (the last block may be shorter)."""
+    values = np.asarray(values, dtype=np.float64)
+    if factor <= 1 or values.size == 0:
+        return values
+    return np.minimum.reduceat(values, np.arange(0, values.size, factor))
+
+
+DECIMATORS = {"gpr": decimate_mean, "lidar": decimate_min}
+
+
+class CpuMonitor:
+    """CPU utilisation since the previous call, from /proc/stat (load average elsewhere)."""
+
+    def __init__(self, path="/proc/stat"):
+        self.path = path
+        self._last = None
+
+    def usage(self):
+        try:
+            with open(self.path) as f:
+                fields = [int(v) for v in f.readline().split()[1:]]
+        except (OSError, ValueError):
+            try:
+                return os.getloadavg()[0] / (os.cpu_count() or 1)
+            except OSError:
+                return None
+        idle = fields[3] + (fields[4] if len(fields) > 4 else 0)  # idle + iowait
+        total = sum(fields)
+        last, self._last = self._last, (idle, total)
+        if last is None or total == last[1]:
+            return None
+        return 1.0 - (idle - last[0]) / (total - last[1])
+
+
+def read_temperature(path=config.CPU_TEMP_PATH):
+    """SoC temperature in degrees C, or None if unavailable."""
+    try:
+        with open(path) as f:
+            return int(f.read().strip()) / 1000.0
+    except (OSError, ValueError):
+        return None
+
+
+class RateController:
+    """
+    Picks the publish rate and trace decimation from load feedback.
+    publisher: optional BatchingPublisher whose backlog is monitored.
+    The sensor loop calls admit() per frame and decimate() on admitted
+    readings; on_status() is called with the laptop's status reports.
+    """
+
+    def __init__(self, publisher=None, levels=config.RATE_LEVELS, update_interval=config.RATE_UPDATE_INTERVAL,
+                 step_down_interval=config.RATE_STEP_DOWN_INTERVAL, step_up_interval=config.RATE_STEP_UP_INTERVAL,
+                 headroom=config.RATE_HEADROOM):
+        self.publisher = publisher
+        self.levels = levels
+        self.update_interval = update_interval
+        self.step_down_interval = step_down_interval
+        self.step_up_interval = step_up_interval
+        self.headroom = headroom
+        self.level = 0
+        self.cpu = CpuMonitor()
+        self._status = None  # (laptop status dict, monotonic receive time)
+        self._loads = {}
+        self._lock = threading.Lock()
+        self._next_update = 0.0
+        self._last_change = float("-inf")
+        self._headroom_since = None
+        self._last_admitted = float("-inf")
+        self.admitted = 0
+        self.skipped = 0
+        self.changes = 0
+
+    def attach(self, publisher):
+        self.publisher = publisher
+        return self
+
+    def on_status(self, status):
+        """Record a laptop status report ({"lag": s, "queued": n, ...})."""
+        self._status = (status, time.monotonic())
+
+    @property
+    def max_rate(self):
+        return self.levels[self.level][0]
+
+    @property
+    def decimation(self):
+        """Current {sensor: factor}."""
+        _, gpr, lidar = self.levels[self.level]
+        return {"gpr": gpr, "lidar": lidar}
+
+    def loads(self):
+        """Current normalized load per signal (1.0 = at the limit)."""
+        loads = {}
+        if self.publisher is not None:
+            loads["backlog"] = self.publisher.backlog / config.RATE_BACKLOG_HIGH
+        status = self._status
+        if status is not None and time.monotonic() - status[1] <= config.RATE_STATUS_MAX_AGE:
+            report = status[0]
+            loads["laptop"] = max(float(report.get("lag") or 0.0) / config.RATE_LAG_HIGH,
+                                  float(report.get("queued") or 0) / config.RATE_LAPTOP_QUEUE_HIGH)
+        cpu = self.cpu.usage()
+        if cpu is not None:
+            loads["cpu"] = cpu / config.RATE_CPU_HIGH
+        temperature = read_temperature()
+        if temperature is not None:
+            loads["temp"] = max(0.0, (temperature - config.RATE_TEMP_BASE)
+                                / (config.RATE_TEMP_HIGH - config.RATE_TEMP_BASE))
+        return loads
+
+    def update(self, now=None):
+        """Re-evaluate the load (at most every update_interval) and step the level."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if now < self._next_update:
+                return self.level
+            self._next_update = now + self.update_interval
+            self._loads = self.loads()
+            load = max(self._loads.values(), default=0.0)
+            if load >= 1.0:
+                self._headroom_since = None
+                if self.level < len(self.levels) - 1 and now - self._last_change >= self.step_down_interval:
+                    self._set_level(self.level + 1, now, load)
+            elif load < self.headroom:
+                if self._headroom_since is None:
+                    self._headroom_since = now
+                if self.level > 0 and now - max(self._headroom_since, self._last_change) >= self.step_up_interval:
+                    self._set_level(self.level - 1, now, load)
+            else:
+                self._headroom_since = None
+            return self.level
+
+    def _set_level(self, level, now, load):
+        direction = "Reducing" if level > self.level else "Raising"
+        self.level = level
+        self._last_change = now
+        self.changes += 1
+        max_rate, gpr, lidar = self.levels[level]
+        logger.info(f"{direction} sensor quality to level {level} (load {load:.2f} {self._loads}): "
+                    f"max rate {max_rate or 'sensor'} fps, GPR 1/{gpr}, LiDAR 1/{lidar}")
+
+    def admit(self, captured=None):
+        """Return True if a frame captured now (or at `captured`) should be published."""
+        self.update()
+        max_rate = self.max_rate
+        now = time.time() if captured is None else captured
+        if max_rate and now - self._last_admitted < 1.0 / max_rate:
+            self.skipped += 1
+            return False
+        self._last_admitted = now
+        self.admitted += 1
+        return True
+
+    def decimate(self, readings):
+        """Return (readings, decimation) with every trace reduced for the current level."""
+        decimation = self.decimation
+        if all(factor <= 1 for factor in decimation.values()):
+            return readings, None
+        reduced = {}
+        for sensor, values in readings.items():
+            factor = decimation.get(sensor, 1)
+            if factor > 1 and len(values):
+                values, _ = parse_sensor_values(values)
+                values = DECIMATORS[sensor](values, factor)
+            reduced[sensor] = values
+        return reduced, decimation
+
+    def stats(self):
+        with self._lock:
+            return {"level": self.level, "max_rate": self.max_rate, "decimation": self.decimation,
+                    "loads": {name: round(load, 2) for name, load in self._loads.items()},
+                    "admitted": self.admitted, "skipped": self.skipped, "changes": self.changes}
+
+
+if __name__ == "__main__":
+    class Backlog:
+        backlog = 0
+
+    publisher = Backlog()
+    controller = RateController(publisher, update_interval=0, step_down_interval=0, step_up_interval=0.2)
+    for backlog in (0, 20, 20, 20, 0, 0, 0):
+        publisher.backlog = backlog
+        controller.update()
+        time.sleep(0.25)
+    readings, decimation = controller.decimate({"lidar": "5,1,7,8", "gpr": "1,2,3,4,5"})
+    print(controller.stats(), readings, decimation)
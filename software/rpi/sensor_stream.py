@@ -0,0 +1,148 @@
+"""
+rpi/sensor_stream.py
+Long-lived, background-drained sensor streams.
+A single thread per serial port keeps the reader open and pushes every line
+into a bounded ring buffer, so callers never wait on port setup.
+"""
+import time
+import logging
+import threading
+from collections import deque, namedtuple
+from rpi import config
+
+logger = logging.getLogger("SensorStream")
+logger.setLevel(logging.INFO)
+
+# One captured line from a sensor. `seq` increases monotonically per stream and
+# `timestamp` is taken right after the line was read from the port.
+SensorSample = namedtuple("SensorSample", ["seq", "timestamp", "data"])
+
+
+class SensorStream:
+    """
+    Owns one sensor reader and drains it from a background thread.
+    reader_factory: callable returning an object with a read_data() method
+                    (e.g. LidarReader or GprReader). It is called inside the
+                    drain thread so opening the port never blocks the caller.
+    """
+
+    def __init__(self, name, reader_factory, buffer_size=config.SENSOR_BUFFER_SIZE,
+                 reconnect_interval=config.SENSOR_RECONNECT_INTERVAL):
+        self.name = name
+        self.reader_factory = reader_factory
+        self.reconnect_interval = reconnect_interval
+        self._buffer = deque(maxlen=buffer_size)
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._next_seq = 0
+        self._subscribers = []
+        self.overwritten = 0  # samples evicted from the ring buffer
+
+    def start(self):
+        """Start the drain thread (no-op if already running)."""
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=f"{self.name}-stream", daemon=True)
+        self._thread.start()
+        logger.info(f"{self.name} stream started")
+        return self
+
+    def stop(self, timeout=None):
+        """Signal the drain thread to exit and wait for it."""
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        logger.info(f"{self.name} stream stopped")
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive() and not self._stop_event.is_set()
+
+    def _run(self):
+        reader = None
+        while not self._stop_event.is_set():
+            if reader is None:
+                try:
+                    reader = self.reader_factory()
+                except Exception as e:
+                    logger.error(f"Failed to create {self.name} reader: {e}")
+                    self._stop_event.wait(self.reconnect_interval)
+                    continue
+            try:
+                line = reader.read_data()
+            except Exception as e:
+                logger.error(f"Error reading {self.name} data: {e}")
+                line = None
+            if line is None:
+                # Port unavailable or read failed: back off instead of spinning.
+                # A failing readline() can return at once, so always wait.
+                self._stop_event.wait(self.reconnect_interval)
+                continue
+            self._push(line)
+
+    def subscribe(self, callback):
+        """Call callback(sample) from the drain thread for every new sample."""
+        self._subscribers.append(callback)
+
+    def _push(self, line):
+        sample = SensorSample(self._next_seq, time.time(), line)
+        with self._cond:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.overwritten += 1
+            self._buffer.append(sample)
+            self._next_seq += 1
+            self._cond.notify_all()
+        for callback in self._subscribers:
+            try:
+                callback(sample)
+            except Exception as e:
+                logger.error(f"Error in {self.name} subscriber: {e}")
+        return sample
+
+    def latest(self):
+        """Return the most recent SensorSample without blocking, or None."""
+        try:
+            return self._buffer[-1]
+        except IndexError:
+            return None
+
+    def wait_for(self, after_seq=-1, timeout=None):
+        """
+        Block until a sample newer than `after_seq` is available.
+        Returns the oldest such sample still buffered, or None on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._buffer and self._buffer[-1].seq > after_seq:
+                    oldest = self._buffer[0].seq
+                    if oldest > after_seq:
+                        return self._buffer[0]
+                    return self._buffer[after_seq + 1 - oldest]
+                if self._stop_event.is_set():
+                    return None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def samples(self, timeout=None):
+        """
+        Generator yielding every buffered sample in order, then new ones as they
+        arrive. If the consumer falls further behind than the buffer size the
+        oldest samples are skipped. Stops on timeout or when the stream stops.
+        """
+        last_seq = -1
+        while True:
+            sample = self.wait_for(last_seq, timeout)
+            if sample is None:
+                return
+            last_seq = sample.seq
+            yield sample
+
+    def __iter__(self):
+        return self.samples()
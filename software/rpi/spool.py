@@ -0,0 +1,229 @@
+"""
+rpi/spool.py
+Disk-backed store-and-forward buffer for sensor payloads.
+Payloads that cannot be published (broker unreachable, link down) are appended
+to a memory-mapped ring file and replayed by a rate-limited drainer once the
+link returns. The file survives restarts; when full, the oldest records are
+evicted first.
+"""
+import os
+import mmap
+import time
+import zlib
+import struct
+import logging
+import threading
+from rpi import config
+
+logger = logging.getLogger("Spool")
+logger.setLevel(logging.INFO)
+
+# File header: magic, capacity of the data region, head/tail as logical
+# (ever-increasing) byte offsets, next record sequence number, record count
+SPOOL_MAGIC = b"TSSP0002"
+SPOOL_HEADER = struct.Struct("<8sQQQQQ")
+HEADER_SIZE = 64
+# Record header: magic, payload length, CRC32 of the payload, record sequence number
+RECORD_MAGIC = b"TSRC"
+RECORD_HEADER = struct.Struct("<4sIIQ")
+
+
+class SpoolBuffer:
+    """
+    Append-only ring of framed records in a memory-mapped file.
+    Writes are plain memory copies; the OS flushes pages in the background and
+    flush() forces them out. All methods take an internal lock.
+    """
+
+    def __init__(self, path=config.SPOOL_PATH, capacity=config.SPOOL_CAPACITY_BYTES):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        size = os.fstat(self._fd).st_size
+        existing = None
+        if size >= HEADER_SIZE:
+            existing = SPOOL_HEADER.unpack(os.pread(self._fd, SPOOL_HEADER.size, 0))
+        if existing is not None and existing[0] == SPOOL_MAGIC and existing[1] == capacity \
+                and size == HEADER_SIZE + capacity:
+            _, self.capacity, self.head, self.tail, self.next_seq, self.count = existing
+            self._map = mmap.mmap(self._fd, HEADER_SIZE + capacity)
+            if self.count:
+                logger.info(f"Recovered {self.count} spooled records from {path}")
+        else:
+            if existing is not None:
+                logger.warning(f"Spool file {path} has a different layout; starting empty")
+            os.ftruncate(self._fd, HEADER_SIZE + capacity)
+            self.capacity = capacity
+            self.head = self.tail = self.next_seq = self.count = 0
+            self._map = mmap.mmap(self._fd, HEADER_SIZE + capacity)
+            self._write_header()
+        self.evicted = 0
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def used_bytes(self):
+        return self.head - self.tail
+
+    def _write_header(self):
+        SPOOL_HEADER.pack_into(self._map, 0, SPOOL_MAGIC, self.capacity, self.head,
+                               self.tail, self.next_seq, self.count)
+
+    def _write(self, offset, data):
+        """Copy data into the ring at a logical offset, wrapping at the end."""
+        pos = offset % self.capacity
+        first = min(len(data), self.capacity - pos)
+        self._map[HEADER_SIZE + pos:HEADER_SIZE + pos + first] = data[:first]
+        if first < len(data):
+            self._map[HEADER_SIZE:HEADER_SIZE + len(data) - first] = data[first:]
+
+    def _read(self, offset, size):
+        pos = offset % self.capacity
+        first = min(size, self.capacity - pos)
+        data = self._map[HEADER_SIZE + pos:HEADER_SIZE + pos + first]
+        if first < size:
+            data += self._map[HEADER_SIZE:HEADER_SIZE + size - first]
+        return data
+
+    def _oldest_header(self):
+        """
+        Return (length, crc, seq) of the oldest record, or None after dropping
+        every record if its header cannot be trusted (bad magic, length out of
+        bounds or an unexpected sequence number): the next record cannot be
+        located then.
+        """
+        magic, length, crc, seq = RECORD_HEADER.unpack(self._read(self.tail, RECORD_HEADER.size))
+        if magic != RECORD_MAGIC or length > self.head - self.tail - RECORD_HEADER.size \
+                or seq != self.next_seq - self.count:
+            logger.error(f"Corrupt spool record header at offset {self.tail}; "
+                         f"dropping {self.count} spooled records")
+            self.tail, self.count = self.head, 0
+            self._write_header()
+            return None
+        return length, crc, seq
+
+    def _evict_oldest(self):
+        header = self._oldest_header()
+        if header is None:
+            return
+        self.tail += RECORD_HEADER.size + header[0]
+        self.count -= 1
+        self.evicted += 1
+
+    def append(self, payload):
+        """Store a payload (bytes or str). Returns its record sequence number."""
+        if isinstance(payload, str):
+            payload = payload.encode()
+        size = RECORD_HEADER.size + len(payload)
+        if size > self.capacity:
+            raise ValueError(f"Payload of {len(payload)} bytes exceeds spool capacity")
+        with self._lock:
+            while self.capacity - (self.head - self.tail) < size:
+                self._evict_oldest()
+            seq = self.next_seq
+            self._write(self.head, RECORD_HEADER.pack(RECORD_MAGIC, len(payload), zlib.crc32(payload), seq))
+            self._write(self.head + RECORD_HEADER.size, payload)
+            self.head += size
+            self.next_seq += 1
+            self.count += 1
+            self._write_header()
+            return seq
+
+    def peek(self):
+        """
+        Return (seq, payload) of the oldest record without removing it, or None.
+        Corrupt records (CRC mismatch, e.g. after a crash mid-write) are dropped
+        one at a time; the spool is only reset when a record header cannot be
+        trusted (see _oldest_header).
+        """
+        with self._lock:
+            while self.count:
+                header = self._oldest_header()
+                if header is None:
+                    break
+                length, crc, seq = header
+                payload = self._read(self.tail + RECORD_HEADER.size, length)
+                if zlib.crc32(payload) == crc:
+                    return seq, payload
+                logger.error(f"Dropping corrupt spool record {seq} (CRC mismatch)")
+                self.tail += RECORD_HEADER.size + length
+                self.count -= 1
+                self._write_header()
+            return None
+
+    def pop(self, seq):
+        """Remove the oldest record if it is still `seq` (it may have been evicted)."""
+        with self._lock:
+            header = self._oldest_header() if self.count else None
+            if header is not None and header[2] == seq:
+                self.tail += RECORD_HEADER.size + header[0]
+                self.count -= 1
+                self._write_header()
+
+    def flush(self):
+        with self._lock:
+            self._map.flush()
+
+    def close(self):
+        with self._lock:
+            self._map.flush()
+            self._map.close()
+            os.close(self._fd)
+
+
+class SpoolDrainer:
+    """
+    Replays spooled payloads through `send(payload) -> bool` whenever
+    `link_up()` is true, at most `rate` records per second.
+    """
+
+    def __init__(self, spool, send, link_up, rate=config.SPOOL_DRAIN_RATE,
+                 flush_interval=config.SPOOL_FLUSH_INTERVAL):
+        self.spool = spool
+        self.send = send
+        self.link_up = link_up
+        self.rate = rate
+        self.flush_interval = flush_interval
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.replayed = 0
+
+    def start(self):
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="spool-drainer", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.spool.flush()
+
+    def _run(self):
+        interval = 1.0 / self.rate
+        last_flush = time.monotonic()
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            if now - last_flush >= self.flush_interval:
+                self.spool.flush()
+                last_flush = now
+            record = self.spool.peek() if self.link_up() else None
+            if record is None:
+                self._stop_event.wait(0.5)
+                continue
+            seq, payload = record
+            if self.send(payload):
+                self.spool.pop(seq)
+                self.replayed += 1
+                if self.replayed % 100 == 0:
+                    logger.info(f"Replayed {self.replayed} spooled payloads, {len(self.spool)} left")
+                self._stop_event.wait(interval)
+            else:
+                self._stop_event.wait(1.0)
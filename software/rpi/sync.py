@@ -0,0 +1,103 @@
+"""
+rpi/sync.py
+Pairs LiDAR and GPR samples by capture time.
+Both sensor streams are drained concurrently by their own threads; the
+synchronizer matches each sample with the nearest sample of the other sensor
+within a tolerance, so a published payload describes one instant.
+"""
+import time
+import logging
+import threading
+from collections import deque
+from rpi import config
+
+logger = logging.getLogger("SensorSync")
+logger.setLevel(logging.INFO)
+
+
+class SampleSynchronizer:
+    """
+    Nearest-timestamp matcher for two sensor streams.
+    tolerance: maximum capture-time difference (seconds) for a pair.
+    max_wait: a sample that found no partner after this long (e.g. because the
+              other sensor is down) is emitted on its own with None for the
+              other sensor, so one failed sensor does not stall publishing.
+    Pairs are (lidar_sample, gpr_sample) SensorSample tuples.
+    """
+
+    def __init__(self, tolerance=config.SYNC_TOLERANCE, max_wait=config.SYNC_MAX_WAIT,
+                 max_pending=config.SENSOR_BUFFER_SIZE):
+        self.tolerance = tolerance
+        self.max_wait = max_wait
+        self._pending = {"lidar": deque(maxlen=max_pending), "gpr": deque(maxlen=max_pending)}
+        self._pairs = deque(maxlen=max_pending)
+        self._cond = threading.Condition()
+        self.paired = 0
+        self.unpaired = 0
+
+    def attach(self, lidar_stream, gpr_stream):
+        """Feed the synchronizer from two SensorStreams."""
+        lidar_stream.subscribe(lambda sample: self.push("lidar", sample))
+        gpr_stream.subscribe(lambda sample: self.push("gpr", sample))
+        return self
+
+    def push(self, sensor, sample):
+        """Add a sample from `sensor` ("lidar" or "gpr")."""
+        with self._cond:
+            self._pending[sensor].append(sample)
+            self._match(time.time())
+            if self._pairs:
+                self._cond.notify_all()
+
+    def _emit(self, lidar, gpr):
+        self._pairs.append((lidar, gpr))
+        if lidar is not None and gpr is not None:
+            self.paired += 1
+        else:
+            self.unpaired += 1
+
+    def _match(self, now):
+        lidar, gpr = self._pending["lidar"], self._pending["gpr"]
+        while lidar and gpr:
+            # The earliest pending sample can only pair with the other head
+            first, other = (lidar, gpr) if lidar[0].timestamp <= gpr[0].timestamp else (gpr, lidar)
+            gap = other[0].timestamp - first[0].timestamp
+            if gap > self.tolerance or (len(first) > 1 and abs(first[1].timestamp - other[0].timestamp) < gap):
+                # No partner in range, or the next sample is a closer partner
+                sample = first.popleft()
+                self._emit(*((sample, None) if first is lidar else (None, sample)))
+                continue
+            if len(first) == 1 and now < other[0].timestamp + gap:
+                break  # a closer partner for other[0] may still arrive
+            self._emit(lidar.popleft(), gpr.popleft())
+        for sensor, pending in self._pending.items():
+            while pending and now - pending[0].timestamp > self.max_wait:
+                sample = pending.popleft()
+                self._emit(*((sample, None) if sensor == "lidar" else (None, sample)))
+
+    def get(self, timeout=None):
+        """Return the next (lidar, gpr) pair, or None on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not self._pairs:
+                self._match(time.time())
+                if self._pairs:
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                # Wake up periodically to release deferred and timed-out samples
+                wait = self.tolerance if any(self._pending.values()) else self.max_wait
+                self._cond.wait(wait if remaining is None else min(remaining, wait))
+            return self._pairs.popleft()
+
+    def pairs(self, timeout=None):
+        """Generator of (lidar, gpr) pairs; stops after `timeout` without one."""
+        while True:
+            pair = self.get(timeout)
+            if pair is None:
+                return
+            yield pair
+
+    def __iter__(self):
+        return self.pairs()
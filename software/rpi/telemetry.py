@@ -0,0 +1,117 @@
+"""
+rpi/telemetry.py
+Latest-state cache of drone telemetry read from the MAVLink session.
+GLOBAL_POSITION_INT, ATTITUDE and SYS_STATUS are handled on the DroneSession
+reader thread (the single owner of the connection). Every update builds a new
+immutable snapshot and swaps it in with one reference assignment, so readers
+such as the sensor loop never take a lock and always see a consistent state.
+pymavlink is only imported (lazily, see rpi/drone_control.py) once connected.
+"""
+import time
+import math
+import logging
+from collections import namedtuple
+from rpi import config
+from rpi.drone_control import load_mavutil
+
+logger = logging.getLogger("Telemetry")
+logger.setLevel(logging.INFO)
+
+# Units: degrees, metres (alt: above home, alt_msl: above mean sea level),
+# radians (yaw clockwise from north, 0..2pi), m/s, volts, amperes, percent.
+# position_time/attitude_time/battery_time: time.time() of the last update.
+TelemetrySnapshot = namedtuple("TelemetrySnapshot", [
+    "lat", "lon", "alt", "alt_msl", "vx", "vy", "vz", "position_time",
+    "roll", "pitch", "yaw", "attitude_time",
+    "battery_voltage", "battery_current", "battery_remaining", "battery_time",
+    "pose",
+], defaults=(None,) * 17)
+
+# Handled messages, streamed with SET_MESSAGE_INTERVAL
+STREAMED_MESSAGES = ("GLOBAL_POSITION_INT", "ATTITUDE", "SYS_STATUS")
+
+
+class TelemetryCache:
+    """
+    Keeps the latest TelemetrySnapshot.
+    rate_hz: stream rate requested from the autopilot for each message (0 = leave as is).
+    max_age: pose() returns None when the position is older than this (seconds).
+    """
+
+    def __init__(self, rate_hz=config.TELEMETRY_RATE_HZ, max_age=config.TELEMETRY_MAX_AGE):
+        self.rate_hz = rate_hz
+        self.max_age = max_age
+        self._snapshot = TelemetrySnapshot()
+        self.updates = 0
+
+    def attach(self, session):
+        """Register the message handlers (and stream requests) on a DroneSession."""
+        session.add_message_handler("GLOBAL_POSITION_INT", self._on_position)
+        session.add_message_handler("ATTITUDE", self._on_attitude)
+        session.add_message_handler("SYS_STATUS", self._on_sys_status)
+        session.add_connect_handler(self.request_streams)
+        return self
+
+    @property
+    def snapshot(self):
+        """The current TelemetrySnapshot (immutable)."""
+        return self._snapshot
+
+    def pose(self):
+        """
+        The latest pose dict ({"lat", "lon", "alt", "yaw", "time"}) for sensor
+        payloads, or None if no fresh position is known. Do not modify it.
+        """
+        snapshot = self._snapshot
+        if snapshot.pose is None or time.time() - snapshot.position_time > self.max_age:
+            return None
+        return snapshot.pose
+
+    def request_streams(self, drone):
+        """Ask the autopilot to stream the handled messages at rate_hz."""
+        if not self.rate_hz:
+            return
+        interval_us = int(1e6 / self.rate_hz)
+        mavlink = load_mavutil().mavlink
+        for name in STREAMED_MESSAGES:
+            try:
+                drone.mav.command_long_send(drone.target_system, drone.target_component,
+                                            mavlink.MAV_CMD_SET_MESSAGE_INTERVAL, 0,
+                                            getattr(mavlink, f"MAVLINK_MSG_ID_{name}"), interval_us,
+                                            0, 0, 0, 0, 0)
+            except Exception as e:
+                logger.error(f"Failed to request {name} stream: {e}")
+        logger.info(f"Requested telemetry streams at {self.rate_hz} Hz")
+
+    # Handlers run on the DroneSession reader thread, the only writer, so a
+    # read-modify-swap of the snapshot needs no lock.
+
+    def _swap(self, snapshot):
+        if snapshot.lat is not None and snapshot.position_time is not None:
+            pose = {"lat": snapshot.lat, "lon": snapshot.lon, "alt": snapshot.alt,
+                    "yaw": snapshot.yaw if snapshot.yaw is not None else 0.0, "time": snapshot.position_time}
+            snapshot = snapshot._replace(pose=pose)
+        self._snapshot = snapshot
+        self.updates += 1
+
+    def _on_position(self, msg):
+        self._swap(self._snapshot._replace(
+            lat=msg.lat / 1e7, lon=msg.lon / 1e7, alt=msg.relative_alt / 1000.0, alt_msl=msg.alt / 1000.0,
+            vx=msg.vx / 100.0, vy=msg.vy / 100.0, vz=msg.vz / 100.0, position_time=time.time()))
+
+    def _on_attitude(self, msg):
+        snapshot = self._snapshot._replace(roll=msg.roll, pitch=msg.pitch, yaw=msg.yaw % (2 * math.pi),
+                                           attitude_time=time.time())
+        if snapshot.pose is not None:
+            # Keep the pose heading current between position updates
+            snapshot = snapshot._replace(pose=dict(snapshot.pose, yaw=snapshot.yaw))
+        self._snapshot = snapshot
+        self.updates += 1
+
+    def _on_sys_status(self, msg):
+        self._snapshot = self._snapshot._replace(
+            battery_voltage=msg.voltage_battery / 1000.0,
+            battery_current=msg.current_battery / 100.0 if msg.current_battery >= 0 else None,
+            battery_remaining=msg.battery_remaining if msg.battery_remaining >= 0 else None,
+            battery_time=time.time())
+        self.updates += 1
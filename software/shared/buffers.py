@@ -0,0 +1,83 @@
+"""
+shared/buffers.py
+Preallocated, reusable sample buffers for decoded sensor frames.
+FramePool owns one (buffers x samples) float64 block allocated up front.
+acquire() hands out a view of a free row; the row goes back to the pool when
+the view is garbage collected (i.e. when nothing references the frame any
+more: processed, dropped from a queue or replaced as the latest frame), so
+consumers never release buffers by hand. Keep the acquired array itself
+alive while using slices of it: slices do not hold the row.
+When every row is in use (or a trace is longer than a row) acquire() falls
+back to a fresh array, so a too-small pool costs allocations, not frames.
+"""
+import logging
+import threading
+import weakref
+import numpy as np
+
+logger = logging.getLogger("FramePool")
+logger.setLevel(logging.INFO)
+
+
+class FramePool:
+    """
+    Pool of float64 sample buffers.
+    buffers: rows in the pool (traces held at once, across all sensors).
+    samples: longest trace a row holds.
+    """
+
+    def __init__(self, buffers, samples):
+        self.buffers = buffers
+        self.samples = samples
+        self._storage = np.zeros((buffers, samples))
+        self._free = list(range(buffers))
+        self._lock = threading.Lock()
+        self._scratch = np.zeros(samples * 8, dtype=np.uint8)
+        self.acquired = 0
+        self.misses = 0
+
+    def acquire(self, count):
+        """Writable float64 array of `count` samples, pooled if a row is free."""
+        if count <= self.samples:
+            with self._lock:
+                row = self._free.pop() if self._free else None
+            if row is not None:
+                view = self._storage[row, :count]
+                weakref.finalize(view, self._release, row)
+                self.acquired += 1
+                return view
+        self.misses += 1
+        return np.empty(count)
+
+    def _release(self, row):
+        with self._lock:
+            self._free.append(row)
+
+    def owns(self, array):
+        """True if `array` is (a view of) a pooled buffer."""
+        return isinstance(array, np.ndarray) and array.base is self._storage
+
+    def scratch(self, nbytes):
+        """
+        Reusable byte buffer for decoding, valid until the next call; only
+        for use by the thread that decodes frames.
+        """
+        if nbytes > len(self._scratch):
+            self._scratch = np.zeros(nbytes, dtype=np.uint8)
+        return self._scratch[:nbytes]
+
+    def stats(self):
+        with self._lock:
+            return {"buffers": self.buffers, "free": len(self._free), "acquired": self.acquired,
+                    "misses": self.misses}
+
+
+if __name__ == "__main__":
+    pool = FramePool(2, 8)
+    first = pool.acquire(4)
+    first[:] = 1.0
+    second = pool.acquire(6)
+    third = pool.acquire(3)  # pool exhausted: a fresh array
+    print(pool.owns(first), pool.owns(third), pool.stats())
+    del first
+    print(pool.stats())
@@ -1,33 +1,396 @@
 """
 shared/message_protocol.py
 Defines standardized message formats for communication between RPi and Laptop.
+
+Two wire formats are supported:
+- JSON (the original format, always accepted as a fallback)
+- Binary frames: a fixed little-endian header followed by a packed numeric body.
+  A message may hold several frames back to back (e.g. one LiDAR + one GPR,
+  plus an optional "pose" frame of float64 POSE_FIELDS values).
+
+Binary frame header (FRAME_HEADER, 24 bytes):
+    magic     4s   b"TSF" + version byte
+    sensor    B    SENSOR_CODES value
+    dtype     B    DTYPE_CODES value
+    flags     H    FLAG_DELTA if the body holds successive differences of the
+                   values' bit patterns (lossless, compresses well for smooth traces);
+                   the high byte holds the decimation factor of the trace
+                   (0 = not decimated), see DECIMATION_SHIFT
+    seq       I    sequence number
+    timestamp d    capture time (seconds since epoch)
+    count     I    number of values in the body
+
+Batches (pack_batch/unpack_messages) wrap several messages of either format
+into one compressed MQTT payload:
+    magic     4s   b"TSB" + version byte
+    codec     B    CODEC_CODES value
+    reserved  B    0
+    count     H    number of messages
+    length    I    uncompressed body length
+followed by the (compressed) body: per message a u32 length and its bytes.
 """
+import sys
 import json
+import zlib
+import struct
+from array import array
+
+FORMAT_JSON = "json"
+FORMAT_BINARY = "binary"
+
+FRAME_VERSION = 1
+FRAME_MAGIC = b"TSF" + bytes([FRAME_VERSION])
+FRAME_HEADER = struct.Struct("<4sBBHIdI")
+
+SENSOR_CODES = {"lidar": 1, "gpr": 2, "pose": 3}
+SENSOR_NAMES = {code: name for name, code in SENSOR_CODES.items()}
+
+# dtype name -> (code, array typecode, numpy dtype string)
+DTYPE_CODES = {
+    "float32": (1, "f", "<f4"),
+    "int16": (2, "h", "<i2"),
+    "float64": (3, "d", "<f8"),
+}
+DTYPE_NAMES = {code: name for name, (code, _, _) in DTYPE_CODES.items()}
+
+FLAG_DELTA = 0x1
+# Decimation factor (1-255) of a reduced-resolution trace, in the flags' high byte
+DECIMATION_SHIFT = 8
+
+# Drone pose attached to sensor payloads: degrees, metres above home, radians
+# clockwise from north. Binary pose frames carry these values in this order
+# and the pose time as the frame timestamp.
+POSE_FIELDS = ("lat", "lon", "alt", "yaw")
+
+BATCH_VERSION = 1
+BATCH_MAGIC = b"TSB" + bytes([BATCH_VERSION])
+BATCH_HEADER = struct.Struct("<4sBBHI")
+BATCH_LENGTH = struct.Struct("<I")
+
+CODEC_CODES = {"none": 0, "zlib": 1, "lz4": 2}
+CODEC_NAMES = {code: name for name, code in CODEC_CODES.items()}
+
+
+def is_binary_message(message):
+    """Return True if `message` starts with a binary frame header (any version)."""
+    return isinstance(message, (bytes, bytearray, memoryview)) and bytes(message[:3]) == FRAME_MAGIC[:3]
+
 
-def create_message(sensor_type, data, timestamp=None):
+def _pack_values(values, dtype):
+    """Pack sensor values into little-endian bytes. Returns (body, count)."""
+    _, typecode, np_dtype = DTYPE_CODES[dtype]
+    if hasattr(values, "astype") and hasattr(values, "tobytes"):
+        # NumPy arrays convert without a per-element Python loop
+        packed = values.astype(np_dtype, copy=False)
+        return packed.tobytes(), packed.size
+    if isinstance(values, str):
+        convert = float if typecode in "fd" else int
+        values = map(convert, (val for val in values.split(',') if val.strip() != ""))
+    packed = array(typecode, values)
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return packed.tobytes(), len(packed)
+
+
+def _delta_bits(body, dtype, inverse=False):
+    """Difference (or, with inverse=True, re-accumulate) the values' bit patterns."""
+    import numpy as np
+    bits = np.frombuffer(body, dtype=f"<u{np.dtype(DTYPE_CODES[dtype][2]).itemsize}")
+    if inverse:
+        return np.cumsum(bits, dtype=bits.dtype)
+    delta = bits.copy()
+    delta[1:] -= bits[:-1]  # unsigned arithmetic wraps, so this is exactly reversible
+    return delta
+
+
+def encode_frame(sensor_type, values, timestamp=None, seq=0, dtype="float32", delta=False, decimation=1):
+    """
+    Encode one sensor trace as a binary frame.
+    values: comma-separated string, sequence of numbers or NumPy array.
+    delta: store successive differences of the values' bit patterns (FLAG_DELTA).
+    decimation: factor by which the sender reduced the trace's resolution.
+    Raises ValueError if the sensor, dtype, decimation or values cannot be encoded.
+    """
+    import time
+    if timestamp is None:
+        timestamp = time.time()
+    if sensor_type not in SENSOR_CODES:
+        raise ValueError(f"Unknown sensor type for binary frame: {sensor_type}")
+    if dtype not in DTYPE_CODES:
+        raise ValueError(f"Unsupported frame dtype: {dtype}")
+    if not 1 <= decimation <= 0xFF:
+        raise ValueError(f"Unsupported decimation factor: {decimation}")
+    body, count = _pack_values(values, dtype)
+    flags = decimation << DECIMATION_SHIFT if decimation > 1 else 0
+    if delta and count:
+        body = _delta_bits(body, dtype).tobytes()
+        flags |= FLAG_DELTA
+    header = FRAME_HEADER.pack(FRAME_MAGIC, SENSOR_CODES[sensor_type], DTYPE_CODES[dtype][0], flags,
+                               seq & 0xFFFFFFFF, timestamp, count)
+    return header + body
+
+
+def decode_frames(message, pool=None):
     """
-    Create a JSON message containing sensor data.
+    Decode all binary frames in `message`.
+    Returns a list of dicts with keys sensor, data, timestamp, seq, dtype, decimation.
+    `data` is a read-only NumPy view over `message` (no copy is made), except
+    for delta-encoded frames, which are decoded into a new array.
+    pool: optional shared.buffers.FramePool; sensor traces (not pose frames)
+          are then decoded straight into writable float64 pooled buffers.
+    Raises ValueError on a malformed or unsupported frame.
+    """
+    import numpy as np
+    view = memoryview(message)
+    frames = []
+    offset = 0
+    while offset < len(view):
+        if len(view) - offset < FRAME_HEADER.size:
+            raise ValueError("Truncated binary frame header")
+        magic, sensor_code, dtype_code, flags, seq, timestamp, count = FRAME_HEADER.unpack_from(view, offset)
+        if magic[:3] != FRAME_MAGIC[:3]:
+            raise ValueError("Bad binary frame magic")
+        if magic[3] != FRAME_VERSION:
+            raise ValueError(f"Unsupported binary frame version: {magic[3]}")
+        if dtype_code not in DTYPE_NAMES:
+            raise ValueError(f"Unsupported binary frame dtype code: {dtype_code}")
+        dtype = DTYPE_NAMES[dtype_code]
+        np_dtype = np.dtype(DTYPE_CODES[dtype][2])
+        offset += FRAME_HEADER.size
+        end = offset + count * np_dtype.itemsize
+        if end > len(view):
+            raise ValueError("Truncated binary frame body")
+        if pool is not None and sensor_code != SENSOR_CODES["pose"]:
+            data = _decode_into(pool, view[offset:end], np_dtype, count, flags & FLAG_DELTA)
+        elif flags & FLAG_DELTA:
+            data = _delta_bits(view[offset:end], dtype, inverse=True).view(np_dtype)
+        else:
+            data = np.frombuffer(view, dtype=np_dtype, count=count, offset=offset)
+        frames.append({
+            "sensor": SENSOR_NAMES.get(sensor_code, f"sensor{sensor_code}"),
+            "data": data,
+            "timestamp": timestamp,
+            "seq": seq,
+            "dtype": dtype,
+            "decimation": (flags >> DECIMATION_SHIFT) or 1,
+        })
+        offset = end
+    return frames
+
+
+def _decode_into(pool, body, np_dtype, count, delta):
+    """Decode a frame body into a pooled float64 buffer, without intermediate arrays."""
+    import numpy as np
+    out = pool.acquire(count)
+    if delta:
+        bits = np.frombuffer(body, dtype=f"<u{np_dtype.itemsize}")
+        scratch = pool.scratch(len(body)).view(bits.dtype)
+        np.cumsum(bits, dtype=bits.dtype, out=scratch)
+        np.copyto(out, scratch.view(np_dtype))
+    else:
+        np.copyto(out, np.frombuffer(body, dtype=np_dtype, count=count))
+    return out
+
+
+def create_message(sensor_type, data, timestamp=None, fmt=FORMAT_JSON, seq=0, dtype="float32"):
+    """
+    Create a message containing sensor data.
     sensor_type: 'lidar' or 'gpr'
     data: sensor data (string or dict)
     timestamp: optional timestamp; if not provided, use current time.
+    fmt: FORMAT_JSON or FORMAT_BINARY. Binary encoding falls back to JSON
+         if the data cannot be packed (e.g. non-numeric values).
     """
     import time
     if timestamp is None:
         timestamp = time.time()
+    if fmt == FORMAT_BINARY:
+        try:
+            return encode_frame(sensor_type, data, timestamp, seq, dtype)
+        except (ValueError, TypeError, OverflowError):
+            pass
     message = {
         "sensor": sensor_type,
         "data": data,
-        "timestamp": timestamp
+        "timestamp": timestamp,
+        "seq": seq
     }
     return json.dumps(message)
 
-def parse_message(message):
+
+def create_payload(readings, timestamp=None, fmt=FORMAT_JSON, seq=0, dtype="float32", timestamps=None,
+                   delta=False, pose=None, decimation=None):
     """
-    Parse a JSON message.
+    Create one message carrying several sensor readings,
+    e.g. {"lidar": "1.2,3.4", "gpr": "0.1,0.2"}.
+    timestamps: optional per-sensor capture times, e.g. {"lidar": t1, "gpr": t2};
+                readings without one use `timestamp`.
+    JSON payloads keep the flat {"lidar": ..., "gpr": ..., "timestamp": ...} layout
+    plus "<sensor>_timestamp" keys; binary payloads are one frame per non-empty
+    reading (delta-encoded if `delta`). Non-numeric readings make the whole
+    payload fall back to JSON.
+    pose: optional drone pose dict with POSE_FIELDS and "time"; sent as a
+          "pose" key (JSON) or a pose frame (binary).
+    decimation: optional per-sensor resolution reduction, e.g. {"gpr": 4};
+                sent as "<sensor>_decimation" keys (JSON) or in the frame flags.
+    """
+    import time
+    if timestamp is None:
+        timestamp = time.time()
+    timestamps = timestamps or {}
+    decimation = decimation or {}
+    if fmt == FORMAT_BINARY and any(len(values) for values in readings.values()):
+        try:
+            frames = [encode_frame(sensor, values, timestamps.get(sensor, timestamp), seq, dtype, delta,
+                                   decimation.get(sensor, 1))
+                      for sensor, values in readings.items() if len(values)]
+            if pose is not None:
+                frames.append(encode_frame("pose", [pose[field] for field in POSE_FIELDS],
+                                           pose.get("time", timestamp), seq, "float64"))
+            return b"".join(frames)
+        except (ValueError, TypeError, OverflowError, KeyError):
+            pass
+    # Arrays (e.g. decimated traces) travel as comma-separated strings like raw readings
+    payload = {sensor: ",".join(map(str, values.tolist())) if hasattr(values, "tolist") else values
+               for sensor, values in readings.items()}
+    payload["timestamp"] = timestamp
+    payload["seq"] = seq
+    for sensor, sensor_timestamp in timestamps.items():
+        payload[f"{sensor}_timestamp"] = sensor_timestamp
+    for sensor, factor in decimation.items():
+        if factor > 1:
+            payload[f"{sensor}_decimation"] = factor
+    if pose is not None:
+        payload["pose"] = pose
+    return json.dumps(payload)
+
+
+def _compress(body, codec):
+    if codec == "none":
+        return body
+    if codec == "zlib":
+        return zlib.compress(body, 1)
+    if codec == "lz4":
+        try:
+            import lz4.frame
+        except ImportError:
+            raise ValueError("The lz4 codec requires the lz4 package")
+        return lz4.frame.compress(body)
+    raise ValueError(f"Unknown batch codec: {codec}")
+
+
+def _decompress(body, codec):
+    if codec == "none":
+        return body
+    if codec == "zlib":
+        return zlib.decompress(body)
+    if codec == "lz4":
+        try:
+            import lz4.frame
+        except ImportError:
+            raise ValueError("The lz4 codec requires the lz4 package")
+        return lz4.frame.decompress(body)
+    raise ValueError(f"Unknown batch codec: {codec}")
+
+
+def is_batch_message(message):
+    """Return True if `message` is a batch envelope (any version)."""
+    return isinstance(message, (bytes, bytearray, memoryview)) and bytes(message[:3]) == BATCH_MAGIC[:3]
+
+
+def pack_batch(messages, codec="zlib"):
+    """
+    Pack several messages (JSON strings or binary frames) into one batch.
+    codec: "none", "zlib" or "lz4" (needs the lz4 package).
+    """
+    if codec not in CODEC_CODES:
+        raise ValueError(f"Unknown batch codec: {codec}")
+    parts = []
+    for message in messages:
+        if isinstance(message, str):
+            message = message.encode()
+        parts.append(BATCH_LENGTH.pack(len(message)))
+        parts.append(message)
+    body = b"".join(parts)
+    header = BATCH_HEADER.pack(BATCH_MAGIC, CODEC_CODES[codec], 0, len(messages), len(body))
+    return header + _compress(body, codec)
+
+
+def unpack_messages(payload):
+    """
+    Split an MQTT payload into its messages: the contents of a batch, or
+    [payload] for a plain JSON/binary message. Raises ValueError on a
+    malformed batch.
+    """
+    if not is_batch_message(payload):
+        return [payload]
+    if len(payload) < BATCH_HEADER.size:
+        raise ValueError("Truncated batch header")
+    magic, codec_code, _reserved, count, length = BATCH_HEADER.unpack_from(payload)
+    if magic[3] != BATCH_VERSION:
+        raise ValueError(f"Unsupported batch version: {magic[3]}")
+    if codec_code not in CODEC_NAMES:
+        raise ValueError(f"Unsupported batch codec code: {codec_code}")
+    body = memoryview(_decompress(bytes(payload[BATCH_HEADER.size:]), CODEC_NAMES[codec_code]))
+    if len(body) != length:
+        raise ValueError("Batch body length mismatch")
+    messages, offset = [], 0
+    for _ in range(count):
+        (size,) = BATCH_LENGTH.unpack_from(body, offset)
+        offset += BATCH_LENGTH.size
+        if offset + size > len(body):
+            raise ValueError("Truncated batch message")
+        messages.append(body[offset:offset + size])
+        offset += size
+    return messages
+
+
+def parse_message(message, pool=None):
+    """
+    Parse a JSON or binary message.
+    Both encodings parse to the payload layout
+    {<sensor>: values, "<sensor>_timestamp": t, ..., "timestamp": t, "seq": n,
+     "format": "binary"/"json"} where "timestamp" is the earliest sensor frame
+    timestamp; a pose frame becomes a "pose" dict (POSE_FIELDS plus "time")
+    and decimated traces add "<sensor>_decimation". Binary values are
+    ndarrays, JSON values as sent (usually comma-separated strings); JSON
+    single-sensor messages ({"sensor", "data", ...}, see create_message) are
+    flattened into the same layout.
+    pool: optional FramePool binary traces are decoded into (see decode_frames).
     Returns a dictionary or raises ValueError if parsing fails.
     """
+    if is_binary_message(message):
+        frames = decode_frames(message, pool)
+        if not frames:
+            raise ValueError("Error parsing message: empty binary message")
+        parsed = {}
+        sensor_timestamps = []
+        for frame in frames:
+            if frame["sensor"] == "pose":
+                parsed["pose"] = dict(zip(POSE_FIELDS, frame["data"].tolist()), time=frame["timestamp"])
+                continue
+            parsed[frame["sensor"]] = frame["data"]
+            parsed[f"{frame['sensor']}_timestamp"] = frame["timestamp"]
+            if frame["decimation"] > 1:
+                parsed[f"{frame['sensor']}_decimation"] = frame["decimation"]
+            sensor_timestamps.append(frame["timestamp"])
+        parsed["timestamp"] = min(sensor_timestamps or [frame["timestamp"] for frame in frames])
+        parsed["seq"] = frames[0]["seq"]
+        parsed["format"] = FORMAT_BINARY
+        return parsed
     try:
+        if isinstance(message, (bytes, bytearray, memoryview)):
+            message = bytes(message).decode()
         parsed = json.loads(message)
-        return parsed
     except Exception as e:
         raise ValueError(f"Error parsing message: {e}")
+    if not isinstance(parsed, dict):
+        raise ValueError("Error parsing message: not a JSON object")
+    if "sensor" in parsed and "data" in parsed:
+        sensor = parsed.pop("sensor")
+        parsed[sensor] = parsed.pop("data")
+        if "timestamp" in parsed:
+            parsed[f"{sensor}_timestamp"] = parsed["timestamp"]
+    parsed.setdefault("seq", 0)
+    parsed["format"] = FORMAT_JSON
+    return parsed
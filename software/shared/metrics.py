@@ -0,0 +1,287 @@
+"""
+shared/metrics.py
+Lightweight in-process metrics: counters, histograms and stage timers.
+Metrics are registered once at import time and updated on the hot path. When
+metrics are disabled every update returns after a single flag check, and
+timers hand out a shared no-op context manager.
+Values can be exposed as Prometheus text over HTTP (start_http_server) or
+logged periodically (start_summary_logger).
+"""
+import time
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("Metrics")
+logger.setLevel(logging.INFO)
+
+# Upper bounds (seconds) of the default latency buckets
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_state = {"enabled": True}
+
+
+def enable(enabled=True):
+    """Turn metric collection on or off globally."""
+    _state["enabled"] = enabled
+
+
+def enabled():
+    return _state["enabled"]
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Counter:
+    """Monotonically increasing count."""
+
+    def __init__(self, labels=()):
+        self.labels = labels
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        if not _state["enabled"]:
+            return
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name):
+        yield f"{name}{_format_labels(self.labels)} {self.value}"
+
+
+class _NoopTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_TIMER = _NoopTimer()
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Histogram:
+    """Bucketed distribution of observed values (Prometheus cumulative buckets)."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, labels=()):
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot: above the largest bound
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        if not _state["enabled"]:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def time(self):
+        """Context manager observing the elapsed wall time of its block."""
+        return _Timer(self) if _state["enabled"] else _NOOP_TIMER
+
+    def quantile(self, q):
+        """Estimate a quantile by linear interpolation inside its bucket."""
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if not total:
+            return None
+        rank = q * total
+        cumulative = 0
+        for i, count in enumerate(counts):
+            if cumulative + count >= rank and count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def samples(self, name):
+        with self._lock:
+            counts, total, value_sum = list(self.counts), self.count, self.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            yield f"{name}_bucket{_format_labels(self.labels + (('le', bound),))} {cumulative}"
+        yield f"{name}_bucket{_format_labels(self.labels + (('le', '+Inf'),))} {total}"
+        yield f"{name}_sum{_format_labels(self.labels)} {value_sum}"
+        yield f"{name}_count{_format_labels(self.labels)} {total}"
+
+
+class Registry:
+    """Named metric families; the same name and labels always return the same metric."""
+
+    def __init__(self):
+        self._families = {}  # name -> [kind, help, {labels: metric}]
+        self._lock = threading.Lock()
+
+    def _get(self, kind, name, help_text, labels, factory):
+        key = tuple(sorted(labels.items())) if labels else ()
+        with self._lock:
+            family = self._families.setdefault(name, [kind, help_text, {}])
+            if family[0] != kind:
+                raise ValueError(f"Metric {name} already registered as a {family[0]}")
+            metric = family[2].get(key)
+            if metric is None:
+                metric = family[2][key] = factory(key)
+            return metric
+
+    def counter(self, name, help_text="", labels=None):
+        return self._get("counter", name, help_text, labels, lambda key: Counter(labels=key))
+
+    def histogram(self, name, help_text="", labels=None, buckets=DEFAULT_BUCKETS):
+        return self._get("histogram", name, help_text, labels, lambda key: Histogram(buckets, labels=key))
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            families = [(name, kind, help_text, list(metrics.values()))
+                        for name, (kind, help_text, metrics) in sorted(self._families.items())]
+        for name, kind, help_text, metrics in families:
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for metric in metrics:
+                lines.extend(metric.samples(name))
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Compact dict of counter values and histogram count/p50/p99."""
+        summary = {}
+        with self._lock:
+            families = [(name, list(metrics.values())) for name, (_, _, metrics) in self._families.items()]
+        for name, metrics in families:
+            for metric in metrics:
+                key = name + _format_labels(metric.labels)
+                if isinstance(metric, Counter):
+                    summary[key] = metric.value
+                elif metric.count:
+                    summary[key] = {"count": metric.count, "p50": metric.quantile(0.5),
+                                    "p99": metric.quantile(0.99)}
+        return summary
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help_text="", labels=None):
+    return REGISTRY.counter(name, help_text, labels)
+
+
+def histogram(name, help_text="", labels=None, buckets=DEFAULT_BUCKETS):
+    return REGISTRY.histogram(name, help_text, labels, buckets)
+
+
+def stage_timer(stage):
+    """Histogram of per-stage processing time, labelled with the stage name."""
+    return REGISTRY.histogram("stage_seconds", "Time spent per processing stage", labels={"stage": stage})
+
+
+class Sampler:
+    """
+    Lets every `every`-th event through (0 = none), e.g. to log one payload in
+    a hundred instead of formatting every frame:
+        if payload_log.sample():
+            logger.info(f"Received data: {payload}")
+    """
+
+    def __init__(self, every):
+        self.every = every
+        self._count = 0
+
+    def sample(self):
+        if not self.every:
+            return False
+        self._count += 1
+        return self._count % self.every == 1 or self.every == 1
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, host="127.0.0.1", registry=REGISTRY):
+    """Serve /metrics in Prometheus text format from a daemon thread. Returns the server."""
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    try:
+        server = ThreadingHTTPServer((host, port), handler)
+    except OSError as e:
+        logger.error(f"Failed to start metrics endpoint on {host}:{port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"Metrics available at http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+def start_summary_logger(interval, registry=REGISTRY):
+    """Log registry.summary() every `interval` seconds from a daemon thread."""
+    def run():
+        while True:
+            time.sleep(interval)
+            logger.info(f"Metrics: {registry.summary()}")
+    thread = threading.Thread(target=run, name="metrics-summary", daemon=True)
+    thread.start()
+    return thread
+
+
+def configure(enabled, port=0, summary_interval=0):
+    """Apply the METRICS_* settings of an entry point."""
+    enable(enabled)
+    if not enabled:
+        return
+    if port:
+        start_http_server(port)
+    if summary_interval:
+        start_summary_logger(summary_interval)
+
+
+if __name__ == "__main__":
+    frames = counter("frames_total", "Frames processed")
+    parse = stage_timer("parse")
+    for _ in range(1000):
+        with parse.time():
+            sum(range(1000))
+        frames.inc()
+    print(REGISTRY.render())
+    print(REGISTRY.summary())
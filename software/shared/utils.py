@@ -2,22 +2,154 @@
 shared/utils.py
 Shared utilities for data transformation and logging.
 """
+import re
+import heapq
 import logging
 import numpy as np
 
 logger = logging.getLogger("SharedUtils")
 logger.setLevel(logging.INFO)
 
-def normalize_data(data):
+# A separator followed by a token that is empty or not a number np.fromstring
+# understands. Traces are prefixed with "," so every token has a separator.
+_NUMBER = r"[-+]?(?:(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?|nan|inf(?:inity)?)"
+_BAD_TOKEN = re.compile(r",(?!\s*" + _NUMBER + r"\s*(?:,|$))([^,]*)", re.IGNORECASE)
+
+# Up to this many regions, threshold_regions finds peaks region by region
+REGION_LOOP_LIMIT = 32
+
+def parse_sensor_values(raw, dtype=np.float64):
+    """
+    Parse a comma-separated sensor trace into a NumPy array in a single bulk
+    conversion (no per-value Python loop).
+    Arrays (e.g. decoded from binary frames) are returned as-is; bytes are decoded.
+    Empty tokens are skipped. Malformed tokens are dropped and reported.
+    Returns (values, malformed) where malformed is a list of (token_index, token).
+    """
+    if isinstance(raw, np.ndarray):
+        return raw, []
+    if isinstance(raw, (bytes, bytearray, memoryview)):
+        raw = bytes(raw).decode()
+    if not raw or raw.isspace():
+        return np.array([], dtype=dtype), []
+
+    # Fast path: one C-level parse. A malformed token either raises or (on older
+    # NumPy) stops the parse early, which shows up as a short result.
+    separators = raw.count(',')
+    try:
+        values = np.fromstring(raw, dtype=dtype, sep=',')
+        if len(values) == separators + 1 or (len(values) == separators and raw.rstrip().endswith(',')):
+            return values, []
+    except ValueError:
+        pass
+
+    # Slow path: a single regex pass; Python only runs per bad or empty token
+    text = "," + raw
+    pieces, malformed = [], []
+    pos = seen = 0  # scan position in text and separators counted before it
+    for match in _BAD_TOKEN.finditer(text):
+        index = seen + text.count(',', pos, match.start())
+        token = match.group(1).strip()
+        if token:
+            malformed.append((index, token))
+        pieces.append(text[pos:match.start()])
+        pos, seen = match.end(), index + 1
+    pieces.append(text[pos:])
+    cleaned = "".join(pieces).lstrip(',')
+    if not cleaned:
+        return np.array([], dtype=dtype), malformed
+    return np.fromstring(cleaned, dtype=dtype, sep=','), malformed
+
+def parse_sensor_matrix(traces, dtype=np.float64):
+    """
+    Parse a batch of traces into a 2-D array (traces x samples).
+    traces: 2-D array (returned as-is) or a sequence of comma-separated strings
+            or 1-D arrays. Ragged traces are truncated to the shortest one.
+    Returns (matrix, malformed) where malformed is a list of
+    (trace_index, token_index, token).
+    """
+    if isinstance(traces, np.ndarray) and traces.ndim == 2:
+        return traces, []
+    rows, malformed = [], []
+    for trace_index, trace in enumerate(traces):
+        values, bad = parse_sensor_values(trace, dtype)
+        rows.append(values)
+        malformed.extend((trace_index, token_index, token) for token_index, token in bad)
+    if not rows:
+        return np.empty((0, 0), dtype=dtype), malformed
+    n_samples = min(len(row) for row in rows)
+    if any(len(row) != n_samples for row in rows):
+        logger.warning(f"Ragged traces truncated to {n_samples} samples")
+    matrix = np.empty((len(rows), n_samples), dtype=dtype)
+    for i, row in enumerate(rows):
+        matrix[i] = row[:n_samples]
+    return matrix, malformed
+
+def threshold_regions(data, threshold, max_regions=None):
+    """
+    Merge contiguous samples above `threshold` into regions.
+    Returns a list of (start, end, peak) index tuples (end inclusive, peak is
+    the index of the largest value in the region) in positional order.
+    max_regions: keep only the regions with the highest peaks.
+    Temporary arrays scale with the number of regions, not with the number of
+    samples above the threshold.
+    """
+    data = np.asarray(data)
+    mask = data > threshold
+    if data.size == 0 or not mask.any():
+        return []
+    # Regions start and stop where the mask changes
+    edges = np.flatnonzero(mask[1:] != mask[:-1])
+    edges += 1
+    if mask[0] or mask[-1]:
+        edges = np.concatenate(([0] if mask[0] else [], edges, [data.size] if mask[-1] else [])).astype(np.intp)
+    starts, stops = edges[::2], edges[1::2]
+    if max_regions is not None and starts.size > max_regions:
+        peaks = np.maximum.reduceat(data, edges[:-1] if edges[-1] == data.size else edges)[::2].tolist()
+        # NumPy's sorts take kilobytes of scratch even for a few dozen peaks; heapq keeps ties in order too
+        keep = sorted(heapq.nlargest(max_regions, range(len(peaks)), key=peaks.__getitem__))
+        starts, stops = starts[keep], stops[keep]
+    if starts.size <= REGION_LOOP_LIMIT:
+        # argmax over views of a few regions allocates nothing per sample
+        peak_pos = [start + int(np.argmax(data[start:stop])) for start, stop in zip(starts.tolist(), stops.tolist())]
+    else:
+        lengths = stops - starts
+        offsets = np.cumsum(lengths) - lengths
+        indices = np.arange(lengths.sum()) + np.repeat(starts - offsets, lengths)
+        # Sort by region then by descending value: each region's first entry is its peak
+        labels = np.repeat(np.arange(starts.size), lengths)
+        peak_pos = indices[np.lexsort((-data[indices], labels))[offsets]].tolist()
+    return list(zip(starts.tolist(), (stops - 1).tolist(), peak_pos))
+
+def normalize_data(data, axis=None, out=None):
     """
     Normalize a NumPy array to the range [0, 1].
+    axis: normalize each slice along this axis independently
+          (e.g. axis=1 normalizes every trace of a B-scan).
+    out: optional float array of the same shape (may be `data`) to write into.
     """
     try:
+        if axis is not None:
+            data_min = np.min(data, axis=axis, keepdims=True)
+            data_range = np.max(data, axis=axis, keepdims=True) - data_min
+            flat = data_range == 0
+            if np.any(flat):
+                logger.warning(f"{int(np.count_nonzero(flat))} slices have zero variation; returning zeros for them")
+                data_range = np.where(flat, 1, data_range)
+            if out is not None:
+                return np.divide(np.subtract(data, data_min, out=out), data_range, out=out)
+            normalized = (data - data_min) / data_range
+            return normalized
         data_min = np.min(data)
         data_max = np.max(data)
         if data_max - data_min == 0:
             logger.warning("Data has zero variation; returning zeros")
+            if out is not None:
+                out.fill(0)
+                return out
             return np.zeros_like(data)
+        if out is not None:
+            return np.divide(np.subtract(data, data_min, out=out), data_max - data_min, out=out)
         normalized = (data - data_min) / (data_max - data_min)
         return normalized
     except Exception as e:
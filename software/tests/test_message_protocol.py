@@ -0,0 +1,31 @@
+"""
+tests/test_message_protocol.py
+Binary frame encoding of sensor traces.
+Run from the software/ directory:
+    python -m pytest tests
+"""
+import numpy as np
+from shared.message_protocol import create_message, create_payload, is_binary_message, parse_message
+
+
+def test_float64_string_trace_packs_as_binary():
+    message = create_message("gpr", "0.5,-1.25,3e-3", timestamp=10.0, fmt="binary", dtype="float64")
+    assert is_binary_message(message)
+    np.testing.assert_array_equal(parse_message(message)["gpr"], [0.5, -1.25, 3e-3])
+
+
+def test_float64_payload_round_trip():
+    payload = create_payload({"lidar": "1.5,2.5", "gpr": "0.1,0.2,0.3"}, timestamp=5.0, fmt="binary",
+                             dtype="float64", delta=True)
+    assert is_binary_message(payload)
+    parsed = parse_message(payload)
+    np.testing.assert_array_equal(parsed["lidar"], [1.5, 2.5])
+    np.testing.assert_array_equal(parsed["gpr"], [0.1, 0.2, 0.3])
+
+
+def test_json_and_binary_messages_parse_to_the_same_layout():
+    binary = parse_message(create_message("lidar", "1.0,2.0", timestamp=3.0, fmt="binary", seq=4))
+    fallback = parse_message(create_message("lidar", "1.0,2.0", timestamp=3.0, fmt="json", seq=4))
+    assert set(binary) == set(fallback) == {"lidar", "lidar_timestamp", "timestamp", "seq", "format"}
+    assert (fallback["lidar"], fallback["timestamp"], fallback["seq"]) == ("1.0,2.0", 3.0, 4)
+    np.testing.assert_array_equal(binary["lidar"], [1.0, 2.0])
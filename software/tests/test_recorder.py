@@ -0,0 +1,53 @@
+"""
+tests/test_recorder.py
+Round trip of received frames through SurveyRecorder and SurveyReader.
+Run from the software/ directory:
+    python -m pytest tests
+"""
+import numpy as np
+from laptop.recorder import SurveyRecorder, SurveyReader
+
+
+def record(directory, payloads, segment_frames=4):
+    recorder = SurveyRecorder(str(directory), segment_frames=segment_frames)
+    for payload in payloads:
+        recorder.record(payload)
+    recorder.close()
+    return list(SurveyReader(str(directory)).frames())
+
+
+def test_round_trip_restores_decimation(tmp_path):
+    payloads = [{"lidar": np.arange(4.0) + i, "gpr": np.arange(8.0 / (2 if i % 2 else 1)) - i,
+                 "timestamp": 100.0 + i, "seq": i} for i in range(6)]
+    for payload in payloads[1::2]:
+        payload["gpr_decimation"] = 2
+    frames = record(tmp_path, payloads)
+    assert [frame["seq"] for frame in frames] == list(range(6))
+    for frame, payload in zip(frames, payloads):
+        np.testing.assert_array_equal(frame["gpr"], payload["gpr"])
+        np.testing.assert_array_equal(frame["lidar"], payload["lidar"])
+        assert frame.get("gpr_decimation", 1) == payload.get("gpr_decimation", 1)
+        assert "lidar_decimation" not in frame
+
+
+def test_late_frames_are_read_in_timestamp_order(tmp_path):
+    # Frames replayed from the drone's spool arrive after newer ones
+    timestamps = [10, 11, 12, 13, 1, 14, 2, 15]
+    payloads = [{"lidar": np.full(3, float(i)), "gpr": np.full(5, float(i)), "timestamp": float(t), "seq": i}
+                for i, t in enumerate(timestamps)]
+    frames = record(tmp_path, payloads, segment_frames=3)
+    assert [frame["timestamp"] for frame in frames] == sorted(float(t) for t in timestamps)
+    for frame in frames:
+        assert frame["gpr"][0] == frame["lidar"][0] == frame["seq"]
+
+
+def test_round_trip_restores_drone_id(tmp_path):
+    # Two drones can send frames with the same timestamp and sequence number
+    payloads = [{"lidar": np.full(3, float(i)), "gpr": np.full(5, float(i)), "timestamp": 100.0 + i // 2,
+                 "seq": i // 2, "drone_id": drone} for i, drone in enumerate(["alpha", "bravo"] * 3)]
+    payloads.append({"lidar": np.full(3, 6.0), "gpr": np.full(5, 6.0), "timestamp": 103.0, "seq": 3})
+    frames = record(tmp_path, payloads)
+    assert [frame.get("drone_id") for frame in frames] == ["alpha", "bravo"] * 3 + [None]
+    for frame, payload in zip(frames, payloads):
+        np.testing.assert_array_equal(frame["gpr"], payload["gpr"])
+        np.testing.assert_array_equal(frame["lidar"], payload["lidar"])
@@ -0,0 +1,28 @@
+"""
+tests/test_spool.py
+SpoolBuffer eviction and recovery from corrupt record headers.
+Run from the software/ directory:
+    python -m pytest tests
+"""
+from rpi.spool import SpoolBuffer, RECORD_HEADER
+
+
+def test_full_spool_evicts_oldest_records(tmp_path):
+    spool = SpoolBuffer(str(tmp_path / "spool.bin"), capacity=4 * (RECORD_HEADER.size + 10))
+    for i in range(6):
+        spool.append(b"payload-%02d" % i)
+    assert (len(spool), spool.evicted) == (4, 2)
+    assert spool.peek() == (2, b"payload-02")
+    spool.close()
+
+
+def test_corrupt_oldest_header_is_dropped_on_eviction(tmp_path):
+    spool = SpoolBuffer(str(tmp_path / "spool.bin"), capacity=4 * (RECORD_HEADER.size + 10))
+    for i in range(4):
+        spool.append(b"payload-%02d" % i)
+    # A garbage length in the oldest header must not move the tail past the head
+    spool._write(spool.tail, b"\xff" * RECORD_HEADER.size)
+    seq = spool.append(b"payload-04")
+    assert spool.tail <= spool.head
+    assert (len(spool), spool.peek()) == (1, (seq, b"payload-04"))
+    spool.close()